@@ -0,0 +1,91 @@
+"""Проверка и бенчмарк форматировщика сообщений.
+
+Сначала сверяет вывод MessageFormatter с эталонным корпусом
+(formatter_corpus.json), затем сравнивает скорость с исходной
+реализацией из legacy_formatter.py.
+
+Запуск из корня проекта:
+    python benchmarks/bench_formatter.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from message_processing.formatter import MessageFormatter
+from legacy_formatter import LegacyMessageFormatter
+
+CORPUS_PATH = os.path.join(BENCH_DIR, "formatter_corpus.json")
+
+def load_corpus():
+    """Загрузить эталонный корпус"""
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def check_corpus(formatter: MessageFormatter) -> int:
+    """Сверить вывод с эталоном, вернуть количество расхождений"""
+    failures = 0
+    for case in load_corpus():
+        actual = formatter.format_message(case["input"])
+        if actual != case["expected"]:
+            failures += 1
+            print(f"❌ {case['name']}: вывод отличается от эталона")
+    return failures
+
+def build_workloads() -> dict:
+    """Типичные сообщения: короткое, markdown и длинный лог"""
+    log_lines = []
+    for i in range(300):
+        log_lines.append(f"$ make target-{i}")
+        log_lines.append(f"compiling module_{i}.py ... ok in {i % 97}ms")
+        if i % 25 == 0:
+            log_lines.append("```")
+            log_lines.extend(f"    at frame_{j} (file_{j}.py:{j})" for j in range(20))
+            log_lines.append("```")
+
+    markdown = "\n".join(
+        ["# Report", "## Summary", ""]
+        + [f"- item **{i}** with `code` and [link](http://example.com/{i})" for i in range(50)]
+        + ["", "Formula: \\frac{a}{b} + x^{2}", "1. first", "2. second"]
+    )
+
+    return {
+        "short": "Сервер перезапущен, все сервисы работают",
+        "markdown": markdown,
+        "log": "\n".join(log_lines),
+    }
+
+def bench(func, text: str, repeat: int) -> float:
+    """Лучшее время одного вызова в микросекундах"""
+    timer = timeit.Timer(lambda: func(text))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    formatter = MessageFormatter()
+    legacy = LegacyMessageFormatter()
+
+    failures = check_corpus(formatter)
+    if failures:
+        print(f"❌ Расхождений с эталоном: {failures}")
+        sys.exit(1)
+    print("✅ Вывод совпадает с эталонным корпусом")
+
+    print(f"{'нагрузка':<10} {'размер':>8} {'legacy, мкс':>12} {'current, мкс':>13} {'ускорение':>10}")
+    for name, text in build_workloads().items():
+        assert legacy.format_message(text) == formatter.format_message(text)
+        old = bench(legacy.format_message, text, args.repeat)
+        new = bench(formatter.format_message, text, args.repeat)
+        print(f"{name:<10} {len(text):>8} {old:>12.1f} {new:>13.1f} {old / new:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Микробенчмарки форматировщика и методов DatabaseManager.
+
+Каждый замер - лучшее время одного вызова из нескольких повторов, так
+что результаты разных прогонов сравнимы. База - временный файл SQLite,
+заполненный --rows сообщениями. Результат пишется в JSON, --compare
+печатает изменение относительно сохраненного прошлого прогона.
+
+Запуск из корня проекта:
+    python benchmarks/bench_micro.py --json before.json
+    python benchmarks/bench_micro.py --compare before.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from harness import prepare_environment, run_metadata, write_json
+
+WORDS = ["сервер", "очередь", "доставка", "ошибка", "deploy", "build", "error", "queue",
+         "**готово**", "`code`", "test", "worker"]
+
+def bench(func, repeat: int) -> float:
+    """Лучшее время одного вызова в микросекундах"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def formatter_benchmarks() -> dict:
+    from message_processing.formatter import MessageFormatter
+    from bench_formatter import build_workloads
+
+    formatter = MessageFormatter()
+    return {
+        f"format_message[{name}]": (lambda text=text: formatter.format_message(text))
+        for name, text in build_workloads().items()
+    }
+
+def database_benchmarks(workdir: str, rows: int) -> dict:
+    from database.crud import DatabaseManager
+    from database.models import MessageCreate
+
+    db = DatabaseManager(os.path.join(workdir, "micro.db"))
+    random.seed(0)
+    ids = itertools.count(1)
+
+    def make(count: int) -> list:
+        return [
+            MessageCreate(
+                message=" ".join(random.choices(WORDS, k=11) + [f"tag{random.randrange(1000)}"]),
+                formatted_message="<div class=\"message-line\">x</div>",
+                message_id=next(ids),
+                channel=random.choice(("default", "alerts", "builds"))
+            )
+            for _ in range(count)
+        ]
+
+    for _ in range(0, rows, 1000):
+        db.create_messages(make(1000))
+    last_id = db.get_last_message_id()
+    middle = last_id // 2
+
+    from message_processing.message_service import message_service
+    from message_processing.payload_encoder import payload_encoder
+    from websocket_manager.payload_profile import PAYLOAD_FIELDS
+
+    encoder, id_encoder = payload_encoder(PAYLOAD_FIELDS), payload_encoder(("id",))
+
+    def page_objects(limit: int) -> bytes:
+        messages = db.get_messages_page(before_id=middle, limit=limit)
+        return json.dumps({"messages": [message_service.to_payload(msg) for msg in messages]},
+                          ensure_ascii=False, separators=(",", ":")).encode()
+
+    def page_rows(limit: int, page_encoder) -> bytes:
+        rows = db.get_payload_rows(page_encoder.fields, 1, before_id=middle, limit=limit)
+        return page_encoder.encode_page(page_encoder.encode_rows(rows), {})
+
+    # Чтение замеряется до записи, чтобы размер базы был одинаковым
+    return {
+        "history_json[500,objects]": lambda: page_objects(500),
+        "history_json[500,rows]": lambda: page_rows(500, encoder),
+        "history_json[500,rows,id]": lambda: page_rows(500, id_encoder),
+        "get_message_by_id": lambda: db.get_message_by_id(middle),
+        "get_messages_since[100]": lambda: db.get_messages_since(db.get_last_message_id() - 100),
+        "get_messages_page[100]": lambda: db.get_messages_page(before_id=middle, limit=100),
+        "get_messages_page[100,channel]": lambda: db.get_messages_page(before_id=middle, limit=100, channel="alerts"),
+        "get_recent_messages[100]": lambda: db.get_recent_messages(100),
+        "search_messages[20]": lambda: db.search_messages('"tag42"', 20),
+        "search_messages[20,common]": lambda: db.search_messages('"очередь" "error"', 20),
+        "create_message": lambda: db.create_message(make(1)[0]),
+        "create_messages[100]": lambda: db.create_messages(make(100)),
+    }
+
+def print_comparison(results: dict, baseline: dict):
+    print(f"{'замер':<34} {'было, мкс':>12} {'стало, мкс':>12} {'изменение':>10}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<34} {'-':>12} {current:>12.1f}")
+            continue
+        change = (current - previous) / previous * 100
+        print(f"{name:<34} {previous:>12.1f} {current:>12.1f} {change:>+9.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20000, help="сообщений в тестовой базе")
+    parser.add_argument("--only", help="подстрока имени замера")
+    parser.add_argument("--json", help="файл для результата в JSON ('-' - stdout)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="board-micro-")
+    prepare_environment(workdir)
+
+    results = {}
+    try:
+        benchmarks = {**formatter_benchmarks(), **database_benchmarks(workdir, args.rows)}
+        for name, func in benchmarks.items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = round(bench(func, args.repeat), 2)
+            print(f"{name:<34} {results[name]:>12.1f} мкс")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            print_comparison(results, json.load(source)["results_us"])
+
+    write_json(args.json, {
+        "meta": {**run_metadata(), "rows": args.rows, "repeat": args.repeat},
+        "results_us": results
+    })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Общие части нагрузочного стенда и микробенчмарков.
+
+Окружение приложения (временная база, архив, брокер в памяти) задается
+через переменные окружения до первого импорта config, поэтому
+prepare_environment вызывается раньше импорта модулей приложения.
+"""
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+
+def prepare_environment(workdir: str, **overrides: str):
+    """Направить приложение во временный каталог и на брокер в памяти"""
+    os.environ.update({
+        "DATABASE_URL": os.path.join(workdir, "messages.db"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "RABBITMQ_BROKER": "memory",
+        **overrides
+    })
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+
+def raise_open_files_limit():
+    """Поднять мягкий предел открытых файлов до жесткого (тысячи сокетов)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def run_metadata() -> dict:
+    """Сведения о запуске, чтобы сравнивать результаты между прогонами"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+def process_usage() -> dict:
+    """Процессорное время и память текущего процесса"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss_kb = peak_kb = usage.ru_maxrss
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    peak_kb = int(line.split()[1])
+    except OSError:
+        pass
+    return {
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "rss_mb": round(rss_kb / 1024, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1)
+    }
+
+def write_json(path: Optional[str], result: dict):
+    """Записать результат в файл (или в stdout для '-')"""
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if path == "-":
+        print(text)
+    elif path:
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+        print(f"💾 Результат записан: {path}")
+
+class LatencyHistogram:
+    """Логарифмическая гистограмма задержек с погрешностью ~2%.
+
+    Хранит только счетчики корзин, поэтому миллионы измерений в тысячах
+    клиентов не занимают память, а гистограммы разных процессов
+    складываются.
+    """
+
+    GROWTH = 1.02
+    # Нижняя граница, секунды: все, что быстрее 10 мкс, - первая корзина
+    FLOOR = 1e-5
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = 0 if seconds <= self.FLOOR else int(math.log(seconds / self.FLOOR, self.GROWTH)) + 1
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, data: dict):
+        """Добавить гистограмму, сериализованную to_dict"""
+        for index, count in data["counts"].items():
+            self.counts[int(index)] = self.counts.get(int(index), 0) + count
+        self.count += data["count"]
+        self.total += data["total"]
+        self.max = max(self.max, data["max"])
+
+    def to_dict(self) -> dict:
+        return {"counts": self.counts, "count": self.count, "total": self.total, "max": self.max}
+
+    def percentile(self, fraction: float) -> float:
+        """Верхняя граница корзины, в которую попал перцентиль"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * fraction)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.max, self.FLOOR * self.GROWTH ** index)
+        return self.max
+
+    def summary(self) -> dict:
+        """Сводка в миллисекундах"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p90_ms": round(self.percentile(0.90) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+class HttpConnection:
+    """Минимальный HTTP/1.1 клиент с keep-alive для long polling.
+
+    Тысячи опрашивающих клиентов не должны упираться в накладные
+    расходы HTTP библиотеки внутри клиентского процесса.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def get(self, path: str) -> Tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode())
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Соединение закрыто сервером")
+        status = int(status_line.split()[1])
+        length, chunked = 0, False
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value.lower():
+                chunked = True
+
+        if not chunked:
+            return status, await self._reader.readexactly(length)
+
+        body: List[bytes] = []
+        while True:
+            size = int((await self._reader.readline()).strip(), 16)
+            chunk = await self._reader.readexactly(size + 2)
+            if size == 0:
+                return status, b"".join(body)
+            body.append(chunk[:-2])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
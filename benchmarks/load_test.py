@@ -0,0 +1,304 @@
+"""Нагрузочный стенд: сервер целиком, брокер в памяти, временная база.
+
+Процесс стенда поднимает приложение (main.app) в uvicorn на свободном
+порту с RABBITMQ_BROKER=memory и базой во временном каталоге и
+публикует сообщения во входящую очередь с заданной частотой. Клиенты -
+WebSocket соединения и long polling - работают в отдельных процессах,
+чтобы их разбор кадров не делил процессор с сервером. Каждое сообщение
+несет время публикации, клиенты считают задержку от публикации до
+получения.
+
+Отчет: пропускная способность приема и доставки, p50/p99 задержки для
+WebSocket и polling, процессорное время и память процесса сервера.
+
+Запуск из корня проекта:
+    python benchmarks/load_test.py --rate 500 --duration 20 --ws-clients 2000 --pollers 200
+    python benchmarks/load_test.py --kind markdown --size 4096 --json result.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from harness import (
+    HttpConnection, LatencyHistogram, prepare_environment, process_usage,
+    raise_open_files_limit, run_metadata, write_json
+)
+
+# Шаблоны тела сообщения: plain - текст, markdown - разметка для форматировщика
+MARKDOWN_LINE = "- item **bold** with `code` and [link](http://example.com) \\frac{a}{b}\n"
+
+def make_body(seq: int, size: int, kind: str) -> str:
+    """Тело сообщения: <номер>:<время публикации>|<заполнение до size>"""
+    head = f"{seq}:{time.time():.6f}|"
+    filler = MARKDOWN_LINE if kind == "markdown" else "lorem ipsum dolor sit amet "
+    missing = max(0, size - len(head))
+    return head + (filler * (missing // len(filler) + 1))[:missing]
+
+def published_at(raw: str) -> float:
+    return float(raw.split("|", 1)[0].split(":", 1)[1])
+
+def frame_messages(data: dict) -> list:
+    """Сообщения из кадра WebSocket: одиночного или batch/replay"""
+    if "id" in data:
+        return [data]
+    return data.get("messages") or []
+
+# ---- Клиентский процесс ----
+
+async def websocket_client(url: str, histogram: LatencyHistogram, stats: dict, connected: list):
+    import websockets
+
+    async with websockets.connect(url, max_size=None, open_timeout=120, ping_interval=None) as ws:
+        connected.append(1)
+        async for frame in ws:
+            received = time.time()
+            for message in frame_messages(json.loads(frame)):
+                if "raw" in message:
+                    histogram.observe(received - published_at(message["raw"]))
+                    stats["ws_messages"] += 1
+
+async def poll_client(host: str, port: int, histogram: LatencyHistogram, stats: dict, connected: list):
+    connection = HttpConnection(host, port)
+    try:
+        _, body = await connection.get("/api/last")
+        last_id = json.loads(body).get("id", 0)
+        connected.append(1)
+        while True:
+            status, body = await connection.get(f"/api/poll?last_id={last_id}&fields=raw")
+            received = time.time()
+            stats["poll_requests"] += 1
+            if status != 200:
+                stats["poll_errors"] += 1
+                await asyncio.sleep(1)
+                continue
+            data = json.loads(body)
+            for message in data["messages"]:
+                histogram.observe(received - published_at(message["raw"]))
+                stats["poll_messages"] += 1
+            last_id = data["last_id"]
+    finally:
+        connection.close()
+
+async def client_main(worker: int, host: str, port: int, ws_clients: int, pollers: int,
+                      ready, stop, results):
+    ws_histogram, poll_histogram = LatencyHistogram(), LatencyHistogram()
+    stats = {"ws_messages": 0, "poll_messages": 0, "poll_requests": 0, "poll_errors": 0, "client_errors": 0}
+    connected: list = []
+    url = f"ws://{host}:{port}/ws?fields=raw"
+
+    async def guarded(coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats["client_errors"] += 1
+
+    tasks = []
+    for i in range(ws_clients):
+        tasks.append(asyncio.create_task(guarded(websocket_client(url, ws_histogram, stats, connected))))
+        if i % 100 == 99:
+            # Не открывать тысячи соединений одним залпом
+            await asyncio.sleep(0.05)
+    for _ in range(pollers):
+        tasks.append(asyncio.create_task(guarded(poll_client(host, port, poll_histogram, stats, connected))))
+
+    while len(connected) + stats["client_errors"] < ws_clients + pollers:
+        await asyncio.sleep(0.05)
+    ready.put((worker, len(connected)))
+
+    while not stop.is_set():
+        await asyncio.sleep(0.1)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    results.put({
+        "worker": worker,
+        "ws": ws_histogram.to_dict(),
+        "poll": poll_histogram.to_dict(),
+        **stats,
+        "usage": process_usage()
+    })
+
+def client_process(*args):
+    raise_open_files_limit()
+    asyncio.run(client_main(*args))
+
+# ---- Процесс сервера ----
+
+def split(total: int, parts: int, index: int) -> int:
+    return total // parts + (1 if index < total % parts else 0)
+
+async def run(args, sock: socket.socket, ready, stop, results, workers: int) -> dict:
+    import uvicorn
+    import main
+    from rabbitmq_client.rabbitmq_handler import rabbitmq_handler
+    from websocket_manager.message_notifier import message_notifier
+
+    server = uvicorn.Server(uvicorn.Config(main.app, log_level="warning", access_log=False))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    loop = asyncio.get_running_loop()
+    connected = 0
+    for _ in range(workers):
+        _, count = await loop.run_in_executor(None, ready.get, True, args.connect_timeout)
+        connected += count
+    print(f"🔌 Клиентов подключено: {connected} из {args.ws_clients + args.pollers}", file=sys.__stdout__)
+
+    first_id = message_notifier.last_id
+    usage_before = process_usage()
+    started = loop.time()
+    published = 0
+    while loop.time() - started < args.duration:
+        due = int((loop.time() - started) * args.rate)
+        while published < due:
+            published += 1
+            body = make_body(published, args.size, args.kind)
+            # Буфер публикатора полон - ждем подтверждений брокера
+            while not await rabbitmq_handler.publish_message(body):
+                await asyncio.sleep(0.001)
+        await asyncio.sleep(0.005)
+    publish_seconds = loop.time() - started
+
+    # Дождаться сохранения всего опубликованного, затем дать клиентам дочитать
+    drain_deadline = loop.time() + args.drain
+    while message_notifier.last_id - first_id < published and loop.time() < drain_deadline:
+        await asyncio.sleep(0.01)
+    ingest_seconds = loop.time() - started
+    persisted = message_notifier.last_id - first_id
+    await asyncio.sleep(min(2.0, args.drain))
+    usage_after = process_usage()
+    elapsed = loop.time() - started
+
+    stop.set()
+    client_results = [await loop.run_in_executor(None, results.get, True, 60) for _ in range(workers)]
+
+    server.should_exit = True
+    await serving
+
+    ws_histogram, poll_histogram = LatencyHistogram(), LatencyHistogram()
+    totals = {"ws_messages": 0, "poll_messages": 0, "poll_requests": 0, "poll_errors": 0, "client_errors": 0}
+    for result in client_results:
+        ws_histogram.merge(result["ws"])
+        poll_histogram.merge(result["poll"])
+        for key in totals:
+            totals[key] += result[key]
+
+    cpu_seconds = usage_after["cpu_seconds"] - usage_before["cpu_seconds"]
+    return {
+        "meta": run_metadata(),
+        "config": {
+            "rate": args.rate, "duration": args.duration, "size": args.size, "kind": args.kind,
+            "ws_clients": args.ws_clients, "pollers": args.pollers, "client_procs": workers
+        },
+        "ingest": {
+            "published": published,
+            "persisted": persisted,
+            "publish_rate": round(published / publish_seconds, 1),
+            "throughput": round(persisted / ingest_seconds, 1) if ingest_seconds else 0.0
+        },
+        "delivery": {
+            "connected_clients": connected,
+            "ws_messages": totals["ws_messages"],
+            "ws_expected": persisted * args.ws_clients,
+            "poll_messages": totals["poll_messages"],
+            "poll_requests": totals["poll_requests"],
+            "poll_errors": totals["poll_errors"],
+            "client_errors": totals["client_errors"],
+            "deliveries_per_second": round((totals["ws_messages"] + totals["poll_messages"]) / elapsed, 1)
+        },
+        "latency": {"websocket": ws_histogram.summary(), "poll": poll_histogram.summary()},
+        "server": {
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_percent": round(cpu_seconds / elapsed * 100, 1),
+            "rss_mb": usage_after["rss_mb"],
+            "peak_rss_mb": usage_after["peak_rss_mb"]
+        },
+        "clients": [
+            {"worker": result["worker"], **result["usage"]} for result in client_results
+        ]
+    }
+
+def print_report(result: dict):
+    ingest, delivery, server = result["ingest"], result["delivery"], result["server"]
+    print(f"📤 Опубликовано: {ingest['published']} ({ingest['publish_rate']}/с), "
+          f"сохранено: {ingest['persisted']} ({ingest['throughput']}/с)")
+    print(f"📨 WebSocket: {delivery['ws_messages']} из {delivery['ws_expected']}, "
+          f"polling: {delivery['poll_messages']} за {delivery['poll_requests']} запросов, "
+          f"ошибок клиентов: {delivery['client_errors']}")
+    for name, latency in result["latency"].items():
+        print(f"⏱️  {name:<9} p50 {latency['p50_ms']:>9.2f} мс  p99 {latency['p99_ms']:>9.2f} мс  "
+              f"max {latency['max_ms']:>9.2f} мс  ({latency['count']} изм.)")
+    print(f"🖥️  Сервер: CPU {server['cpu_seconds']} с ({server['cpu_percent']}%), "
+          f"RSS {server['rss_mb']} МБ, пик {server['peak_rss_mb']} МБ")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=200, help="сообщений в секунду")
+    parser.add_argument("--duration", type=float, default=10, help="длительность публикации, с")
+    parser.add_argument("--size", type=int, default=200, help="размер сообщения, байт")
+    parser.add_argument("--kind", choices=("plain", "markdown"), default="plain")
+    parser.add_argument("--ws-clients", type=int, default=500)
+    parser.add_argument("--pollers", type=int, default=50)
+    parser.add_argument("--client-procs", type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    parser.add_argument("--drain", type=float, default=10, help="ожидание хвоста после публикации, с")
+    parser.add_argument("--connect-timeout", type=float, default=300)
+    parser.add_argument("--json", help="файл для результата в JSON ('-' - stdout)")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод сервера")
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    workdir = tempfile.mkdtemp(prefix="board-load-")
+    prepare_environment(workdir)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(4096)
+    host, port = sock.getsockname()
+
+    # Клиенты стартуют до импорта приложения: spawn не наследует его потоки
+    context = multiprocessing.get_context("spawn")
+    ready, results, stop = context.Queue(), context.Queue(), context.Event()
+    workers = max(1, min(args.client_procs, args.ws_clients + args.pollers))
+    processes = [
+        context.Process(target=client_process, daemon=True, args=(
+            index, host, port,
+            split(args.ws_clients, workers, index), split(args.pollers, workers, index),
+            ready, stop, results
+        ))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    print(f"🚀 Стенд: http://{host}:{port}, база {workdir}")
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with output:
+            result = asyncio.run(run(args, sock, ready, stop, results, workers))
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result)
+    write_json(args.json, result)
+
+if __name__ == "__main__":
+    main()
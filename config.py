@@ -5,21 +5,124 @@ class Config:
     """Конфигурация приложения"""
     
     # RabbitMQ
+    # amqp - настоящий брокер, memory - брокер в памяти процесса для локальных проверок
+    RABBITMQ_BROKER: str = os.getenv("RABBITMQ_BROKER", "amqp")
     RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "192.168.1.137")
     RABBITMQ_PORT: int = int(os.getenv("RABBITMQ_PORT", "5672"))
     RABBITMQ_USER: str = os.getenv("RABBITMQ_USER", "guest")
     RABBITMQ_PASSWORD: str = os.getenv("RABBITMQ_PASSWORD", "guest")
     RABBITMQ_QUEUE: str = os.getenv("RABBITMQ_QUEUE", "websocket_messages")
+    # Канал сообщения берется из заголовка, иначе из routing key
+    RABBITMQ_CHANNEL_HEADER: str = os.getenv("RABBITMQ_CHANNEL_HEADER", "channel")
+    RABBITMQ_PREFETCH_COUNT: int = int(os.getenv("RABBITMQ_PREFETCH_COUNT", "500"))
+    RABBITMQ_BATCH_SIZE: int = int(os.getenv("RABBITMQ_BATCH_SIZE", "100"))
+    RABBITMQ_BATCH_LINGER_MS: int = int(os.getenv("RABBITMQ_BATCH_LINGER_MS", "20"))
+    # Пауза между попытками подключиться, если брокер недоступен при запуске
+    RABBITMQ_RECONNECT_SECONDS: float = float(os.getenv("RABBITMQ_RECONNECT_SECONDS", "5"))
+    # Запись пачки, которая не прошла, повторяется на месте с растущей
+    # паузой (от INGEST_RETRY_SECONDS до INGEST_RETRY_MAX_SECONDS), пока
+    # не пройдет; новые сообщения из очереди в это время не берутся
+    INGEST_RETRY_SECONDS: float = float(os.getenv("INGEST_RETRY_SECONDS", "0.5"))
+    INGEST_RETRY_MAX_SECONDS: float = float(os.getenv("INGEST_RETRY_MAX_SECONDS", "30"))
+    
+    # Конвейер приема: очереди между этапами (в пачках), потоки
+    # форматирования (0 - по числу ядер) и порог длины сообщения, с
+    # которого оно форматируется в отдельном процессе. prefetch канала
+    # при включенном конвейере считается по его емкости, а не по
+    # RABBITMQ_PREFETCH_COUNT
+    PIPELINE_ENABLED: bool = os.getenv("PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+    PIPELINE_FORMAT_WORKERS: int = int(os.getenv("PIPELINE_FORMAT_WORKERS", "0"))
+    PIPELINE_PROCESS_MIN_BYTES: int = int(os.getenv("PIPELINE_PROCESS_MIN_BYTES", "65536"))
+    
+    # Несколько воркеров/узлов: входящую очередь читает один активный
+    # потребитель (x-single-active-consumer, очередь нужно пересоздать),
+    # сохраненные сообщения расходятся всем воркерам через fanout обменник
+    SCALE_OUT: bool = os.getenv("SCALE_OUT", "false").lower() in ("1", "true", "yes")
+    RABBITMQ_FANOUT_EXCHANGE: str = os.getenv("RABBITMQ_FANOUT_EXCHANGE", "websocket_messages.fanout")
+    # Сохранять копии в локальную базу (узлы с отдельными базами)
+    SCALE_OUT_STORE_REPLICAS: bool = os.getenv("SCALE_OUT_STORE_REPLICAS", "false").lower() in ("1", "true", "yes")
+    # Пауза между попытками передать уже сохраненные сообщения в fanout
+    # или клиентам
+    DELIVERY_RETRY_SECONDS: float = float(os.getenv("DELIVERY_RETRY_SECONDS", "1"))
+    
+    # Публикация во входящую очередь: свои каналы с подтверждениями,
+    # окно одновременно ожидающих подтверждения сообщений на канал и
+    # локальный буфер на время недоступности брокера
+    PUBLISHER_CHANNELS: int = int(os.getenv("PUBLISHER_CHANNELS", "2"))
+    PUBLISHER_WINDOW: int = int(os.getenv("PUBLISHER_WINDOW", "256"))
+    PUBLISHER_BUFFER_SIZE: int = int(os.getenv("PUBLISHER_BUFFER_SIZE", "10000"))
+    PUBLISHER_CONFIRM_TIMEOUT: float = float(os.getenv("PUBLISHER_CONFIRM_TIMEOUT", "10"))
+    PUBLISHER_RETRY_SECONDS: float = float(os.getenv("PUBLISHER_RETRY_SECONDS", "1"))
+    PUBLISHER_FLUSH_SECONDS: float = float(os.getenv("PUBLISHER_FLUSH_SECONDS", "5"))
+    # POST /api/messages и /api/messages/batch только ставят сообщения в
+    # очередь брокера, форматирование и запись в базу делает потребитель
+    HTTP_INGEST_VIA_BROKER: bool = os.getenv("HTTP_INGEST_VIA_BROKER", "false").lower() in ("1", "true", "yes")
     
     # База данных
     DATABASE_URL: str = os.getenv("DATABASE_URL", "/app/messages.db")
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
     
     # WebSocket
     WEBSOCKET_HOST: str = os.getenv("WEBSOCKET_HOST", "0.0.0.0")
     WEBSOCKET_PORT: int = int(os.getenv("WEBSOCKET_PORT", "8000"))
+    # Число потоков-шардов с отдельными event loop для /ws (0 - выключено),
+    # шарды принимают соединения на WEBSOCKET_SHARD_PORT
+    WEBSOCKET_SHARDS: int = int(os.getenv("WEBSOCKET_SHARDS", "0"))
+    WEBSOCKET_SHARD_PORT: int = int(os.getenv("WEBSOCKET_SHARD_PORT", "8001"))
+    # Сжатие кадров permessage-deflate, если клиент его предложил
+    WEBSOCKET_PER_MESSAGE_DEFLATE: bool = os.getenv("WEBSOCKET_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes")
+    WEBSOCKET_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_QUEUE_SIZE", "1000"))
+    # drop_oldest | coalesce | disconnect
+    WEBSOCKET_OVERFLOW_POLICY: str = os.getenv("WEBSOCKET_OVERFLOW_POLICY", "drop_oldest")
+    # Server-Sent Events (/api/stream): задержка переподключения
+    # EventSource и период комментариев keepalive
+    SSE_RETRY_MS: int = int(os.getenv("SSE_RETRY_MS", "3000"))
+    SSE_KEEPALIVE_SECONDS: float = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
     
     # Приложение
-    MAX_MESSAGES_HISTORY: int = 100
+    DEFAULT_CHANNEL: str = os.getenv("DEFAULT_CHANNEL", "default")
+    RENDER_CACHE_MAX_ENTRIES: int = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "2048"))
+    RENDER_CACHE_MAX_BYTES: int = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    MAX_MESSAGES_HISTORY: int = int(os.getenv("MAX_MESSAGES_HISTORY", "100"))
+    
+    # Удержание истории (0 - политика выключена): старые сообщения
+    # переносятся в сжатые файлы ARCHIVE_DIR
+    RETENTION_MAX_AGE_DAYS: int = int(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+    RETENTION_MAX_ROWS: int = int(os.getenv("RETENTION_MAX_ROWS", "0"))
+    RETENTION_MAX_DB_MB: int = int(os.getenv("RETENTION_MAX_DB_MB", "0"))
+    RETENTION_INTERVAL_SECONDS: int = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+    RETENTION_VACUUM_PAGES: int = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "/app/archive")
+    
+    # Жесткий предел размера страницы истории и ответа poll
+    HISTORY_PAGE_MAX: int = int(os.getenv("HISTORY_PAGE_MAX", "500"))
+    # Размер страницы, которой выгрузка читает базу
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+    
+    # Полнотекстовый поиск: размер пачки доиндексации старых строк,
+    # пауза между пачками и предел страницы результатов
+    SEARCH_BACKFILL_BATCH: int = int(os.getenv("SEARCH_BACKFILL_BATCH", "2000"))
+    SEARCH_BACKFILL_PAUSE: float = float(os.getenv("SEARCH_BACKFILL_PAUSE", "0.05"))
+    SEARCH_PAGE_MAX: int = int(os.getenv("SEARCH_PAGE_MAX", "100"))
+    
+    # HTTP: кэш сериализованных ответов, сжатие и кэширование статики
+    HTTP_RESPONSE_CACHE_ENTRIES: int = int(os.getenv("HTTP_RESPONSE_CACHE_ENTRIES", "256"))
+    HTTP_COMPRESS_MIN_BYTES: int = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+    STATIC_CACHE_MAX_AGE: int = int(os.getenv("STATIC_CACHE_MAX_AGE", "86400"))
+    # Предел числа сообщений в одном запросе POST /api/messages/batch
+    HTTP_BATCH_MAX_MESSAGES: int = int(os.getenv("HTTP_BATCH_MAX_MESSAGES", "1000"))
+    
+    # Диагностика: период пульса event loop; профилировщик (выключен по
+    # умолчанию) снимает стеки loop, пока пульс молчит дольше PROFILER_STALL_MS
+    LOOP_MONITOR_INTERVAL_MS: int = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILER_INTERVAL_MS: int = int(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    PROFILER_STALL_MS: int = int(os.getenv("PROFILER_STALL_MS", "50"))
     POLLING_TIMEOUT: int = 5  # секунд
     
     @property
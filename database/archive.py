@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from .crud import db_timestamp
+from .models import Message
+from config import config
+
+# messages-<первый message_id>-<последний message_id>.ndjson.gz
+ARCHIVE_FILE_RE = re.compile(r'^messages-(\d+)-(\d+)\.ndjson\.gz$')
+
+class ArchiveFile(NamedTuple):
+    first_id: int
+    last_id: int
+    path: str
+
+class MessageArchive:
+    """Архив сообщений, вытесненных политикой удержания.
+
+    Каждая пачка строк пишется в отдельный gzip файл NDJSON, диапазон
+    message_id закодирован в имени, поэтому индекс архива - это список
+    файлов каталога. Чтение идет только по файлам, пересекающим
+    запрошенный диапазон.
+    """
+
+    def __init__(self, directory: str = config.ARCHIVE_DIR):
+        self.directory = directory
+        self._files: Optional[List[ArchiveFile]] = None
+
+    def _scan(self) -> List[ArchiveFile]:
+        files = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                match = ARCHIVE_FILE_RE.match(name)
+                if match:
+                    files.append(ArchiveFile(int(match.group(1)), int(match.group(2)),
+                                             os.path.join(self.directory, name)))
+        files.sort()
+        return files
+
+    @property
+    def files(self) -> List[ArchiveFile]:
+        if self._files is None:
+            self._files = self._scan()
+        return self._files
+
+    @property
+    def last_id(self) -> int:
+        """Последний заархивированный message_id"""
+        return max((file.last_id for file in self.files), default=0)
+
+    def write(self, rows: List[dict]) -> ArchiveFile:
+        """Записать пачку строк (по возрастанию message_id) в новый файл.
+
+        Файл сначала пишется во временный и переименовывается, так что
+        читатели не видят недописанных архивов.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        first_id, last_id = rows[0]["message_id"], rows[-1]["message_id"]
+        path = os.path.join(self.directory, f"messages-{first_id:012d}-{last_id:012d}.ndjson.gz")
+        temp_path = path + ".tmp"
+
+        with gzip.open(temp_path, "wt", encoding="utf-8") as output:
+            for row in rows:
+                output.write(json.dumps(row, ensure_ascii=False))
+                output.write("\n")
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temp_path, path)
+
+        archive_file = ArchiveFile(first_id, last_id, path)
+        files = [file for file in self.files if file.path != path]
+        files.append(archive_file)
+        files.sort()
+        self._files = files
+        return archive_file
+
+    @staticmethod
+    def _row_to_message(row: dict) -> Message:
+        return Message(
+            id=row["id"],
+            message=row["message"],
+            formatted_message=row["formatted_message"],
+            message_id=row["message_id"],
+            formatter_version=row.get("formatter_version", 1),
+            channel=row.get("channel", config.DEFAULT_CHANNEL),
+            timestamp=datetime.fromisoformat(row["timestamp"])
+        )
+
+    def get_messages_page(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                          limit: int = 100, channel: Optional[str] = None,
+                          since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Message]:
+        """Страница архива с той же семантикой, что у DatabaseManager.get_messages_page"""
+        lower = after_id if after_id is not None else 0
+        upper = before_id if before_id is not None else self.last_id + 1
+        since_value = db_timestamp(since) if since is not None else None
+        until_value = db_timestamp(until) if until is not None else None
+
+        files = [file for file in self.files if file.last_id > lower and file.first_id < upper]
+        forward = after_id is not None
+        if not forward:
+            files.reverse()
+
+        seen = set()
+        rows: List[dict] = []
+        for file in files:
+            with gzip.open(file.path, "rt", encoding="utf-8") as source:
+                file_rows = [json.loads(line) for line in source if line.strip()]
+            if not forward:
+                file_rows.reverse()
+            for row in file_rows:
+                message_id = row["message_id"]
+                if not lower < message_id < upper or message_id in seen:
+                    continue
+                if channel is not None and row.get("channel", config.DEFAULT_CHANNEL) != channel:
+                    continue
+                if since_value is not None and row["timestamp"] < since_value:
+                    continue
+                if until_value is not None and row["timestamp"] >= until_value:
+                    continue
+                seen.add(message_id)
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+            if len(rows) == limit:
+                break
+
+        if not forward:
+            rows.reverse()
+        return [self._row_to_message(row) for row in rows]
+
+    async def get_messages_page_async(self, *args) -> List[Message]:
+        """get_messages_page вне event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_messages_page, *args)
+
+    def get_stats(self) -> dict:
+        """Статистика архива"""
+        return {
+            "files": len(self.files),
+            "first_id": self.files[0].first_id if self.files else None,
+            "last_id": self.last_id or None,
+            "size_bytes": sum(os.path.getsize(file.path) for file in self.files if os.path.exists(file.path))
+        }
+
+# Глобальный архив сообщений
+message_archive = MessageArchive()
@@ -0,0 +1,143 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from .models import Message, MessageCreate
+from .crud import DatabaseManager, db_manager
+from monitoring.metrics import DB_CALL_SECONDS, DB_CALL_WAIT_SECONDS
+
+class AsyncDatabaseManager:
+    """Асинхронная обертка над DatabaseManager.
+
+    Запросы выполняются вне event loop: запись - в отдельном потоке
+    (соединение для записи одно), чтение - в пуле потоков по размеру
+    пула соединений для чтения.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=db.read_pool_size, thread_name_prefix="db-reader"
+        )
+
+    @staticmethod
+    def _timed(pool: str, func: Callable, *args) -> Callable[[], Any]:
+        """Вызов для исполнителя с замером ожидания потока и самого вызова"""
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            DB_CALL_WAIT_SECONDS.observe(started - submitted, pool)
+            try:
+                return func(*args)
+            finally:
+                DB_CALL_SECONDS.observe(time.perf_counter() - started, func.__name__)
+
+        return call
+
+    async def _write(self, func: Callable, *args) -> Any:
+        """Выполнить запись в потоке записи"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._timed("write", func, *args))
+
+    async def _read(self, func: Callable, *args) -> Any:
+        """Выполнить чтение в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._timed("read", func, *args))
+
+    async def get_last_message_id(self) -> int:
+        """Получить последний ID сообщения"""
+        return await self._read(self.db.get_last_message_id)
+
+    async def create_message(self, message: MessageCreate) -> Message:
+        """Создать новое сообщение"""
+        return await self._write(self.db.create_message, message)
+
+    async def create_messages(self, messages: List[MessageCreate]) -> List[Message]:
+        """Создать несколько сообщений одной транзакцией"""
+        return await self._write(self.db.create_messages, messages)
+
+    async def store_replicas(self, messages: List[Message]):
+        """Сохранить копии сообщений, созданных другим узлом"""
+        await self._write(self.db.store_replicas, messages)
+
+    async def get_message_by_id(self, message_id: int) -> Optional[Message]:
+        """Получить сообщение по ID"""
+        return await self._read(self.db.get_message_by_id, message_id)
+
+    async def get_messages_since(self, last_id: int, channel: Optional[str] = None,
+                                 limit: Optional[int] = None) -> List[Message]:
+        """Получить сообщения начиная с определенного ID"""
+        return await self._read(self.db.get_messages_since, last_id, channel, limit)
+
+    async def get_messages_page(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                                limit: int = 100, channel: Optional[str] = None,
+                                since: Optional[datetime] = None,
+                                until: Optional[datetime] = None) -> List[Message]:
+        """Страница сообщений по курсору message_id"""
+        return await self._read(self.db.get_messages_page, after_id, before_id, limit, channel, since, until)
+
+    async def get_payload_rows(self, fields: Sequence[str], formatter_version: int,
+                               after_id: Optional[int] = None, before_id: Optional[int] = None,
+                               limit: int = 100, channel: Optional[str] = None,
+                               since: Optional[datetime] = None,
+                               until: Optional[datetime] = None) -> List[tuple]:
+        """Страница сообщений кортежами полей выдачи"""
+        return await self._read(self.db.get_payload_rows, fields, formatter_version,
+                                after_id, before_id, limit, channel, since, until)
+
+    async def get_recent_messages(self, limit: int = 20, channel: Optional[str] = None) -> List[Message]:
+        """Получить последние сообщения"""
+        return await self._read(self.db.get_recent_messages, limit, channel)
+
+    async def get_last_message(self) -> Optional[Message]:
+        """Получить последнее сообщение"""
+        return await self._read(self.db.get_last_message)
+
+    async def get_retention_cutoff(self, older_than: Optional[datetime] = None, max_rows: int = 0,
+                                   max_bytes: int = 0) -> Optional[int]:
+        """Граница удержания по политикам"""
+        return await self._read(self.db.get_retention_cutoff, older_than, max_rows, max_bytes)
+
+    async def get_oldest_rows(self, before_id: int, limit: int) -> List[dict]:
+        """Самые старые строки с message_id меньше before_id"""
+        return await self._read(self.db.get_oldest_rows, before_id, limit)
+
+    async def delete_messages_range(self, first_id: int, last_id: int) -> int:
+        """Удалить диапазон сообщений"""
+        return await self._write(self.db.delete_messages_range, first_id, last_id)
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """Вернуть системе свободные страницы"""
+        return await self._write(self.db.incremental_vacuum, pages)
+
+    async def backfill_search_index(self, batch_size: int) -> int:
+        """Проиндексировать следующую пачку старых строк"""
+        return await self._write(self.db.backfill_search_index, batch_size)
+
+    async def get_search_state(self) -> dict:
+        """Состояние полнотекстового индекса"""
+        return await self._read(self.db.get_search_state)
+
+    async def search_messages(self, match: str, limit: int = 20, channel: Optional[str] = None,
+                              since: Optional[datetime] = None, until: Optional[datetime] = None,
+                              order: str = 'rank', after: Optional[Tuple[float, int]] = None,
+                              before_id: Optional[int] = None) -> List[Tuple[Message, float, str]]:
+        """Полнотекстовый поиск сообщений"""
+        return await self._read(self.db.search_messages, match, limit, channel, since, until,
+                                order, after, before_id)
+
+    async def get_storage_stats(self) -> dict:
+        """Размер базы"""
+        return await self._read(self.db.get_storage_stats)
+
+    def close(self):
+        """Дождаться завершения запросов и закрыть соединения"""
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self.db.close()
+
+# Синглтон асинхронного доступа к базе данных
+async_db_manager = AsyncDatabaseManager(db_manager)
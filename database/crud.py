@@ -1,25 +1,112 @@
 import sqlite3
-from typing import List, Optional
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from queue import Queue
+from typing import Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
 from .models import Message, MessageCreate
 from config import config
 
+# Столбцы полей выдачи клиенту для get_payload_rows; у formatted второй
+# столбец - исходный текст устаревшего HTML (параметр - текущая версия)
+PAYLOAD_COLUMNS = {
+    'id': 'message_id',
+    'formatted': 'formatted_message, CASE WHEN formatter_version = ? THEN NULL ELSE message END',
+    'raw': 'message',
+    'channel': 'channel',
+    'timestamp': 'timestamp'
+}
+
+def db_timestamp(moment: datetime) -> str:
+    """Дата в формате столбца timestamp (UTC, как CURRENT_TIMESTAMP)"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat(sep=' ')
+
 class DatabaseManager:
-    """Менеджер базы данных"""
+    """Менеджер базы данных
+    
+    Держит одно долгоживущее соединение для записи и небольшой пул
+    соединений для чтения. Методы синхронные и потокобезопасные, для
+    вызова из asyncio используется AsyncDatabaseManager.
+    """
     
-    def __init__(self, db_path: str = config.DATABASE_URL):
+    def __init__(self, db_path: str = config.DATABASE_URL, read_pool_size: int = config.DB_READ_POOL_SIZE):
         self.db_path = db_path
+        self.read_pool_size = max(1, read_pool_size)
+        self._write_lock = threading.Lock()
+        self._writer = self.get_connection()
+        # До перехода в WAL: он создает файл базы, и режим auto_vacuum
+        # пустой базы после этого уже не применяется без VACUUM
+        self._enable_incremental_vacuum(self._writer)
+        self._writer.execute('PRAGMA journal_mode=WAL')
         self.init_db()
+        
+        self._readers: Queue = Queue()
+        # Все соединения для чтения, включая взятые из пула в момент close()
+        self._all_readers: List[sqlite3.Connection] = []
+        for _ in range(self.read_pool_size):
+            reader = self.get_connection()
+            reader.execute('PRAGMA query_only=ON')
+            self._all_readers.append(reader)
+            self._readers.put(reader)
     
     def get_connection(self):
-        """Получить соединение с базой данных"""
-        conn = sqlite3.connect(self.db_path)
+        """Получить новое соединение с базой данных"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA cache_size={-config.DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}')
         return conn
     
+    @contextmanager
+    def write_connection(self) -> Iterator[sqlite3.Connection]:
+        """Захватить соединение для записи"""
+        with self._write_lock:
+            yield self._writer
+    
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Взять соединение для чтения из пула"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    def close(self):
+        """Закрыть все соединения"""
+        for reader in self._all_readers:
+            reader.close()
+        with self._write_lock:
+            self._writer.close()
+    
     def init_db(self):
         """Инициализировать базу данных"""
-        conn = self.get_connection()
+        with self.write_connection() as conn:
+            self._create_schema(conn)
+    
+    def _enable_incremental_vacuum(self, conn: sqlite3.Connection):
+        """Включить auto_vacuum=INCREMENTAL.
+
+        Пустая база (ни одной страницы) получает режим сразу, существующую
+        приходится один раз перестроить через VACUUM - это блокирует
+        запуск, но только однажды.
+        """
+        # 2 - INCREMENTAL
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return
+        is_empty = conn.execute('PRAGMA page_count').fetchone()[0] == 0
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        if not is_empty:
+            print("⚠️ Перевод базы в режим incremental auto_vacuum (однократный VACUUM)...")
+            conn.execute('VACUUM')
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Создать таблицы и индексы"""
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS messages (
@@ -30,88 +117,477 @@ class DatabaseManager:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_id ON messages(message_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)')
+        
+        columns = {row['name'] for row in cursor.execute('PRAGMA table_info(messages)')}
+        if 'formatter_version' not in columns:
+            cursor.execute('ALTER TABLE messages ADD COLUMN formatter_version INTEGER NOT NULL DEFAULT 1')
+        if 'channel' not in columns:
+            # В DDL нельзя передать параметр, экранируем кавычки вручную
+            default_channel = config.DEFAULT_CHANNEL.replace("'", "''")
+            cursor.execute(f"ALTER TABLE messages ADD COLUMN channel TEXT NOT NULL DEFAULT '{default_channel}'")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_channel_message_id ON messages(channel, message_id)')
+        
+        # ID сообщений уникальны; старые базы могли получить дубли
+        # при одновременной записи, для них остается обычный индекс
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_message_id_unique ON messages(message_id)')
+            cursor.execute('DROP INDEX IF EXISTS idx_message_id')
+        except sqlite3.IntegrityError:
+            print("⚠️ В таблице messages есть повторяющиеся message_id, уникальный индекс не создан")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_id ON messages(message_id)')
+
+        self._create_search_schema(cursor)
         conn.commit()
-        conn.close()
+
+    def _create_search_schema(self, cursor: sqlite3.Cursor):
+        """Полнотекстовый индекс FTS5 по тексту сообщений.
+
+        Индекс хранит только токены (content='messages'), сами тексты
+        берутся из messages. Триггеры обновляют его в той же транзакции,
+        что и вставку/удаление сообщения. Строки, существовавшие до
+        создания индекса, доиндексирует backfill_search_index.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    message, content='messages', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ FTS5 недоступен, поиск выключен: {e}")
+            self.search_enabled = False
+            return
+        self.search_enabled = True
+
+        cursor.execute('CREATE TABLE IF NOT EXISTS search_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        if not exists:
+            max_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+            cursor.executemany('INSERT OR REPLACE INTO search_state (key, value) VALUES (?, ?)',
+                               [('backfill_upto', max_id), ('backfilled_through', 0)])
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+            END
+        ''')
+        # Удалять из индекса можно только то, что в нем есть
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+            WHEN old.id > (SELECT value FROM search_state WHERE key = 'backfill_upto')
+              OR old.id <= (SELECT value FROM search_state WHERE key = 'backfilled_through')
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            END
+        ''')
     
     def get_last_message_id(self) -> int:
         """Получить последний ID сообщения"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT MAX(message_id) FROM messages')
-        result = cursor.fetchone()
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MAX(message_id) FROM messages')
+            result = cursor.fetchone()
         return result[0] if result[0] else 0
     
     def create_message(self, message: MessageCreate) -> Message:
         """Создать новое сообщение"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self.create_messages([message])[0]
+    
+    def create_messages(self, messages: List[MessageCreate]) -> List[Message]:
+        """Создать несколько сообщений одной транзакцией
         
-        cursor.execute('''
-            INSERT INTO messages (message, formatted_message, message_id) 
-            VALUES (?, ?, ?)
-        ''', (message.message, message.formatted_message, message.message_id))
+        Время и ID строк известны после вставки, поэтому созданные
+        сообщения собираются без повторного чтения из базы.
+        """
+        if not messages:
+            return []
         
-        message_id = cursor.lastrowid
-        conn.commit()
+        # Как CURRENT_TIMESTAMP: UTC с точностью до секунды
+        timestamp = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        stored_timestamp = db_timestamp(timestamp)
+        with self.write_connection() as conn:
+            try:
+                conn.executemany('''
+                    INSERT INTO messages (message, formatted_message, message_id, formatter_version, channel, timestamp) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(m.message, m.formatted_message, m.message_id, m.formatter_version, m.channel,
+                       stored_timestamp) for m in messages])
+                # AUTOINCREMENT внутри одной транзакции выдает строки подряд
+                last_row_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
         
-        # Получаем созданное сообщение
-        cursor.execute('SELECT * FROM messages WHERE id = ?', (message_id,))
-        result = cursor.fetchone()
-        conn.close()
+        first_row_id = last_row_id - len(messages) + 1
+        return [
+            Message(**m.model_dump(), id=first_row_id + i, timestamp=timestamp)
+            for i, m in enumerate(messages)
+        ]
+    
+    def store_replicas(self, messages: List[Message]):
+        """Сохранить копии сообщений, созданных другим узлом.
         
-        return self._row_to_message(result)
+        Уже существующие message_id пропускаются.
+        """
+        with self.write_connection() as conn:
+            try:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO messages 
+                    (message, formatted_message, message_id, formatter_version, channel, timestamp) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(m.message, m.formatted_message, m.message_id, m.formatter_version, m.channel,
+                       m.timestamp.isoformat(sep=' ')) for m in messages])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
     
     def get_message_by_id(self, message_id: int) -> Optional[Message]:
         """Получить сообщение по ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM messages WHERE id = ?', (message_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM messages WHERE id = ?', (message_id,))
+            result = cursor.fetchone()
         
         return self._row_to_message(result) if result else None
     
-    def get_messages_since(self, last_id: int) -> List[Message]:
-        """Получить сообщения начиная с определенного ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM messages 
-            WHERE message_id > ? 
-            ORDER BY message_id ASC
-        ''', (last_id,))
-        results = cursor.fetchall()
-        conn.close()
+    def get_messages_since(self, last_id: int, channel: Optional[str] = None,
+                           limit: Optional[int] = None) -> List[Message]:
+        """Получить сообщения начиная с определенного ID (не больше limit)"""
+        # LIMIT -1 в SQLite - без ограничения
+        limit = -1 if limit is None else limit
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            if channel is None:
+                cursor.execute('''
+                    SELECT * FROM messages
+                    WHERE message_id > ?
+                    ORDER BY message_id ASC LIMIT ?
+                ''', (last_id, limit))
+            else:
+                cursor.execute('''
+                    SELECT * FROM messages
+                    WHERE channel = ? AND message_id > ?
+                    ORDER BY message_id ASC LIMIT ?
+                ''', (channel, last_id, limit))
+            results = cursor.fetchall()
         
         return [self._row_to_message(row) for row in results]
     
-    def get_recent_messages(self, limit: int = 20) -> List[Message]:
-        """Получить последние сообщения"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    @staticmethod
+    def _first_id_at(cursor: sqlite3.Cursor, moment: str) -> Optional[int]:
+        """Наименьший message_id среди сообщений с первой отметкой времени >= moment.
+
+        Оба подзапроса идут по idx_timestamp: сначала находится первая
+        отметка времени, затем сообщения ровно с ней.
+        """
         cursor.execute('''
-            SELECT * FROM messages 
-            ORDER BY message_id DESC LIMIT ?
-        ''', (limit,))
-        results = cursor.fetchall()
-        conn.close()
+            SELECT MIN(message_id) FROM messages
+            WHERE timestamp = (SELECT MIN(timestamp) FROM messages WHERE timestamp >= ?)
+        ''', (moment,))
+        return cursor.fetchone()[0]
+
+    def get_messages_page(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                          limit: int = 100, channel: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Message]:
+        """Страница сообщений по курсору message_id (keyset pagination).
+
+        С after_id страница идет вперед от него, иначе - назад от
+        before_id (или от последнего сообщения). Результат всегда
+        упорядочен по возрастанию message_id. Интервал [since, until)
+        переводится в границы message_id по idx_timestamp (ID выдаются
+        в порядке времени), так что страница читается по индексу
+        message_id без сортировки всего интервала.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            query = self._page_query(cursor, after_id, before_id, channel, since, until)
+            if query is None:
+                return []
+            where, params, order = query
+            cursor.execute(
+                f'SELECT * FROM messages {where} ORDER BY message_id {order} LIMIT ?',
+                (*params, limit)
+            )
+            results = cursor.fetchall()
+
+        # Страница назад читается с конца, восстанавливаем порядок
+        if order == 'DESC':
+            results.reverse()
+        return [self._row_to_message(row) for row in results]
+
+    def get_payload_rows(self, fields: Sequence[str], formatter_version: int,
+                         after_id: Optional[int] = None, before_id: Optional[int] = None,
+                         limit: int = 100, channel: Optional[str] = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[tuple]:
+        """Страница как у get_messages_page, но кортежами только нужных полей.
+
+        Столбцы идут в порядке fields (имена полей выдачи клиенту).
+        Поле formatted занимает два столбца: HTML и исходный текст,
+        который заполнен только у сообщений, сохраненных другой версией
+        форматировщика (их HTML нужно перерисовать).
+        """
+        columns, column_params = [], []
+        for field in fields:
+            columns.append(PAYLOAD_COLUMNS[field])
+            if field == 'formatted':
+                column_params.append(formatter_version)
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            query = self._page_query(cursor, after_id, before_id, channel, since, until)
+            if query is None:
+                return []
+            where, params, order = query
+            cursor.execute(
+                f'SELECT {", ".join(columns)} FROM messages {where} ORDER BY message_id {order} LIMIT ?',
+                (*column_params, *params, limit)
+            )
+            results = cursor.fetchall()
+
+        if order == 'DESC':
+            results.reverse()
+        return results
+
+    def _page_query(self, cursor: sqlite3.Cursor, after_id: Optional[int], before_id: Optional[int],
+                    channel: Optional[str], since: Optional[datetime],
+                    until: Optional[datetime]) -> Optional[Tuple[str, list, str]]:
+        """WHERE, параметры и направление страницы; None - страница заведомо пуста"""
+        conditions, params = [], []
+        lower, upper = after_id, before_id
+
+        if since is not None:
+            since_value = db_timestamp(since)
+            first_id = self._first_id_at(cursor, since_value)
+            if first_id is None:
+                return None
+            lower = first_id - 1 if lower is None else max(lower, first_id - 1)
+            conditions.append('timestamp >= ?')
+            params.append(since_value)
+        if until is not None:
+            until_value = db_timestamp(until)
+            first_id = self._first_id_at(cursor, until_value)
+            if first_id is not None:
+                upper = first_id if upper is None else min(upper, first_id)
+            conditions.append('timestamp < ?')
+            params.append(until_value)
+
+        if lower is not None:
+            conditions.append('message_id > ?')
+            params.append(lower)
+        if upper is not None:
+            conditions.append('message_id < ?')
+            params.append(upper)
+        if channel is not None:
+            conditions.append('channel = ?')
+            params.append(channel)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return where, params, 'ASC' if after_id is not None else 'DESC'
+
+    def get_recent_messages(self, limit: int = 20, channel: Optional[str] = None) -> List[Message]:
+        """Получить последние сообщения"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            if channel is None:
+                cursor.execute('''
+                    SELECT * FROM messages 
+                    ORDER BY message_id DESC LIMIT ?
+                ''', (limit,))
+            else:
+                cursor.execute('''
+                    SELECT * FROM messages 
+                    WHERE channel = ? 
+                    ORDER BY message_id DESC LIMIT ?
+                ''', (channel, limit))
+            results = cursor.fetchall()
         
         # Восстанавливаем порядок
         return [self._row_to_message(row) for row in reversed(results)]
     
     def get_last_message(self) -> Optional[Message]:
         """Получить последнее сообщение"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM messages ORDER BY id DESC LIMIT 1')
-        result = cursor.fetchone()
-        conn.close()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM messages ORDER BY id DESC LIMIT 1')
+            result = cursor.fetchone()
         
         return self._row_to_message(result) if result else None
     
+    def get_retention_cutoff(self, older_than: Optional[datetime] = None, max_rows: int = 0,
+                             max_bytes: int = 0) -> Optional[int]:
+        """Граница удержания: сообщения с message_id меньше нее подлежат
+        архивации. None - архивировать нечего.
+
+        Самое новое сообщение не архивируется никогда, иначе после
+        рестарта MAX(message_id) начал бы выдавать ID заново.
+        """
+        cutoffs = []
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            last_id = cursor.execute('SELECT MAX(message_id) FROM messages').fetchone()[0]
+            if last_id is None:
+                return None
+
+            if older_than is not None:
+                first_id = self._first_id_at(cursor, db_timestamp(older_than))
+                cutoffs.append(last_id if first_id is None else first_id)
+
+            if max_rows > 0:
+                cursor.execute('SELECT message_id FROM messages ORDER BY message_id DESC LIMIT 1 OFFSET ?',
+                               (max_rows - 1,))
+                row = cursor.fetchone()
+                if row is not None:
+                    cutoffs.append(row[0])
+
+            if max_bytes > 0:
+                page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+                used_pages = (cursor.execute('PRAGMA page_count').fetchone()[0]
+                              - cursor.execute('PRAGMA freelist_count').fetchone()[0])
+                used_bytes = used_pages * page_size
+                if used_bytes > max_bytes:
+                    # Считаем строки одинаковыми по размеру
+                    total = cursor.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+                    excess = int(total * (1 - max_bytes / used_bytes)) + 1
+                    cursor.execute('SELECT message_id FROM messages ORDER BY message_id ASC LIMIT 1 OFFSET ?',
+                                   (excess,))
+                    row = cursor.fetchone()
+                    cutoffs.append(last_id if row is None else row[0])
+
+        if not cutoffs:
+            return None
+        return min(max(cutoffs), last_id)
+
+    def get_oldest_rows(self, before_id: int, limit: int) -> List[dict]:
+        """Самые старые строки с message_id меньше before_id, как словари"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM messages
+                WHERE message_id < ?
+                ORDER BY message_id ASC LIMIT ?
+            ''', (before_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def delete_messages_range(self, first_id: int, last_id: int) -> int:
+        """Удалить сообщения с message_id в [first_id, last_id]"""
+        with self.write_connection() as conn:
+            try:
+                cursor = conn.execute('DELETE FROM messages WHERE message_id BETWEEN ? AND ?',
+                                      (first_id, last_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return cursor.rowcount
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Вернуть системе до pages свободных страниц, вернуть их число"""
+        with self.write_connection() as conn:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # execute() делает один шаг и освобождает одну страницу,
+            # executescript() выполняет прагму до конца
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+            after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return before - after
+
+    def _search_state(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """Граница backfill и сколько из нее уже проиндексировано"""
+        state = dict(conn.execute('SELECT key, value FROM search_state').fetchall())
+        return state.get('backfill_upto', 0), state.get('backfilled_through', 0)
+
+    def backfill_search_index(self, batch_size: int) -> int:
+        """Проиндексировать следующую пачку строк, существовавших до
+        создания индекса; вернуть, сколько ID осталось до конца"""
+        if not self.search_enabled:
+            return 0
+        with self.write_connection() as conn:
+            upto, through = self._search_state(conn)
+            if through >= upto:
+                return 0
+            next_through = min(upto, through + batch_size)
+            try:
+                conn.execute('''
+                    INSERT INTO messages_fts (rowid, message)
+                    SELECT id, message FROM messages WHERE id > ? AND id <= ?
+                ''', (through, next_through))
+                conn.execute("UPDATE search_state SET value = ? WHERE key = 'backfilled_through'",
+                             (next_through,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return upto - next_through
+
+    def get_search_state(self) -> dict:
+        """Состояние полнотекстового индекса"""
+        if not self.search_enabled:
+            return {"enabled": False}
+        with self.read_connection() as conn:
+            upto, through = self._search_state(conn)
+        return {"enabled": True, "backfill_pending": max(0, upto - through)}
+
+    def search_messages(self, match: str, limit: int = 20, channel: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        order: str = 'rank', after: Optional[Tuple[float, int]] = None,
+                        before_id: Optional[int] = None) -> List[Tuple[Message, float, str]]:
+        """Найти сообщения по выражению FTS5 match.
+
+        order='rank' - по релевантности (bm25), курсор after=(rank, id)
+        последнего результата предыдущей страницы; order='recent' - от
+        новых к старым, курсор before_id (id строки). Возвращает тройки
+        (сообщение, rank, фрагмент с маркерами \\x02...\\x03).
+        """
+        conditions, params = ['messages_fts MATCH ?'], [match]
+        if channel is not None:
+            conditions.append('m.channel = ?')
+            params.append(channel)
+        if since is not None:
+            conditions.append('m.timestamp >= ?')
+            params.append(db_timestamp(since))
+        if until is not None:
+            conditions.append('m.timestamp < ?')
+            params.append(db_timestamp(until))
+
+        if order == 'recent':
+            if before_id is not None:
+                conditions.append('messages_fts.rowid < ?')
+                params.append(before_id)
+            order_by = 'messages_fts.rowid DESC'
+        else:
+            if after is not None:
+                conditions.append('(messages_fts.rank > ? OR (messages_fts.rank = ? AND m.id > ?))')
+                params.extend((after[0], after[0], after[1]))
+            order_by = 'messages_fts.rank, m.id'
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT m.*, messages_fts.rank AS search_rank,
+                       snippet(messages_fts, 0, char(2), char(3), '…', 16) AS search_snippet
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order_by} LIMIT ?
+            ''', (*params, limit))
+            results = cursor.fetchall()
+
+        return [(self._row_to_message(row), row['search_rank'], row['search_snippet']) for row in results]
+
+    def get_storage_stats(self) -> dict:
+        """Размер базы в страницах"""
+        with self.read_connection() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return {
+            "size_bytes": page_count * page_size,
+            "free_bytes": freelist_count * page_size
+        }
+
     def _row_to_message(self, row) -> Message:
         """Преобразовать строку базы данных в объект Message"""
         return Message(
@@ -119,6 +595,8 @@ class DatabaseManager:
             message=row['message'],
             formatted_message=row['formatted_message'],
             message_id=row['message_id'],
+            formatter_version=row['formatter_version'],
+            channel=row['channel'],
             timestamp=datetime.fromisoformat(row['timestamp']) if row['timestamp'] else datetime.now()
         )
 
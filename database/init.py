@@ -1,4 +1,19 @@
 from .models import Message, MessageCreate
 from .crud import DatabaseManager, db_manager
+from .async_crud import AsyncDatabaseManager, async_db_manager
+from .message_cache import MessageCache, message_cache
+from .sequence import MessageSequence, message_sequence
+from .archive import MessageArchive, message_archive
+from .retention import RetentionManager, retention_manager
+from .search import MessageSearch, message_search
 
-__all__ = ["Message", "MessageCreate", "DatabaseManager", "db_manager"]
\ No newline at end of file
+__all__ = [
+    "Message", "MessageCreate",
+    "DatabaseManager", "db_manager",
+    "AsyncDatabaseManager", "async_db_manager",
+    "MessageCache", "message_cache",
+    "MessageSequence", "message_sequence",
+    "MessageArchive", "message_archive",
+    "RetentionManager", "retention_manager",
+    "MessageSearch", "message_search",
+]
\ No newline at end of file
@@ -0,0 +1,142 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import List, Optional
+from .models import Message
+from .async_crud import AsyncDatabaseManager, async_db_manager
+from config import config
+
+class MessageCache:
+    """Кэш последних сообщений в памяти поверх DatabaseManager.
+
+    Хранит не более max_size самых новых сообщений, упорядоченных по
+    message_id. Запросы, попадающие в окно кэша, обслуживаются без
+    обращения к базе данных, остальные передаются в AsyncDatabaseManager.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager, max_size: int = config.MAX_MESSAGES_HISTORY):
+        self.db = db
+        self.max_size = max_size
+        self._messages: List[Message] = []
+        self._ids: List[int] = []
+        # True, пока в кэше лежит вся таблица целиком
+        self._complete = False
+
+    async def load(self):
+        """Загрузить последние сообщения из базы данных"""
+        messages = await self.db.get_recent_messages(self.max_size)
+        self._messages = list(messages)
+        self._ids = [msg.message_id for msg in messages]
+        self._complete = len(messages) < self.max_size
+
+    def add(self, message: Message):
+        """Добавить только что сохраненное сообщение"""
+        if not self._ids or message.message_id > self._ids[-1]:
+            self._messages.append(message)
+            self._ids.append(message.message_id)
+        else:
+            index = bisect_right(self._ids, message.message_id)
+            if index and self._ids[index - 1] == message.message_id:
+                # Уже в кэше (повторная доставка)
+                return
+            self._messages.insert(index, message)
+            self._ids.insert(index, message.message_id)
+
+        overflow = len(self._messages) - self.max_size
+        if overflow > 0:
+            del self._messages[:overflow]
+            del self._ids[:overflow]
+            self._complete = False
+
+    def discard_through(self, message_id: int):
+        """Убрать из кэша сообщения, удаленные из базы (message_id <= message_id)"""
+        count = bisect_right(self._ids, message_id)
+        if count:
+            del self._messages[:count]
+            del self._ids[:count]
+
+    def _covers(self, last_id: int) -> bool:
+        """Все ли сообщения с ID больше last_id находятся в кэше"""
+        return self._complete or (bool(self._ids) and last_id >= self._ids[0])
+
+    async def get_last_message_id(self) -> int:
+        """Получить последний ID сообщения"""
+        if self._ids:
+            return self._ids[-1]
+        if self._complete:
+            return 0
+        return await self.db.get_last_message_id()
+
+    async def get_messages_since(self, last_id: int, channel: Optional[str] = None,
+                                 limit: Optional[int] = None) -> List[Message]:
+        """Получить сообщения начиная с определенного ID (не больше limit)"""
+        if not self._covers(last_id):
+            return await self.db.get_messages_since(last_id, channel, limit)
+
+        messages = self._messages[bisect_right(self._ids, last_id):]
+        if channel is not None:
+            messages = [msg for msg in messages if msg.channel == channel]
+        return messages if limit is None else messages[:limit]
+
+    async def get_messages_page(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                                limit: int = 100, channel: Optional[str] = None,
+                                since: Optional[datetime] = None,
+                                until: Optional[datetime] = None) -> List[Message]:
+        """Страница сообщений по курсору message_id; из кэша, если она
+        целиком лежит в окне и не нужны фильтры канала и времени"""
+        messages = self.get_cached_page(after_id, before_id, limit, channel, since, until)
+        if messages is not None:
+            return messages
+        return await self.db.get_messages_page(after_id, before_id, limit, channel, since, until)
+
+    def get_cached_page(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                        limit: int = 100, channel: Optional[str] = None,
+                        since: Optional[datetime] = None,
+                        until: Optional[datetime] = None) -> Optional[List[Message]]:
+        """Страница из окна кэша или None, если ее нужно читать из базы"""
+        if channel is None and since is None and until is None:
+            end = bisect_left(self._ids, before_id) if before_id is not None else len(self._ids)
+            if after_id is not None:
+                if self._covers(after_id):
+                    start = bisect_right(self._ids, after_id)
+                    return self._messages[start:max(start, min(end, start + limit))]
+            elif end >= limit or self._complete:
+                return self._messages[max(0, end - limit):end]
+        return None
+
+    async def get_recent_messages(self, limit: int = 20, channel: Optional[str] = None) -> List[Message]:
+        """Получить последние сообщения"""
+        if limit < 0 or (limit > len(self._messages) and not self._complete):
+            return await self.db.get_recent_messages(limit, channel)
+        if not limit:
+            return []
+        if channel is None:
+            return self._messages[-limit:]
+
+        messages: List[Message] = []
+        for msg in reversed(self._messages):
+            if msg.channel == channel:
+                messages.append(msg)
+                if len(messages) == limit:
+                    break
+
+        # В окне не нашлось достаточно сообщений канала
+        if len(messages) < limit and not self._complete:
+            return await self.db.get_recent_messages(limit, channel)
+
+        messages.reverse()
+        return messages
+
+    async def get_last_message(self) -> Optional[Message]:
+        """Получить последнее сообщение"""
+        if self._messages:
+            return self._messages[-1]
+        if self._complete:
+            return None
+        return await self.db.get_last_message()
+
+    def get_size(self) -> int:
+        """Получить количество сообщений в кэше"""
+        return len(self._messages)
+
+# Синглтон кэша сообщений
+message_cache = MessageCache(async_db_manager)
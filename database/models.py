@@ -1,12 +1,15 @@
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
+from config import config
 
 class MessageBase(BaseModel):
     """Базовая модель сообщения"""
     message: str
     formatted_message: Optional[str] = None
     message_id: int
+    formatter_version: int = 1
+    channel: str = config.DEFAULT_CHANNEL
 
 class MessageCreate(MessageBase):
     """Модель для создания сообщения"""
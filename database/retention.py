@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from .archive import MessageArchive, message_archive
+from .async_crud import AsyncDatabaseManager, async_db_manager
+from .message_cache import MessageCache, message_cache
+from config import config
+
+class RetentionManager:
+    """Фоновое удержание истории.
+
+    Сообщения старше RETENTION_MAX_AGE_DAYS, сверх RETENTION_MAX_ROWS
+    или сверх RETENTION_MAX_DB_MB переносятся пачками в архив и
+    удаляются из базы. Каждая пачка - отдельная короткая транзакция,
+    между пачками запись новых сообщений не блокируется. Освободившиеся
+    страницы возвращаются через PRAGMA incremental_vacuum небольшими
+    шагами вместо полного VACUUM.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager, archive: MessageArchive, cache: MessageCache):
+        self.db = db
+        self.archive = archive
+        self.cache = cache
+        # Меняется при каждом удалении, входит в ETag ответов
+        self.generation = 0
+        self.archived_total = 0
+        self.vacuumed_pages = 0
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(config.RETENTION_MAX_AGE_DAYS or config.RETENTION_MAX_ROWS or config.RETENTION_MAX_DB_MB)
+
+    async def run_once(self) -> int:
+        """Применить политики удержания один раз, вернуть число
+        заархивированных сообщений"""
+        older_than = None
+        if config.RETENTION_MAX_AGE_DAYS:
+            older_than = datetime.utcnow() - timedelta(days=config.RETENTION_MAX_AGE_DAYS)
+
+        cutoff = await self.db.get_retention_cutoff(
+            older_than, config.RETENTION_MAX_ROWS, config.RETENTION_MAX_DB_MB * 1024 * 1024
+        )
+
+        archived = 0
+        loop = asyncio.get_running_loop()
+        while cutoff is not None:
+            rows = await self.db.get_oldest_rows(cutoff, config.RETENTION_BATCH_SIZE)
+            if not rows:
+                break
+
+            # Сначала архив на диске, потом удаление из базы
+            await loop.run_in_executor(None, self.archive.write, rows)
+            first_id, last_id = rows[0]["message_id"], rows[-1]["message_id"]
+            await self.db.delete_messages_range(first_id, last_id)
+            self.cache.discard_through(last_id)
+
+            archived += len(rows)
+            self.generation += 1
+            print(f"🗄️ В архив перенесены сообщения #{first_id}-#{last_id}")
+
+        while True:
+            freed = await self.db.incremental_vacuum(config.RETENTION_VACUUM_PAGES)
+            self.vacuumed_pages += freed
+            if freed < config.RETENTION_VACUUM_PAGES:
+                break
+
+        self.archived_total += archived
+        self.last_run = datetime.now()
+        return archived
+
+    async def run_forever(self):
+        """Периодически применять политики удержания"""
+        while True:
+            try:
+                await self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Ошибка удержания истории: {e}")
+            await asyncio.sleep(config.RETENTION_INTERVAL_SECONDS)
+
+    async def get_stats(self) -> dict:
+        """Статистика удержания, базы и архива"""
+        return {
+            "enabled": self.enabled,
+            "archived": self.archived_total,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_error": self.last_error,
+            "database": await self.db.get_storage_stats(),
+            "archive": self.archive.get_stats()
+        }
+
+# Глобальный менеджер удержания истории
+retention_manager = RetentionManager(async_db_manager, message_archive, message_cache)
@@ -0,0 +1,127 @@
+import asyncio
+import html
+import re
+import sqlite3
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from .async_crud import AsyncDatabaseManager, async_db_manager
+from .models import Message
+from config import config
+
+# Слово запроса, * в конце - поиск по префиксу
+QUERY_TOKEN_RE = re.compile(r'(\w+)(\*?)')
+
+SEARCH_ORDERS = ("rank", "recent")
+
+class SearchHit(NamedTuple):
+    message: Message
+    score: float
+    snippet: str
+
+class SearchPage(NamedTuple):
+    hits: List[SearchHit]
+    next_cursor: Optional[str]
+
+def build_match(query: str, raw: bool = False) -> str:
+    """Выражение FTS5 MATCH из пользовательского запроса.
+
+    По умолчанию каждое слово берется в кавычки (все слова обязательны,
+    операторы FTS5 не действуют), raw=True передает запрос как есть.
+    """
+    if raw:
+        match = query.strip()
+    else:
+        match = " ".join(f'"{word}"{prefix}' for word, prefix in QUERY_TOKEN_RE.findall(query))
+    if not match:
+        raise ValueError("Пустой поисковый запрос")
+    return match
+
+def highlight(snippet: str) -> str:
+    """Экранировать фрагмент и заменить маркеры совпадений на <mark>"""
+    return html.escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+class MessageSearch:
+    """Полнотекстовый поиск по сообщениям (SQLite FTS5).
+
+    Индекс пополняется триггером при каждой вставке, строки, записанные
+    до появления индекса, доиндексируются в фоне небольшими пачками.
+    Страницы выдаются по курсору: для сортировки по релевантности это
+    пара (rank, id) последнего результата, для сортировки по новизне -
+    id последнего результата.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager):
+        self.db = db
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.db.db.search_enabled
+
+    @staticmethod
+    def encode_cursor(hit: SearchHit, order: str) -> str:
+        if order == "recent":
+            return str(hit.message.id)
+        return f"{hit.score!r}:{hit.message.id}"
+
+    @staticmethod
+    def decode_cursor(cursor: str, order: str) -> tuple:
+        """Разобрать курсор; ValueError, если он не подходит к сортировке"""
+        if order == "recent":
+            return None, int(cursor)
+        score, _, row_id = cursor.partition(":")
+        return (float(score), int(row_id)), None
+
+    async def search(self, query: str, limit: int = 20, channel: Optional[str] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     order: str = "rank", cursor: Optional[str] = None,
+                     raw: bool = False) -> SearchPage:
+        """Страница результатов поиска.
+
+        ValueError - некорректный запрос, сортировка или курсор.
+        """
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Неизвестная сортировка: {order}")
+        match = build_match(query, raw)
+        after, before_id = self.decode_cursor(cursor, order) if cursor else (None, None)
+
+        try:
+            # На одну больше, чтобы узнать, есть ли следующая страница
+            rows = await self.db.search_messages(match, limit + 1, channel, since, until,
+                                                 order, after, before_id)
+        except sqlite3.OperationalError as e:
+            # Синтаксическая ошибка в raw запросе
+            raise ValueError(str(e)) from e
+
+        hits = [SearchHit(message, score, highlight(snippet)) for message, score, snippet in rows]
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            next_cursor = self.encode_cursor(hits[-1], order)
+        return SearchPage(hits, next_cursor)
+
+    async def run_backfill(self):
+        """Доиндексировать строки, записанные до создания индекса"""
+        if not self.enabled:
+            return
+        try:
+            while True:
+                remaining = await self.db.backfill_search_index(config.SEARCH_BACKFILL_BATCH)
+                if remaining <= 0:
+                    break
+                # Пауза между пачками, чтобы не занимать поток записи
+                await asyncio.sleep(config.SEARCH_BACKFILL_PAUSE)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Ошибка индексации для поиска: {e}")
+
+    async def get_stats(self) -> dict:
+        """Статистика поиска"""
+        return {
+            **await self.db.get_search_state(),
+            "last_error": self.last_error
+        }
+
+# Глобальный полнотекстовый поиск
+message_search = MessageSearch(async_db_manager)
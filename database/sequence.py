@@ -0,0 +1,37 @@
+import threading
+from .async_crud import AsyncDatabaseManager, async_db_manager
+
+class MessageSequence:
+    """Единый источник ID сообщений.
+
+    Инициализируется один раз из базы данных при старте, дальше ID
+    выдаются из памяти без запросов. Уникальность дополнительно
+    гарантируется индексом на messages.message_id.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager):
+        self.db = db
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    async def seed(self):
+        """Загрузить последний ID из базы данных"""
+        last_id = await self.db.get_last_message_id()
+        with self._lock:
+            self.last_id = max(self.last_id, last_id)
+
+    def observe(self, message_id: int):
+        """Учесть ID, выданный другим воркером"""
+        with self._lock:
+            if message_id > self.last_id:
+                self.last_id = message_id
+
+    def allocate(self, count: int = 1) -> int:
+        """Выделить count последовательных ID и вернуть первый из них"""
+        with self._lock:
+            first_id = self.last_id + 1
+            self.last_id += count
+        return first_id
+
+# Глобальная последовательность ID сообщений
+message_sequence = MessageSequence(async_db_manager)
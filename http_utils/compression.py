@@ -0,0 +1,48 @@
+import gzip
+from typing import List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен - доступен только gzip
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+
+def available_encodings() -> tuple:
+    """Кодировки в порядке предпочтения"""
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+def accepted_encodings(accept_encoding: Optional[str]) -> List[str]:
+    """Доступные кодировки, которые принимает клиент, в порядке предпочтения"""
+    if not accept_encoding:
+        return []
+
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    return [
+        encoding for encoding in available_encodings()
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0
+    ]
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбрать кодировку по заголовку Accept-Encoding"""
+    encodings = accepted_encodings(accept_encoding)
+    return encodings[0] if encodings else None
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Сжать данные выбранной кодировкой; best - максимальное сжатие
+    для заранее сжимаемых файлов"""
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
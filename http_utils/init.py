@@ -0,0 +1,9 @@
+from .compression import choose_encoding, compress
+from .response_cache import ResponseCache, make_etag, response_cache
+from .static_files import PrecompressedStaticFiles, precompress
+
+__all__ = [
+    "choose_encoding", "compress",
+    "ResponseCache", "make_etag", "response_cache",
+    "PrecompressedStaticFiles", "precompress",
+]
\ No newline at end of file
@@ -0,0 +1,133 @@
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+from config import config
+from .compression import choose_encoding, compress
+
+def make_etag(*parts: Any) -> str:
+    """Слабый ETag из частей версии данных"""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def http_date(value: datetime) -> str:
+    """Дата в формате HTTP; наивные даты считаются UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+def is_not_modified(headers: Headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Проверить If-None-Match, а при его отсутствии If-Modified-Since"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def render_json(content: Any) -> bytes:
+    """JSON так же, как его сериализует JSONResponse"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+class CachedBody:
+    """Сериализованное тело ответа и его сжатые варианты"""
+
+    def __init__(self, etag: str, last_modified: Optional[datetime], data: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.data = data
+        self._encoded: Dict[str, bytes] = {}
+
+    def variant(self, encoding: Optional[str], min_bytes: int) -> Tuple[bytes, Optional[str]]:
+        """Тело в кодировке encoding; маленькие тела не сжимаются"""
+        if encoding is None or len(self.data) < min_bytes:
+            return self.data, None
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = self._encoded[encoding] = compress(self.data, encoding)
+        return encoded, encoding
+
+class ResponseCache:
+    """Кэш сериализованных JSON ответов с условными запросами.
+
+    Запись хранит тело, собранное при определенном ETag, и его
+    gzip/br варианты. Когда ETag меняется (новое сообщение), запись
+    считается устаревшей и пересобирается при следующем запросе;
+    клиент с актуальным ETag получает 304 без тела.
+    """
+
+    def __init__(self, max_entries: int = config.HTTP_RESPONSE_CACHE_ENTRIES,
+                 min_compress_bytes: int = config.HTTP_COMPRESS_MIN_BYTES):
+        self.max_entries = max_entries
+        self.min_compress_bytes = min_compress_bytes
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable, etag: str) -> Optional[CachedBody]:
+        """Тело для key, если оно собрано при том же ETag"""
+        body = self._entries.get(key)
+        if body is None or body.etag != etag:
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: Hashable, body: CachedBody):
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Сбросить все записи"""
+        self._entries.clear()
+
+    async def respond(self, request: Request, key: Hashable, etag: str,
+                      last_modified: Optional[datetime],
+                      build: Callable[[], Awaitable[Any]]) -> Response:
+        """Ответить 304, закэшированным телом или собрать тело через build"""
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(last_modified)
+
+        if is_not_modified(request.headers, etag, last_modified):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        body = self.get(key, etag)
+        if body is None:
+            self.misses += 1
+            body = CachedBody(etag, last_modified, render_json(await build()))
+            self.put(key, body)
+        else:
+            self.hits += 1
+
+        content, encoding = body.variant(choose_encoding(request.headers.get("accept-encoding")), self.min_compress_bytes)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(content=content, media_type="application/json", headers=headers)
+
+    def get_stats(self) -> dict:
+        """Статистика кэша"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified
+        }
+
+# Кэш ответов read эндпоинтов
+response_cache = ResponseCache()
@@ -0,0 +1,99 @@
+import mimetypes
+import os
+import sys
+from typing import Optional
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+from config import config
+from .compression import BROTLI, GZIP, accepted_encodings, brotli, compress
+
+# Расширения заранее сжатых вариантов
+PRECOMPRESSED_SUFFIXES = {BROTLI: ".br", GZIP: ".gz"}
+
+# Файлы, которые имеет смысл сжимать
+COMPRESSIBLE_SUFFIXES = (".html", ".css", ".js", ".json", ".svg", ".txt", ".map")
+
+# Страницы: их адреса не версионируются, поэтому браузер проверяет их
+# при каждом открытии (no-cache + ETag/Last-Modified), а не держит
+# старую версию STATIC_CACHE_MAX_AGE секунд после обновления
+REVALIDATE_SUFFIXES = (".html",)
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Статика с долгим кэшированием (кроме страниц) и заранее сжатыми вариантами.
+
+    Если рядом с файлом лежит file.br или file.gz и клиент принимает эту
+    кодировку, отдается сжатый вариант с исходным типом содержимого.
+    """
+
+    def __init__(self, *args, max_age: int = config.STATIC_CACHE_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+
+    @staticmethod
+    def _precompressed(full_path: str, accept_encoding: Optional[str]) -> Optional[tuple]:
+        """Первый существующий сжатый вариант, который примет клиент"""
+        for encoding in accepted_encodings(accept_encoding):
+            variant_path = full_path + PRECOMPRESSED_SUFFIXES[encoding]
+            try:
+                return variant_path, os.stat(variant_path), encoding
+            except OSError:
+                continue
+        return None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        revalidate = full_path.endswith(REVALIDATE_SUFFIXES)
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+
+        encoding = None
+        variant = self._precompressed(full_path, request_headers.get("accept-encoding"))
+        if variant is not None:
+            full_path, stat_result, encoding = variant
+
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result,
+            method=scope["method"], media_type=media_type
+        )
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache" if revalidate else f"public, max-age={self.max_age}"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+def precompress(directory: str) -> int:
+    """Создать .gz (и .br, если доступен brotli) для статических файлов.
+
+    Пропускает файлы, у которых сжатые варианты новее исходника.
+    Возвращает количество записанных файлов.
+    """
+    written = 0
+    encodings = [GZIP] + ([BROTLI] if brotli is not None else [])
+
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            mtime = os.stat(path).st_mtime
+            for encoding in encodings:
+                target = path + PRECOMPRESSED_SUFFIXES[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime >= mtime:
+                    continue
+                with open(path, "rb") as source:
+                    data = compress(source.read(), encoding, best=True)
+                with open(target, "wb") as output:
+                    output.write(data)
+                written += 1
+
+    return written
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "/app/static"
+    print(f"✅ Сжато файлов: {precompress(directory)}")
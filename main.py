@@ -1,16 +1,36 @@
 import asyncio
+import csv
+import io
 import json
+import time
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from typing import List, Optional
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import config
-from database.crud import db_manager
-from database.models import MessageCreate
-from message_processing.formatter import message_formatter
-from websocket_manager.connection_manager import connection_manager
+from database.archive import message_archive
+from database.async_crud import async_db_manager
+from database.message_cache import message_cache
+from database.retention import retention_manager
+from database.search import message_search
+from database.sequence import message_sequence
+from http_utils.response_cache import make_etag, response_cache
+from http_utils.static_files import PrecompressedStaticFiles
+from message_processing.message_service import message_service
+from message_processing.payload_encoder import payload_encoder
+from message_processing.pipeline import ingest_pipeline
+from message_processing.render_cache import render_cache
+from monitoring.metrics import MESSAGES_RECEIVED, POLL_WAIT_SECONDS, metrics_registry
+from monitoring.middleware import RequestMetricsMiddleware
+from monitoring.profiler import loop_profiler
+from websocket_manager.connection_manager import ConnectionManager, connection_manager
+from websocket_manager.event_stream import EventStream
+from websocket_manager.message_notifier import message_notifier
+from websocket_manager.payload_profile import DEFAULT_PROFILE, SSE, PayloadProfile
+from websocket_manager.shards import websocket_shards
+from rabbitmq_client.publisher import message_publisher
 from rabbitmq_client.rabbitmq_handler import rabbitmq_handler
 
 # Создаем FastAPI приложение
@@ -28,6 +48,54 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
+
+def all_connection_managers() -> List[ConnectionManager]:
+    """Менеджер основного loop и менеджеры шардов"""
+    return [connection_manager] + [shard.manager for shard in websocket_shards.shards]
+
+def queue_depths() -> List[int]:
+    """Глубины очередей отправки всех клиентов"""
+    return [
+        client.depth
+        for manager in all_connection_managers()
+        for client in list(manager.active_connections.values())
+    ]
+
+def connections_by_loop() -> dict:
+    """Количество соединений основного loop и каждого шарда"""
+    counts = {("main",): connection_manager.get_active_count()}
+    for shard in websocket_shards.shards:
+        counts[(f"shard-{shard.index}",)] = len(shard.manager.active_connections)
+    return counts
+
+# Мгновенные значения для /metrics
+metrics_registry.gauge(
+    "board_websocket_connections", "Открытые WebSocket соединения по loop",
+    connections_by_loop, ("loop",))
+metrics_registry.gauge(
+    "board_websocket_queued_frames", "Кадры в очередях отправки всех клиентов",
+    lambda: sum(queue_depths()))
+metrics_registry.gauge(
+    "board_websocket_max_queue_depth", "Самая длинная очередь отправки клиента",
+    lambda: max(queue_depths(), default=0))
+metrics_registry.gauge(
+    "board_websocket_dropped_frames", "Кадры, выброшенные политикой переполнения",
+    lambda: sum(manager.dropped_total for manager in all_connection_managers()))
+metrics_registry.gauge(
+    "board_amqp_backlog", "Полученные из RabbitMQ сообщения, ждущие обработки",
+    lambda: rabbitmq_handler.incoming.qsize() if rabbitmq_handler.incoming is not None else 0)
+metrics_registry.gauge(
+    "board_pipeline_queue_depth", "Пачки в очереди этапа конвейера приема",
+    ingest_pipeline.depths, ("stage",))
+metrics_registry.gauge(
+    "board_publisher_buffered", "Сообщения в буфере публикации, ждущие подтверждения брокера",
+    lambda: message_publisher.buffered)
+metrics_registry.gauge(
+    "board_poll_waiting", "Клиенты long polling, ждущие сообщений",
+    message_notifier.get_waiting_count)
+metrics_registry.gauge(
+    "board_last_message_id", "Последний ID сообщения", lambda: message_notifier.last_id)
 
 # Инициализация при старте
 @app.on_event("startup")
@@ -37,17 +105,38 @@ async def startup_event():
     print("🚀 Запуск Message Display Server")
     print("=" * 60)
     
-    # Подключаемся к RabbitMQ
-    if await rabbitmq_handler.connect():
-        # Запускаем consumer в фоне
-        asyncio.create_task(rabbitmq_handler.consume_messages())
+    # Загружаем последние сообщения в кэш и последний ID
+    await message_cache.load()
+    await message_sequence.seed()
+    message_notifier.last_id = message_sequence.last_id
+    
+    loop_profiler.start()
+    if loop_profiler.sampling:
+        print(f"🔬 Профилировщик event loop включен: зависания > {config.PROFILER_STALL_MS} мс")
+    
+    # Подключаемся к RabbitMQ и запускаем consumer в фоне; если брокер
+    # недоступен, подключение повторяется, а публикация копит буфер
+    rabbitmq_handler.start()
+    
+    if config.WEBSOCKET_SHARDS > 0:
+        websocket_shards.start(shard_app)
+    
+    if retention_manager.enabled:
+        asyncio.create_task(retention_manager.run_forever())
+    
+    # Доиндексация старых сообщений для поиска
+    asyncio.create_task(message_search.run_backfill())
     
     print(f"🌐 Web интерфейс:      http://localhost:8050")
     print(f"🔌 WebSocket:          ws://localhost:{config.WEBSOCKET_PORT}/ws")
+    if websocket_shards.enabled:
+        print(f"🧩 WebSocket шарды:    ws://localhost:{config.WEBSOCKET_SHARD_PORT}/ws")
     print(f"🔄 Polling API:        http://localhost:8050/poll?last_id=0")
     print(f"📋 Messages API:       http://localhost:8050/messages?limit=20")
     print(f"🐇 RabbitMQ сервер:    {config.RABBITMQ_HOST}")
     print(f"📊 RabbitMQ очередь:   {config.RABBITMQ_QUEUE}")
+    if config.SCALE_OUT:
+        print(f"🔀 Scale-out обменник:  {config.RABBITMQ_FANOUT_EXCHANGE}")
     print("=" * 60)
     print("✅ Сервер запущен и готов к работе!")
     print("=" * 60)
@@ -56,13 +145,34 @@ async def startup_event():
 async def shutdown_event():
     """Очистка при завершении работы"""
     await rabbitmq_handler.close()
+    websocket_shards.stop()
+    loop_profiler.stop()
+    async_db_manager.close()
     print("👋 Сервер завершает работу")
 
 # WebSocket endpoint
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint для реального времени"""
-    await connection_manager.connect(websocket)
+def deflate_offered(websocket: WebSocket) -> bool:
+    """Клиент предложил permessage-deflate при подключении"""
+    return config.WEBSOCKET_PER_MESSAGE_DEFLATE and \
+        "permessage-deflate" in websocket.headers.get("sec-websocket-extensions", "")
+
+async def serve_websocket(websocket: WebSocket, manager: ConnectionManager):
+    """Обслуживать WebSocket клиента через менеджер соединений.
+    
+    Профиль выдачи задается параметрами подключения ?fields=&format=
+    или командой profile:{"fields": [...], "format": "msgpack"}.
+    """
+    profile_error = None
+    try:
+        profile = PayloadProfile.parse(
+            websocket.query_params.get("fields"), websocket.query_params.get("format")
+        )
+    except ValueError as e:
+        profile, profile_error = DEFAULT_PROFILE, str(e)
+    
+    await manager.connect(websocket, profile)
+    if profile_error:
+        await manager.send_personal_message({"type": "error", "detail": profile_error}, websocket)
     
     try:
         while True:
@@ -70,87 +180,358 @@ async def websocket_endpoint(websocket: WebSocket):
             
             # Обработка служебных сообщений
             if data == "ping":
-                await connection_manager.send_personal_message(
+                await manager.send_personal_message(
                     {"type": "pong", "timestamp": datetime.now().isoformat()},
                     websocket
                 )
             elif data.startswith("subscribe:"):
-                channel = data.split(":")[1]
-                await connection_manager.subscribe_to_channel(channel, websocket)
-                await connection_manager.send_personal_message(
+                channel = data.partition(":")[2]
+                await manager.subscribe_to_channel(channel, websocket)
+                await manager.send_personal_message(
                     {"type": "subscribed", "channel": channel},
                     websocket
                 )
+            elif data.startswith("resume:"):
+                try:
+                    last_id = int(data.partition(":")[2])
+                except ValueError:
+                    await manager.send_personal_message(
+                        {"type": "error", "detail": "resume expects an integer last_id"},
+                        websocket
+                    )
+                    continue
+                await message_service.replay(websocket, last_id, manager)
+            elif data.startswith("profile:"):
+                try:
+                    options = json.loads(data.partition(":")[2])
+                    if not isinstance(options, dict):
+                        raise ValueError("profile expects a JSON object")
+                    profile = PayloadProfile.parse(options.get("fields"), options.get("format"))
+                except ValueError as e:
+                    await manager.send_personal_message(
+                        {"type": "error", "detail": f"invalid profile: {e}"},
+                        websocket
+                    )
+                    continue
+                manager.set_profile(websocket, profile)
+                await manager.send_personal_message(
+                    {"type": "profile", **profile.describe(), "deflate": deflate_offered(websocket)},
+                    websocket
+                )
+            elif data.startswith("unsubscribe:"):
+                channel = data.partition(":")[2]
+                await manager.unsubscribe_from_channel(channel, websocket)
+                await manager.send_personal_message(
+                    {"type": "unsubscribed", "channel": channel},
+                    websocket
+                )
                     
     except WebSocketDisconnect:
-        connection_manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(websocket)
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """WebSocket endpoint для реального времени"""
+    await serve_websocket(websocket, connection_manager)
+
+# Приложение шардов: только /ws, клиенты в ConnectionManager своего шарда
+shard_app = FastAPI(title="Message Display Server WebSocket shard")
+
+@shard_app.websocket("/ws")
+async def shard_websocket_endpoint(websocket: WebSocket):
+    """WebSocket endpoint шарда"""
+    await serve_websocket(websocket, websocket_shards.current().manager)
 
 # REST API endpoints
+# Статика с долгим кэшированием и заранее сжатыми вариантами
+static_files = PrecompressedStaticFiles(directory="/app/static")
+
 @app.get("/")
-async def read_index():
+async def read_index(request: Request):
     """Главная страница"""
-    return FileResponse('/app/static/index.html')
+    return await static_files.get_response("index.html", request.scope)
+
+async def read_validators():
+    """ETag и Last-Modified текущего состояния ленты сообщений"""
+    last_message = await message_cache.get_last_message()
+    etag = make_etag(render_cache.version, message_notifier.last_id, retention_manager.generation)
+    return etag, last_message.timestamp if last_message else None
 
 @app.get("/api/messages")
-async def get_recent_messages(limit: int = 20):
+async def get_recent_messages(request: Request, limit: int = 20, channel: Optional[str] = None):
     """Получить последние сообщения (JSON API)"""
-    messages = db_manager.get_recent_messages(limit)
+    async def build():
+        messages = await message_cache.get_recent_messages(limit, channel)
+        return {
+            "messages": [
+                message_service.to_payload(msg)
+                for msg in messages
+            ],
+            "last_id": message_notifier.last_id,
+            "total": len(messages)
+        }
     
-    return {
-        "messages": [
-            {
-                "id": msg.message_id,
-                "formatted": msg.formatted_message,
-                "raw": msg.message,
-                "timestamp": msg.timestamp.isoformat()
-            }
-            for msg in messages
-        ],
-        "last_id": db_manager.get_last_message_id(),
-        "total": len(messages)
-    }
+    etag, last_modified = await read_validators()
+    return await response_cache.respond(request, ("messages", limit, channel), etag, last_modified, build)
+
+def parse_profile(fields: Optional[str], format: Optional[str]) -> PayloadProfile:
+    """Профиль выдачи из параметров запроса"""
+    try:
+        return PayloadProfile.parse(fields, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/poll")
-async def poll_messages(last_id: int = 0):
+async def poll_messages(last_id: int = 0, channel: Optional[str] = None,
+                        fields: Optional[str] = None, format: Optional[str] = None):
     """Long polling endpoint для старых клиентов"""
-    messages = db_manager.get_messages_since(last_id)
+    profile = parse_profile(fields, format)
+    
+    messages = []
+    if message_notifier.last_id > last_id:
+        messages = await message_cache.get_messages_since(last_id, channel, config.HISTORY_PAGE_MAX + 1)
     
-    # Если сообщений нет, ждем некоторое время (long polling)
+    # Если новых сообщений нет, ждем их появления (long polling)
     if not messages:
-        await asyncio.sleep(config.POLLING_TIMEOUT)
-        messages = db_manager.get_messages_since(last_id)
+        started = time.perf_counter()
+        arrived = await message_notifier.wait_for_messages(last_id, config.POLLING_TIMEOUT, channel)
+        POLL_WAIT_SECONDS.observe(time.perf_counter() - started, "message" if arrived else "timeout")
+        if arrived:
+            messages = await message_cache.get_messages_since(last_id, channel, config.HISTORY_PAGE_MAX + 1)
+    
+    # Запрошено на одно больше: ответ обрезан по HISTORY_PAGE_MAX -
+    # продолжать с последнего выданного
+    has_more = len(messages) > config.HISTORY_PAGE_MAX
+    if has_more:
+        messages = messages[:config.HISTORY_PAGE_MAX]
+    result = {
+        "last_id": messages[-1].message_id if has_more else message_notifier.last_id,
+        "has_more": has_more,
+        "timestamp": datetime.now().isoformat()
+    }
+    if profile.is_binary:
+        result["messages"] = [profile.project(message_service.to_payload(msg)) for msg in messages]
+        return Response(content=profile.dumps(result), media_type=profile.media_type)
+    encoder = payload_encoder(profile.fields)
+    return Response(content=encoder.encode_page(encoder.encode_messages(messages), result),
+                    media_type="application/json")
+
+@app.get("/api/stream")
+async def stream_messages(request: Request, last_id: Optional[int] = None,
+                          channel: Optional[str] = None, fields: Optional[str] = None):
+    """Server-Sent Events: живой поток сообщений через ту же рассылку, что и /ws.
+    
+    channel - каналы через запятую (без него - весь поток). Заголовок
+    Last-Event-ID (EventSource шлет его при переподключении) или
+    last_id - догнать пропущенные сообщения кадром replay, как resume
+    у WebSocket. Кадры - те же JSON, что и у WebSocket, в поле data.
+    """
+    profile = PayloadProfile(parse_profile(fields, None).fields, SSE)
+    
+    resume_from = request.headers.get("last-event-id") or last_id
+    if resume_from is not None:
+        try:
+            resume_from = int(resume_from)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an integer")
+    
+    stream = EventStream(request)
+    await connection_manager.connect(stream, profile)
+    for name in (channel or "").split(","):
+        if name.strip():
+            await connection_manager.subscribe_to_channel(name.strip(), stream)
+    if resume_from is not None:
+        await message_service.replay(stream, resume_from)
+    
+    async def events():
+        try:
+            async for event in stream.events(config.SSE_RETRY_MS, config.SSE_KEEPALIVE_SECONDS):
+                yield event
+        finally:
+            connection_manager.disconnect(stream)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # nginx не должен буферизовать поток
+        "X-Accel-Buffering": "no"
+    })
+
+def page_limit(limit: int) -> int:
+    """Размер страницы в пределах [1, HISTORY_PAGE_MAX]"""
+    return max(1, min(limit, config.HISTORY_PAGE_MAX))
+
+@app.get("/api/history")
+async def get_history(before_id: Optional[int] = None, after_id: Optional[int] = None,
+                      limit: int = 100, channel: Optional[str] = None,
+                      since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      fields: Optional[str] = None):
+    """История сообщений по курсору.
+    
+    Без курсора - последние сообщения, before_id - страница старше
+    него, after_id - страница новее него. Сообщения всегда по
+    возрастанию ID; before_id/after_id ответа - курсоры соседних страниц.
+    fields - поля сообщений через запятую (id выдается всегда).
+    
+    Страница из базы читается кортежами только нужных столбцов и
+    сериализуется сразу в JSON, без объектов Message.
+    """
+    limit = page_limit(limit)
+    encoder = payload_encoder(parse_profile(fields, None).fields)
+    # Запрашиваем на одно больше, чтобы узнать, есть ли еще
+    cached = message_cache.get_cached_page(after_id, before_id, limit + 1, channel, since, until)
+    if cached is not None:
+        items = encoder.encode_messages(cached)
+    else:
+        items = encoder.encode_rows(await async_db_manager.get_payload_rows(
+            encoder.fields, render_cache.version, after_id, before_id, limit + 1, channel, since, until
+        ))
+    
+    # Старше базы - архив удержания
+    if message_archive.files:
+        if after_id is None and len(items) <= limit:
+            older = await message_archive.get_messages_page_async(
+                None, items[0][0] if items else before_id,
+                limit + 1 - len(items), channel, since, until
+            )
+            items = encoder.encode_messages(older) + items
+        elif after_id is not None and after_id < message_archive.last_id:
+            archived = await message_archive.get_messages_page_async(
+                after_id, before_id, limit + 1, channel, since, until
+            )
+            items = (encoder.encode_messages(archived) + items)[:limit + 1]
+    
+    has_more = len(items) > limit
+    if has_more:
+        items = items[:limit] if after_id is not None else items[1:]
+    
+    return Response(content=encoder.encode_page(items, {
+        "before_id": items[0][0] if items else before_id,
+        "after_id": items[-1][0] if items else after_id,
+        "has_more": has_more,
+        "limit": limit
+    }), media_type="application/json")
+
+@app.get("/api/search")
+async def search_messages(q: str, limit: int = 20, channel: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          order: str = "rank", cursor: Optional[str] = None, raw: bool = False):
+    """Полнотекстовый поиск.
+    
+    order=rank - по релевантности, order=recent - от новых к старым.
+    Все слова запроса обязательны, слово* - поиск по префиксу, raw=true
+    включает синтаксис FTS5 (OR, NOT, "фразы", NEAR). next_cursor ответа
+    передается в cursor для следующей страницы.
+    """
+    if not message_search.enabled:
+        raise HTTPException(status_code=503, detail="Поиск недоступен")
+    
+    limit = max(1, min(limit, config.SEARCH_PAGE_MAX))
+    try:
+        page = await message_search.search(q, limit, channel, since, until, order, cursor, raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
-        "messages": [
-            {
-                "id": msg.message_id,
-                "formatted": msg.formatted_message,
-                "raw": msg.message,
-                "timestamp": msg.timestamp.isoformat()
-            }
-            for msg in messages
+        "results": [
+            {**message_service.to_payload(hit.message), "snippet": hit.snippet, "score": hit.score}
+            for hit in page.hits
         ],
-        "last_id": db_manager.get_last_message_id(),
-        "timestamp": datetime.now().isoformat()
+        "next_cursor": page.next_cursor,
+        "has_more": page.next_cursor is not None,
+        "limit": limit
     }
 
+@app.get("/api/export")
+async def export_messages(format: str = "ndjson", after_id: int = 0, before_id: Optional[int] = None,
+                          channel: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          fields: Optional[str] = None):
+    """Потоковая выгрузка истории в NDJSON или CSV.
+    
+    База читается страницами по EXPORT_PAGE_SIZE, так что память не
+    зависит от объема выгрузки. Сообщения, пришедшие после начала
+    выгрузки, в нее не попадают. fields - поля через запятую (столбцы CSV).
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    encoder = payload_encoder(parse_profile(fields, None).fields)
+    
+    upper = message_notifier.last_id + 1
+    before_id = upper if before_id is None else min(before_id, upper)
+    
+    async def pages():
+        cursor = after_id
+        while True:
+            messages = await async_db_manager.get_messages_page(
+                cursor, before_id, config.EXPORT_PAGE_SIZE, channel, since, until
+            )
+            if not messages:
+                return
+            yield [message_service.to_payload(msg) for msg in messages]
+            if len(messages) < config.EXPORT_PAGE_SIZE:
+                return
+            cursor = messages[-1].message_id
+    
+    async def ndjson():
+        # Строки базы сразу в JSON, без Message и словарей
+        cursor = after_id
+        while True:
+            items = encoder.encode_rows(await async_db_manager.get_payload_rows(
+                encoder.fields, render_cache.version, cursor, before_id,
+                config.EXPORT_PAGE_SIZE, channel, since, until
+            ))
+            if not items:
+                return
+            yield "".join(text + "\n" for _, text in items)
+            if len(items) < config.EXPORT_PAGE_SIZE:
+                return
+            cursor = items[-1][0]
+    
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, encoder.fields, extrasaction="ignore")
+        writer.writeheader()
+        async for payloads in pages():
+            writer.writerows(payloads)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    
+    if format == "csv":
+        return StreamingResponse(
+            csv_rows(), media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="messages.csv"'}
+        )
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.get("/api/last")
-async def get_last_message_api():
+async def get_last_message_api(request: Request):
     """Получить последнее сообщение"""
-    last_message = db_manager.get_last_message()
+    async def build():
+        last_message = await message_cache.get_last_message()
+        
+        if not last_message:
+            return {
+                "message": "No messages yet",
+                "id": 0
+            }
+        
+        return message_service.to_payload(last_message)
     
-    if not last_message:
-        return {
-            "message": "No messages yet",
-            "id": 0
-        }
+    etag, last_modified = await read_validators()
+    return await response_cache.respond(request, ("last",), etag, last_modified, build)
+
+def ingest_via_broker() -> bool:
+    """Принятые по HTTP сообщения идут через входящую очередь брокера.
     
-    return {
-        "id": last_message.message_id,
-        "formatted": last_message.formatted_message,
-        "raw": last_message.message,
-        "timestamp": last_message.timestamp.isoformat()
-    }
+    В SCALE_OUT ID назначает единственный активный потребитель очереди,
+    с HTTP_INGEST_VIA_BROKER запрос не ждет форматирования и записи.
+    """
+    return config.SCALE_OUT or config.HTTP_INGEST_VIA_BROKER
 
 @app.post("/api/messages")
 async def create_message(message: dict):
@@ -158,28 +539,16 @@ async def create_message(message: dict):
     if "message" not in message:
         raise HTTPException(status_code=400, detail="Message is required")
     
-    message_text = message["message"]
-    formatted = message_formatter.format_message(message_text)
-    
-    # Получаем новый ID
-    new_id = db_manager.get_last_message_id() + 1
-    
-    # Создаем сообщение
-    message_data = MessageCreate(
-        message=message_text,
-        formatted_message=formatted,
-        message_id=new_id
-    )
+    MESSAGES_RECEIVED.inc(1, "http")
+    if ingest_via_broker():
+        if not message_publisher.publish(message["message"], message.get("channel")):
+            raise HTTPException(status_code=503, detail="Message broker unavailable")
+        return {
+            "status": "queued",
+            "timestamp": datetime.now().isoformat()
+        }
     
-    saved_message = db_manager.create_message(message_data)
-    
-    # Отправляем через WebSocket
-    await connection_manager.broadcast({
-        "id": saved_message.message_id,
-        "formatted": saved_message.formatted_message,
-        "raw": saved_message.message,
-        "timestamp": saved_message.timestamp.isoformat()
-    })
+    saved_message = await message_service.save_message(message["message"], message.get("channel"))
     
     return {
         "id": saved_message.message_id,
@@ -187,32 +556,148 @@ async def create_message(message: dict):
         "timestamp": saved_message.timestamp.isoformat()
     }
 
+def parse_batch_body(body: bytes, content_type: str) -> list:
+    """Элементы пачки: JSON массив, {"messages": [...]} или NDJSON"""
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        data = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("messages")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Expected an array of messages")
+    return data
+
+def batch_item_error(item) -> Optional[str]:
+    """Причина отказа для элемента пачки или None"""
+    if isinstance(item, str):
+        return None
+    if not isinstance(item, dict) or not isinstance(item.get("message"), str):
+        return "Message is required"
+    if item.get("channel") is not None and not isinstance(item["channel"], str):
+        return "Channel must be a string"
+    return None
+
+@app.post("/api/messages/batch")
+async def create_messages_batch(request: Request):
+    """Создать пачку сообщений одним запросом.
+    
+    Тело - JSON массив (или {"messages": [...]}) либо NDJSON
+    (Content-Type: application/x-ndjson); элемент - строка или
+    {"message": ..., "channel": ...}. Корректные элементы получают
+    непрерывный диапазон ID, сохраняются одной транзакцией и уходят
+    клиентам одним кадром batch; results - итог по каждому элементу.
+    """
+    items = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(items) > config.HTTP_BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is limited to {config.HTTP_BATCH_MAX_MESSAGES} messages"
+        )
+    
+    results: List[Optional[dict]] = [None] * len(items)
+    accepted, texts, channels = [], [], []
+    for index, item in enumerate(items):
+        error = batch_item_error(item)
+        if error is not None:
+            results[index] = {"index": index, "status": "error", "detail": error}
+            continue
+        if isinstance(item, str):
+            item = {"message": item}
+        accepted.append(index)
+        texts.append(item["message"])
+        channels.append(item.get("channel") or config.DEFAULT_CHANNEL)
+    
+    MESSAGES_RECEIVED.inc(len(texts), "http")
+    if ingest_via_broker():
+        for index, text, channel in zip(accepted, texts, channels):
+            queued = message_publisher.publish(text, channel)
+            results[index] = (
+                {"index": index, "status": "queued"} if queued
+                else {"index": index, "status": "error", "detail": "Message broker unavailable"}
+            )
+        saved_messages = []
+    else:
+        saved_messages = await message_service.save_messages(texts, channels)
+        for index, saved_message in zip(accepted, saved_messages):
+            results[index] = {"index": index, "id": saved_message.message_id, "status": "created"}
+    
+    rejected = sum(1 for result in results if result["status"] == "error")
+    return {
+        "status": "ok" if not rejected else "partial",
+        "accepted": len(items) - rejected,
+        "rejected": rejected,
+        "first_id": saved_messages[0].message_id if saved_messages else None,
+        "last_id": saved_messages[-1].message_id if saved_messages else None,
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/api/status")
 async def get_status():
     """Получить статус сервера"""
     return {
         "status": "running",
-        "websocket_connections": connection_manager.get_active_count(),
+        "websocket_connections": connection_manager.get_active_count() + websocket_shards.get_active_count(),
         "rabbitmq_connected": rabbitmq_handler.is_connected,
-        "last_message_id": db_manager.get_last_message_id(),
+        "last_message_id": message_notifier.last_id,
+        "websocket_queues": connection_manager.get_stats(),
+        "websocket_shards": await websocket_shards.get_stats(),
+        "render_cache": render_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "retention": await retention_manager.get_stats(),
+        "search": await message_search.get_stats(),
+        "publisher": message_publisher.get_stats(),
+        "pipeline": ingest_pipeline.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/profile")
+async def get_profile(format: str = "json", reset: bool = False):
+    """Где event loop провел зависания (нужен PROFILER_ENABLED).
+    
+    format=folded - стеки в свернутом формате для flamegraph.pl/speedscope.
+    reset=true - обнулить накопленные выборки после ответа.
+    """
+    if format == "folded":
+        response = PlainTextResponse(loop_profiler.render_folded())
+    else:
+        response = loop_profiler.get_stats()
+    if reset:
+        loop_profiler.reset()
+    return response
+
+@app.get("/api/connections")
+async def get_connections():
+    """Статистика очередей отправки по каждому WebSocket клиенту"""
+    return {
+        "connections": connection_manager.get_client_stats(),
+        "total": connection_manager.get_stats()
+    }
+
 # Монтируем статические файлы
-app.mount("/static", StaticFiles(directory="/app/static"), name="static")
+app.mount("/static", static_files, name="static")
 
 # Для обратной совместимости
 @app.get("/messages")
-async def get_messages_legacy(limit: int = 20):
+async def get_messages_legacy(request: Request, limit: int = 20, channel: Optional[str] = None):
     """Legacy endpoint для обратной совместимости"""
-    return await get_recent_messages(limit)
+    return await get_recent_messages(request, limit, channel)
 
 @app.get("/poll")
-async def poll_legacy(last_id: int = 0):
+async def poll_legacy(last_id: int = 0, channel: Optional[str] = None,
+                      fields: Optional[str] = None, format: Optional[str] = None):
     """Legacy polling endpoint"""
-    return await poll_messages(last_id)
+    return await poll_messages(last_id, channel, fields, format)
 
 @app.get("/last")
-async def last_legacy():
+async def last_legacy(request: Request):
     """Legacy last message endpoint"""
-    return await get_last_message_api()
\ No newline at end of file
+    return await get_last_message_api(request)
\ No newline at end of file
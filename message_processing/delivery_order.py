@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+class DeliveryOrder:
+    """Доставка сохраненных сообщений строго по возрастанию ID.
+
+    ID выделяются непрерывными диапазонами, а запись и рассылка разных
+    путей приема (конвейер, HTTP, сохранение по одному сообщению) идут
+    конкурентно. Каждый диапазон встает в очередь в момент выделения
+    ID (reserve), и его доставка (turn) ждет, пока доставлены или
+    пропущены (release) все предыдущие. Так кэш, long polling и клиенты
+    видят сообщения без обгонов.
+    """
+
+    def __init__(self):
+        # Очередь последнего выделенного диапазона
+        self._last: Optional[asyncio.Future] = None
+        # Первый ID диапазона -> (очередь предыдущего, своя очередь)
+        self._turns: Dict[int, Tuple[Optional[asyncio.Future], asyncio.Future]] = {}
+
+    def reserve(self, first_id: int):
+        """Поставить в очередь диапазон, ID которого только что выделены"""
+        turn = asyncio.get_running_loop().create_future()
+        self._turns[first_id] = (self._last, turn)
+        self._last = turn
+
+    def release(self, first_id: int):
+        """Диапазон доставлен не будет (запись не удалась): следующие его не ждут"""
+        previous, turn = self._turns.pop(first_id, (None, None))
+        if turn is not None:
+            self._pass(previous, turn)
+
+    @asynccontextmanager
+    async def turn(self, first_id: int) -> AsyncIterator[None]:
+        """Дождаться доставки предыдущих диапазонов; по выходе очередь
+        переходит к следующему"""
+        previous, turn = self._turns.pop(first_id, (None, None))
+        try:
+            if previous is not None and not previous.done():
+                await asyncio.shield(previous)
+            yield
+        finally:
+            if turn is not None:
+                self._pass(previous, turn)
+
+    @staticmethod
+    def _pass(previous: Optional[asyncio.Future], turn: asyncio.Future):
+        """Завершить очередь диапазона, как только завершена предыдущая"""
+        def finish(_=None):
+            if not turn.done():
+                turn.set_result(None)
+
+        if previous is None or previous.done():
+            finish()
+        else:
+            previous.add_done_callback(finish)
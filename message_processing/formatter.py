@@ -2,106 +2,141 @@ import re
 from typing import List
 from .math_processor import MathProcessor
 
+# Маркеры списков, проверяются только от начала строки
+_BULLET_RE = re.compile(r'[\-\*\•]\s+')
+_NUMBERED_RE = re.compile(r'\d+\.\s+')
+_BULLET_CHARS = '-*•'
+_HEADER_PREFIXES = ('# ', '## ', '### ')
+
+# Inline элементы
+_STRONG_RE = re.compile(r'\*\*(.*?)\*\*')
+_EM_RE = re.compile(r'\*(.*?)\*')
+_CODE_RE = re.compile(r'`([^`]+)`')
+_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+
 class MessageFormatter:
-    """Форматировщик сообщений"""
-    
+    """Форматировщик сообщений
+
+    Каждая строка классифицируется один раз по первому символу,
+    регулярные выражения запускаются только для строк и фрагментов,
+    в которых они могут совпасть.
+    """
+
+    # Увеличивать при любом изменении выходного HTML
+    version = 1
+
     def __init__(self):
         self.math_processor = MathProcessor()
-    
+
     def format_message(self, text: str) -> str:
         """Отформатировать сообщение"""
         if not text:
             return text
-        
+
         # Обработка математических выражений
         text = self.math_processor.process_math_expressions(text)
-        
-        result = []
-        lines = text.split('\n')
+
+        result: List[str] = []
+        append = result.append
+        escape_html = self.math_processor.escape_html
+        format_inline = self._format_inline
         in_list = False
         in_code = False
         in_term = False
         list_type = 'ul'
-        
-        for line in lines:
+
+        for line in text.split('\n'):
             line = line.rstrip()
-            
-            is_header = line.startswith('# ') or line.startswith('## ') or line.startswith('### ')
-            is_list_item = re.match(r'^[\-\*\•]\s+', line) or re.match(r'^\d+\.\s+', line)
-            is_code_block = line.strip().startswith('```')
-            is_term_line = line.strip().startswith('$ ') or line.strip().startswith('> ')
-            is_empty = line.strip() == ''
-            
-            if is_code_block:
+            stripped = line.lstrip()
+            lead = stripped[:1]
+
+            if lead == '`' and stripped.startswith('```'):
                 in_code = not in_code
-                result.append(f'<div class="code-block">' if in_code else '</div>')
+                append('<div class="code-block">' if in_code else '</div>')
                 continue
-            
+
             if in_code:
-                safe_line = self.math_processor.escape_html(line)
-                result.append(f'<span class="code-line">{safe_line}</span><br>')
+                append(f'<span class="code-line">{escape_html(line)}</span><br>')
                 continue
-            
+
+            is_term_line = (lead == '$' or lead == '>') and stripped[1:2] == ' '
+
+            first = line[:1]
+            is_header = first == '#' and line.startswith(_HEADER_PREFIXES)
+            list_match = None
+            is_ordered = False
+            if first and first in _BULLET_CHARS:
+                list_match = _BULLET_RE.match(line)
+            elif first.isdecimal():
+                list_match = _NUMBERED_RE.match(line)
+                is_ordered = True
+
             if is_term_line and not in_term:
                 in_term = True
-                result.append('<div class="terminal">')
+                append('<div class="terminal">')
             elif not is_term_line and in_term:
                 in_term = False
-                result.append('</div>')
-            
-            if is_list_item and not in_list:
+                append('</div>')
+
+            if list_match and not in_list:
                 in_list = True
-                list_type = 'ol' if re.match(r'^\d+\.\s+', line) else 'ul'
-                result.append(f'<{list_type} class="message-list">')
-            elif not is_list_item and in_list:
+                list_type = 'ol' if is_ordered else 'ul'
+                append(f'<{list_type} class="message-list">')
+            elif not list_match and in_list:
                 in_list = False
-                result.append('</ul>' if list_type == 'ul' else '</ol>')
-            
-            safe_line = self.math_processor.escape_html(line)
-            
+                append(f'</{list_type}>')
+
             if is_header:
-                level = len(line.split()[0])
+                level = line.index(' ')
                 content = line[level:].strip()
-                result.append(f'<h{level} class="message-header">{content}</h{level}>')
-            
-            elif is_list_item:
-                content = re.sub(r'^[\-\*\•]\s+', '', line)
-                content = re.sub(r'^\d+\.\s+', '', content)
-                result.append(f'<li class="message-list-item">{self._format_inline(content)}</li>')
-            
+                append(f'<h{level} class="message-header">{content}</h{level}>')
+
+            elif list_match:
+                content = line[list_match.end():]
+                if not is_ordered:
+                    # "- 1. текст" - снимаем и номер после маркера
+                    numbered_match = _NUMBERED_RE.match(content)
+                    if numbered_match:
+                        content = content[numbered_match.end():]
+                append(f'<li class="message-list-item">{format_inline(content)}</li>')
+
             elif is_term_line:
-                content = line[2:].strip() if line.startswith('$ ') else line[2:].strip()
-                result.append(f'<div class="terminal-line"><span class="prompt">$</span> {self._format_inline(content)}</div>')
-            
-            elif is_empty:
-                result.append('<div class="empty-line"><br></div>')
-            
+                content = line[2:].strip()
+                append(f'<div class="terminal-line"><span class="prompt">$</span> {format_inline(content)}</div>')
+
+            elif not stripped:
+                append('<div class="empty-line"><br></div>')
+
+            elif in_term:
+                append(f'<div class="terminal-output">{format_inline(line)}</div>')
             else:
-                if in_term:
-                    result.append(f'<div class="terminal-output">{self._format_inline(line)}</div>')
-                else:
-                    result.append(f'<div class="message-line">{self._format_inline(line)}</div>')
-        
+                append(f'<div class="message-line">{format_inline(line)}</div>')
+
         # Закрываем незакрытые блоки
         if in_list:
-            result.append('</ul>' if list_type == 'ul' else '</ol>')
+            append(f'</{list_type}>')
         if in_term:
-            result.append('</div>')
-        
+            append('</div>')
+
         return '\n'.join(result)
-    
+
     def _format_inline(self, text: str) -> str:
         """Форматирование inline элементов"""
-        # Жирный текст
-        text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
-        # Курсив
-        text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', text)
+        if '*' in text:
+            # Жирный текст
+            if '**' in text:
+                text = _STRONG_RE.sub(r'<strong>\1</strong>', text)
+            # Курсив
+            if '*' in text:
+                text = _EM_RE.sub(r'<em>\1</em>', text)
         # Код inline
-        text = re.sub(r'`([^`]+)`', r'<code class="inline-code">\1</code>', text)
+        if '`' in text:
+            text = _CODE_RE.sub(r'<code class="inline-code">\1</code>', text)
         # Ссылки
-        text = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2" class="message-link">\1</a>', text)
-        
+        if '](' in text:
+            text = _LINK_RE.sub(r'<a href="\2" class="message-link">\1</a>', text)
+
         return text
 
 # Синглтон форматировщика
-message_formatter = MessageFormatter()
\ No newline at end of file
+message_formatter = MessageFormatter()
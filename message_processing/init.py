@@ -1,4 +1,9 @@
 from .math_processor import MathProcessor
 from .formatter import MessageFormatter, message_formatter
+from .render_cache import RenderCache, render_cache
+from .delivery_order import DeliveryOrder
+from .message_service import MessageService, message_service
+from .pipeline import IngestPipeline, PipelineBatch, ingest_pipeline
 
-__all__ = ["MathProcessor", "MessageFormatter", "message_formatter"]
\ No newline at end of file
+__all__ = ["MathProcessor", "MessageFormatter", "message_formatter", "RenderCache", "render_cache", "DeliveryOrder", "MessageService", "message_service",
+           "IngestPipeline", "PipelineBatch", "ingest_pipeline"]
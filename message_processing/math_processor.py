@@ -1,48 +1,46 @@
 import re
 import html
 
+# Подстановки применяются строго по порядку: результат предыдущей
+# может участвовать в следующей (например, \sqrt внутри \left( \right)).
+# Для каждой указан фрагмент, без которого шаблон не может совпасть.
+_MATH_RULES = [
+    # Дроби: \frac{a}{b}
+    ('\\frac{', re.compile(r'\\frac\{([^}]+)\}\{([^}]+)\}'),
+     r'<span class="math-frac"><span class="numerator">\1</span><span class="denominator">\2</span></span>'),
+    # Скобки: \left( content \right)
+    ('\\left(', re.compile(r'\\left\(([^)]+)\\right\)'),
+     r'<span class="math-brackets">(\1)</span>'),
+    # Инлайн математика: \( content \)
+    ('\\(', re.compile(r'\\\(([^)]+)\\\)'),
+     r'<span class="math-inline">\1</span>'),
+    # Корни: \sqrt{content}
+    ('\\sqrt{', re.compile(r'\\sqrt\{([^}]+)\}'),
+     r'√<span class="math-root">{\1}</span>'),
+    # Степени: a^{b}
+    ('^{', re.compile(r'([a-zA-Z0-9])\^\{([^}]+)\}'),
+     r'\1<sup>\2</sup>'),
+    # Индексы: a_{b}
+    ('_{', re.compile(r'([a-zA-Z0-9])\_\{([^}]+)\}'),
+     r'\1<sub>\2</sub>'),
+]
+
 class MathProcessor:
     """Обработчик математических выражений"""
-    
+
     @staticmethod
     def process_math_expressions(text: str) -> str:
         """Обработать математические выражения в тексте"""
         if not text:
             return text
-        
-        # Обработка дробей: \frac{a}{b}
-        text = re.sub(r'\\frac\{([^}]+)\}\{([^}]+)\}', 
-                     r'<span class="math-frac"><span class="numerator">\1</span><span class="denominator">\2</span></span>', 
-                     text)
-        
-        # Обработка скобок: \left( content \right)
-        text = re.sub(r'\\left\(([^)]+)\\right\)', 
-                     r'<span class="math-brackets">(\1)</span>', 
-                     text)
-        
-        # Обработка инлайн математики: \( content \)
-        text = re.sub(r'\\\(([^)]+)\\\)', 
-                     r'<span class="math-inline">\1</span>', 
-                     text)
-        
-        # Обработка корней: \sqrt{content}
-        text = re.sub(r'\\sqrt\{([^}]+)\}', 
-                     r'√<span class="math-root">{\1}</span>', 
-                     text)
-        
-        # Обработка степеней: a^{b}
-        text = re.sub(r'([a-zA-Z0-9])\^\{([^}]+)\}', 
-                     r'\1<sup>\2</sup>', 
-                     text)
-        
-        # Обработка индексов: a_{b}
-        text = re.sub(r'([a-zA-Z0-9])\_\{([^}]+)\}', 
-                     r'\1<sub>\2</sub>', 
-                     text)
-        
+
+        for marker, pattern, replacement in _MATH_RULES:
+            if marker in text:
+                text = pattern.sub(replacement, text)
+
         return text
-    
+
     @staticmethod
     def escape_html(text: str) -> str:
         """Экранировать HTML-символы"""
-        return html.escape(text)
\ No newline at end of file
+        return html.escape(text)
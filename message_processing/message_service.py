@@ -0,0 +1,245 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import WebSocket
+from config import config
+from database.async_crud import async_db_manager
+from database.message_cache import message_cache
+from database.models import Message, MessageCreate
+from database.sequence import message_sequence
+from monitoring.metrics import MESSAGE_FAILURES, MESSAGE_STAGE_SECONDS
+from websocket_manager.connection_manager import ConnectionManager, connection_manager
+from websocket_manager.message_notifier import message_notifier
+from websocket_manager.shards import websocket_shards
+from .delivery_order import DeliveryOrder
+from .render_cache import render_cache
+
+class MessageService:
+    """Сохранение новых сообщений и рассылка их клиентам
+
+    Если задан distributor (режим SCALE_OUT), сохраненные сообщения
+    передаются ему, а локальная доставка происходит, когда копия
+    возвращается через deliver.
+    """
+
+    def __init__(self):
+        self.distributor: Optional[Callable[[List[Message]], Awaitable[None]]] = None
+        # Порядок доставки диапазонов ID всех путей приема
+        self.delivery_order = DeliveryOrder()
+
+    @staticmethod
+    def render(message: Message) -> str:
+        """HTML сообщения; сохраненные старой версией форматировщика
+        перерисовываются лениво через кэш"""
+        if message.formatter_version == render_cache.version:
+            return message.formatted_message
+        return render_cache.render(message.message)
+
+    def to_payload(self, message: Message) -> dict:
+        """Преобразовать сообщение в формат для клиентов"""
+        return {
+            "id": message.message_id,
+            "formatted": self.render(message),
+            "raw": message.message,
+            "channel": message.channel,
+            "timestamp": message.timestamp.isoformat()
+        }
+
+    async def save_message(self, message_text: str, channel: Optional[str] = None) -> Message:
+        """Отформатировать, сохранить и разослать одно сообщение"""
+        saved_messages = await self.save_messages([message_text], [channel or config.DEFAULT_CHANNEL])
+        return saved_messages[0]
+
+    async def save_messages(self, message_texts: List[str],
+                            channels: Optional[List[str]] = None) -> List[Message]:
+        """Отформатировать, сохранить одной транзакцией и разослать сообщения.
+
+        ID выделяются непрерывным диапазоном в порядке поступления.
+        channels - канал для каждого сообщения, по умолчанию DEFAULT_CHANNEL.
+        """
+        if not message_texts:
+            return []
+
+        with MESSAGE_STAGE_SECONDS.time("format"):
+            formatted_messages = [render_cache.render(text) for text in message_texts]
+        saved_messages = await self.persist(message_texts, formatted_messages, channels, render_cache.version)
+        await self.publish(saved_messages)
+        return saved_messages
+
+    @staticmethod
+    def format_messages(message_texts: List[str]) -> List[Optional[str]]:
+        """HTML сообщений по одному; None - сообщение, которое
+        форматировщик не смог обработать (непригодное, повтор не поможет)"""
+        formatted_messages = []
+        for text in message_texts:
+            try:
+                formatted_messages.append(render_cache.render(text))
+            except Exception as e:
+                print(f"❌ Сообщение не удалось отформатировать: {e}")
+                MESSAGE_FAILURES.inc(1, "message")
+                formatted_messages.append(None)
+        return formatted_messages
+
+    async def persist_with_retry(self, message_texts: List[str], formatted_messages: List[Optional[str]],
+                                 channels: List[str], formatter_version: int) -> List[Message]:
+        """Сохранить сообщения одной транзакцией, повторяя запись с
+        растущей паузой, пока она не пройдет (ошибки базы считаются
+        временными). Непригодные сообщения (formatted None) пропускаются.
+        """
+        kept = [i for i, formatted in enumerate(formatted_messages) if formatted is not None]
+        if not kept:
+            return []
+        message_texts = [message_texts[i] for i in kept]
+        formatted_messages = [formatted_messages[i] for i in kept]
+        channels = [channels[i] for i in kept]
+
+        delay = config.INGEST_RETRY_SECONDS
+        while True:
+            try:
+                return await self.persist(message_texts, formatted_messages, channels, formatter_version)
+            except Exception as e:
+                print(f"⚠️ Не удалось сохранить пачку из {len(message_texts)} сообщ., "
+                      f"повтор через {delay:g} с: {e}")
+                MESSAGE_FAILURES.inc(1, "batch")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, config.INGEST_RETRY_MAX_SECONDS)
+
+    async def persist(self, message_texts: List[str], formatted_messages: List[str],
+                      channels: Optional[List[str]], formatter_version: int) -> List[Message]:
+        """Выделить непрерывный диапазон ID и сохранить отформатированные
+        сообщения одной транзакцией"""
+        if channels is None:
+            channels = [config.DEFAULT_CHANNEL] * len(message_texts)
+
+        first_id = message_sequence.allocate(len(message_texts))
+        self.delivery_order.reserve(first_id)
+        messages_data = [
+            MessageCreate(
+                message=text,
+                formatted_message=formatted,
+                message_id=first_id + i,
+                formatter_version=formatter_version,
+                channel=channel
+            )
+            for i, (text, formatted, channel) in enumerate(zip(message_texts, formatted_messages, channels))
+        ]
+
+        try:
+            with MESSAGE_STAGE_SECONDS.time("db_insert"):
+                return await async_db_manager.create_messages(messages_data)
+        except BaseException:
+            self.delivery_order.release(first_id)
+            raise
+
+    async def publish(self, saved_messages: List[Message]):
+        """Передать сохраненные сообщения распределителю или доставить локально.
+
+        Диапазоны передаются строго по возрастанию ID: каждый ждет, пока
+        переданы все выделенные раньше (delivery_order). Сообщения уже в
+        базе, поэтому ошибка передачи не выходит наружу (иначе пачку
+        приняли бы повторно): попытка повторяется через
+        DELIVERY_RETRY_SECONDS, пока не пройдет, а следующие диапазоны ждут.
+        """
+        async with self.delivery_order.turn(saved_messages[0].message_id):
+            with MESSAGE_STAGE_SECONDS.time("broadcast"):
+                while True:
+                    try:
+                        if self.distributor is not None:
+                            await self.distributor(saved_messages)
+                        else:
+                            await self.deliver(saved_messages)
+                        return
+                    except Exception as e:
+                        print(f"⚠️ Не удалось разослать сообщения #{saved_messages[0].message_id}-"
+                              f"#{saved_messages[-1].message_id}, повтор через "
+                              f"{config.DELIVERY_RETRY_SECONDS} с: {e}")
+                        MESSAGE_FAILURES.inc(1, "delivery")
+                        await asyncio.sleep(config.DELIVERY_RETRY_SECONDS)
+
+    async def deliver(self, messages: List[Message], replica: bool = False):
+        """Сделать сохраненные сообщения видимыми: кэш, long polling, WebSocket.
+
+        replica - копии, пришедшие от воркера, который их сохранил.
+        """
+        if replica:
+            # Повторная доставка из брокера
+            messages = [msg for msg in messages if msg.message_id > message_notifier.last_id]
+            if not messages:
+                return
+            if config.SCALE_OUT_STORE_REPLICAS:
+                await async_db_manager.store_replicas(messages)
+            message_sequence.observe(messages[-1].message_id)
+
+        channel_ids: Dict[str, int] = {}
+        for message in messages:
+            message_cache.add(message)
+            channel_ids[message.channel] = message.message_id
+        message_notifier.notify(messages[-1].message_id, channel_ids)
+
+        await self.broadcast(messages)
+
+    @staticmethod
+    def make_frame(payloads: List[dict]) -> dict:
+        """Одно сообщение отправляется как есть, несколько - кадром batch"""
+        if len(payloads) == 1:
+            return payloads[0]
+        return {"type": "batch", "messages": payloads}
+
+    async def broadcast(self, messages: List[Message]):
+        """Разослать сообщения WebSocket клиентам с маршрутизацией по каналам"""
+        payloads = [self.to_payload(msg) for msg in messages]
+        frame = self.make_frame(payloads)
+
+        by_channel: Dict[str, List[dict]] = {}
+        for msg, payload in zip(messages, payloads):
+            by_channel.setdefault(msg.channel, []).append(payload)
+
+        if len(by_channel) == 1:
+            channel_frames = {channel: frame for channel in by_channel}
+        else:
+            channel_frames = {channel: self.make_frame(items) for channel, items in by_channel.items()}
+
+        await connection_manager.publish(frame, channel_frames)
+        websocket_shards.publish(frame, channel_frames)
+
+    async def get_missed_payloads(self, last_id: int,
+                                  channels: Set[str]) -> Tuple[List[dict], Optional[int]]:
+        """Сообщения каналов channels (всех, если пусто) с ID больше last_id.
+
+        Просматривается не больше HISTORY_PAGE_MAX сообщений. Второе
+        значение - ID, до которого выборка полная, если за ним есть еще
+        сообщения (их клиент дочитывает через /api/history), иначе None.
+        """
+        limit = config.HISTORY_PAGE_MAX
+        if len(channels) == 1:
+            messages = await message_cache.get_messages_since(last_id, next(iter(channels)), limit + 1)
+        else:
+            messages = await message_cache.get_messages_since(last_id, None, limit + 1)
+        truncated_at = messages[limit - 1].message_id if len(messages) > limit else None
+        messages = messages[:limit]
+        if len(channels) > 1:
+            messages = [msg for msg in messages if msg.channel in channels]
+        return [self.to_payload(msg) for msg in messages], truncated_at
+
+    async def replay(self, websocket: WebSocket, last_id: int,
+                     manager: ConnectionManager = connection_manager):
+        """Догнать переподключившегося клиента: пропущенные после last_id
+        сообщения его каналов уходят одним кадром replay, затем клиент
+        переходит на живую доставку"""
+        client = manager.pause(websocket)
+        if client is None:
+            return
+
+        try:
+            # Из шарда выборка идет в основном loop, владеющем кэшем
+            payloads, truncated_at = await websocket_shards.run_in_main(
+                self.get_missed_payloads(last_id, set(client.channels))
+            )
+        except Exception as e:
+            print(f"❌ Ошибка выборки пропущенных сообщений: {e}")
+            manager.abort_resume(websocket, "resume failed")
+            return
+
+        manager.resume(websocket, last_id, payloads, truncated_at)
+
+# Синглтон сервиса сообщений
+message_service = MessageService()
@@ -0,0 +1,93 @@
+import json
+from json.encoder import encode_basestring
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from database.models import Message
+from .render_cache import render_cache
+
+# Сообщение, уже сериализованное в JSON объект, и его ID
+EncodedMessage = Tuple[int, str]
+
+def _string(value: Optional[str]) -> str:
+    return "null" if value is None else encode_basestring(value)
+
+class PayloadEncoder:
+    """Сериализация сообщений в JSON без промежуточных объектов.
+
+    Строки базы (кортежи из DatabaseManager.get_payload_rows) и
+    сообщения из кэша сразу превращаются в текст JSON объектов с
+    выбранными полями, минуя Message, словари и jsonable_encoder.
+    Результат совпадает с json.dumps(payload, ensure_ascii=False) в
+    компактной форме, как у JSONResponse.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self._keys = [f"{encode_basestring(field)}:" for field in self.fields]
+
+    def encode_rows(self, rows: Iterable[tuple]) -> List[EncodedMessage]:
+        """Кортежи get_payload_rows в JSON; id - первый столбец"""
+        fields, keys = self.fields, self._keys
+        encoded = []
+        for row in rows:
+            parts = []
+            column = 0
+            for field, key in zip(fields, keys):
+                value = row[column]
+                column += 1
+                if field == "id":
+                    parts.append(f"{key}{value}")
+                    continue
+                if field == "formatted":
+                    stale_source = row[column]
+                    column += 1
+                    if stale_source is not None:
+                        value = render_cache.render(stale_source)
+                elif field == "timestamp" and value:
+                    value = value.replace(" ", "T", 1)
+                parts.append(key + _string(value))
+            encoded.append((row[0], "{" + ",".join(parts) + "}"))
+        return encoded
+
+    def encode_messages(self, messages: Iterable[Message]) -> List[EncodedMessage]:
+        """Сообщения кэша или архива в JSON"""
+        version = render_cache.version
+        fields, keys = self.fields, self._keys
+        encoded = []
+        for message in messages:
+            parts = []
+            for field, key in zip(fields, keys):
+                if field == "id":
+                    parts.append(f"{key}{message.message_id}")
+                    continue
+                if field == "formatted":
+                    value = (message.formatted_message if message.formatter_version == version
+                             else render_cache.render(message.message))
+                elif field == "raw":
+                    value = message.message
+                elif field == "channel":
+                    value = message.channel
+                else:
+                    value = message.timestamp.isoformat()
+                parts.append(key + _string(value))
+            encoded.append((message.message_id, "{" + ",".join(parts) + "}"))
+        return encoded
+
+    @staticmethod
+    def encode_page(items: Sequence[EncodedMessage], extra: dict, key: str = "messages") -> bytes:
+        """Тело ответа: {key: [сообщения], ...extra}"""
+        head = f'{{{encode_basestring(key)}:[{",".join(text for _, text in items)}]'
+        if not extra:
+            return (head + "}").encode()
+        tail = json.dumps(extra, ensure_ascii=False, separators=(",", ":"))
+        return (head + "," + tail[1:]).encode()
+
+# Кодировщики по набору полей
+_encoders: Dict[Tuple[str, ...], PayloadEncoder] = {}
+
+def payload_encoder(fields: Sequence[str]) -> PayloadEncoder:
+    """Кодировщик для набора полей (создается один раз на набор)"""
+    fields = tuple(fields)
+    encoder = _encoders.get(fields)
+    if encoder is None:
+        encoder = _encoders[fields] = PayloadEncoder(fields)
+    return encoder
@@ -0,0 +1,231 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+from config import config
+from monitoring.metrics import MESSAGE_FAILURES, MESSAGE_PIPELINE_SECONDS, MESSAGE_STAGE_SECONDS
+from .formatter import message_formatter
+from .message_service import message_service
+from .render_cache import render_cache
+
+def format_in_process(text: str) -> str:
+    """Форматирование в процессе пула (без кэша родителя)"""
+    return message_formatter.format_message(text)
+
+class PipelineBatch(NamedTuple):
+    """Пачка сообщений на входе конвейера.
+
+    settle вызывается после сохранения пачки, в порядке поступления, с
+    результатами форматирования: сообщения с None (непригодные - их не
+    удалось отформатировать) отклоняются, остальные подтверждаются.
+    """
+    texts: List[str]
+    channels: List[str]
+    settle: Callable[[List[Optional[str]]], Awaitable[None]]
+    received: float
+
+class IngestPipeline:
+    """Конвейер приема: форматирование -> ID и запись -> рассылка.
+
+    Этапы связаны ограниченными очередями. Форматирование пачек идет
+    параллельно в пуле потоков по числу ядер, сообщения длиннее
+    PIPELINE_PROCESS_MIN_BYTES уходят в пул процессов, так что тяжелая
+    разметка не останавливает event loop. Этап записи ждет результаты
+    форматирования в порядке поступления, выделяет ID и сохраняет пачку
+    одной транзакцией, поэтому порядок ID совпадает с порядком в
+    очереди брокера. Если запись не прошла, этап повторяет ее на месте
+    с уже готовой разметкой, пока она не пройдет, и следующую пачку не
+    берет. Рассылка - отдельный этап со своей очередью;
+    message_service.publish передает диапазоны по возрастанию ID вместе
+    с сообщениями, сохраненными в обход конвейера, и повторяет
+    неудачную передачу, так что подтвержденные сообщения не теряются.
+
+    Пачка подтверждается брокеру только после записи и постановки в
+    очередь рассылки, поэтому все неподтвержденные сообщения - это
+    сообщения внутри конвейера. prefetch канала равен емкости конвейера
+    (capacity): когда этапы заполнены, брокер перестает присылать
+    сообщения, и очередь растет в RabbitMQ, а не в памяти процесса.
+    """
+
+    def __init__(self):
+        self.workers = config.PIPELINE_FORMAT_WORKERS or os.cpu_count() or 1
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._format_queue: Optional[asyncio.Queue] = None
+        self._persist_queue: Optional[asyncio.Queue] = None
+        self._broadcast_queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.offloaded = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def capacity(self) -> int:
+        """Сколько сообщений конвейер держит неподтвержденными при полных очередях"""
+        # Очереди этапов плюс пачка, которую обрабатывает каждый этап
+        batches = config.PIPELINE_QUEUE_SIZE * 3 + 3
+        return batches * config.RABBITMQ_BATCH_SIZE
+
+    def start(self):
+        if self.running:
+            return
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="formatter")
+        self._format_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        self._persist_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        self._broadcast_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        self._tasks = [
+            asyncio.create_task(self._format_stage()),
+            asyncio.create_task(self._persist_stage()),
+            asyncio.create_task(self._broadcast_stage()),
+        ]
+        print(f"🏭 Конвейер приема: форматирование в {self.workers} потоках, "
+              f"очереди этапов по {config.PIPELINE_QUEUE_SIZE} пачек")
+
+    async def submit(self, batch: PipelineBatch):
+        """Поставить пачку в конвейер; ждет, пока в очереди форматирования есть место"""
+        await self._format_queue.put(batch)
+
+    def _format_texts(self, texts: List[str]) -> Tuple[List[Optional[str]], List[int]]:
+        """Форматирование в потоке пула; большие сообщения (их индексы -
+        второй результат) и непригодные остаются None"""
+        limit = config.PIPELINE_PROCESS_MIN_BYTES
+        large = [i for i, text in enumerate(texts) if limit and len(text) >= limit]
+        formatted: List[Optional[str]] = [None] * len(texts)
+        offloaded = set(large)
+        small = [i for i in range(len(texts)) if i not in offloaded]
+        for i, html in zip(small, message_service.format_messages([texts[i] for i in small])):
+            formatted[i] = html
+        return formatted, large
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            # fork: дочерний процесс получает уже импортированный форматировщик,
+            # не импортируя приложение заново; форматировщик не берет блокировок
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+        return self._processes
+
+    async def _format(self, texts: List[str]) -> List[Optional[str]]:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        formatted, large = await loop.run_in_executor(self._threads, self._format_texts, texts)
+
+        if large:
+            self.offloaded += len(large)
+            pool = self._process_pool()
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, format_in_process, texts[i]) for i in large
+            ), return_exceptions=True)
+
+            broken = []
+            for i, result in zip(large, results):
+                if isinstance(result, BrokenProcessPool):
+                    broken.append(i)
+                elif isinstance(result, Exception):
+                    print(f"❌ Сообщение не удалось отформатировать: {result}")
+                    MESSAGE_FAILURES.inc(1, "message")
+                else:
+                    formatted[i] = result
+
+            if broken:
+                # Пул пересоздается при следующем большом сообщении, эти форматируем в потоке
+                print("⚠️ Пул процессов форматирования остановился")
+                if self._processes is pool:
+                    self._processes = None
+                    pool.shutdown(wait=False)
+                results = await loop.run_in_executor(
+                    self._threads, message_service.format_messages, [texts[i] for i in broken]
+                )
+                for i, html in zip(broken, results):
+                    formatted[i] = html
+
+        MESSAGE_STAGE_SECONDS.observe(time.perf_counter() - started, "format")
+        return formatted
+
+    async def _format_stage(self):
+        """Запускает форматирование пачек параллельно, передавая дальше
+        задачи в порядке поступления"""
+        while True:
+            batch = await self._format_queue.get()
+            formatting = asyncio.ensure_future(self._format(batch.texts))
+            await self._persist_queue.put((batch, formatting))
+
+    async def _persist_stage(self):
+        while True:
+            batch, formatting = await self._persist_queue.get()
+            try:
+                formatted = await formatting
+            except Exception as e:
+                print(f"❌ Ошибка форматирования пачки из {len(batch.texts)} сообщ.: {e}")
+                MESSAGE_FAILURES.inc(1, "batch")
+                formatted = await asyncio.get_running_loop().run_in_executor(
+                    self._threads, message_service.format_messages, batch.texts
+                )
+
+            # Повторяется на месте, пока запись не пройдет
+            saved_messages = await message_service.persist_with_retry(
+                batch.texts, formatted, batch.channels, render_cache.version
+            )
+            if saved_messages:
+                await self._broadcast_queue.put((batch, saved_messages))
+            await self._settle(batch.settle(formatted))
+
+    async def _broadcast_stage(self):
+        while True:
+            batch, saved_messages = await self._broadcast_queue.get()
+            # Не бросает: неудачная передача повторяется внутри publish
+            await message_service.publish(saved_messages)
+            self.processed += len(saved_messages)
+            MESSAGE_PIPELINE_SECONDS.observe(time.perf_counter() - batch.received)
+            print(f"✅ Сообщения #{saved_messages[0].message_id}-#{saved_messages[-1].message_id} обработаны")
+
+    @staticmethod
+    async def _settle(settlement: Awaitable[None]):
+        # Ошибка ack/nack (канал закрыт) не должна останавливать этап
+        try:
+            await settlement
+        except Exception as e:
+            print(f"⚠️ Ошибка подтверждения пачки: {e}")
+
+    def depths(self) -> dict:
+        """Глубина очередей этапов в пачках"""
+        if not self.running:
+            return {}
+        return {
+            ("format",): self._format_queue.qsize(),
+            ("persist",): self._persist_queue.qsize(),
+            ("broadcast",): self._broadcast_queue.qsize(),
+        }
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "format_workers": self.workers,
+            "queue_size": config.PIPELINE_QUEUE_SIZE,
+            "depths": {labels[0]: depth for labels, depth in self.depths().items()},
+            "capacity": self.capacity,
+            "processed": self.processed,
+            "offloaded_to_processes": self.offloaded
+        }
+
+# Глобальный конвейер приема сообщений
+ingest_pipeline = IngestPipeline()
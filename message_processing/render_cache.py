@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Tuple
+from config import config
+from .formatter import MessageFormatter, message_formatter
+
+class RenderCache:
+    """LRU кэш отформатированных сообщений.
+
+    Ключ - хэш исходного текста и версия форматировщика, поэтому
+    одинаковые сообщения форматируются один раз, а после смены версии
+    старые записи просто перестают совпадать. Размер ограничен и по
+    количеству записей, и по суммарному размеру HTML в байтах UTF-8.
+    """
+
+    def __init__(self, formatter: MessageFormatter, max_entries: int, max_bytes: int):
+        self.formatter = formatter
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Значение - HTML и его размер в байтах UTF-8
+        self._entries: "OrderedDict[Tuple[int, bytes], Tuple[str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def version(self) -> int:
+        """Текущая версия форматировщика"""
+        return self.formatter.version
+
+    def _key(self, text: str) -> Tuple[int, bytes]:
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return self.formatter.version, digest
+
+    def render(self, text: str) -> str:
+        """Получить HTML сообщения из кэша или отформатировать его"""
+        key = self._key(text)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        formatted = self.formatter.format_message(text)
+        size = len(formatted.encode("utf-8", "surrogatepass"))
+        if size > self.max_bytes:
+            return formatted
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (formatted, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+
+        return formatted
+
+    def get_stats(self) -> dict:
+        """Статистика кэша для /api/status"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "formatter_version": self.formatter.version
+        }
+
+# Синглтон кэша форматирования
+render_cache = RenderCache(
+    message_formatter,
+    max_entries=config.RENDER_CACHE_MAX_ENTRIES,
+    max_bytes=config.RENDER_CACHE_MAX_BYTES
+)
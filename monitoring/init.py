@@ -0,0 +1,10 @@
+from .metrics import Counter, Gauge, Histogram, MetricsRegistry, metrics_registry
+from .middleware import RequestMetricsMiddleware
+from .profiler import LoopProfiler, loop_profiler
+
+__all__ = [
+    "Counter", "Gauge", "Histogram",
+    "MetricsRegistry", "metrics_registry",
+    "RequestMetricsMiddleware",
+    "LoopProfiler", "loop_profiler",
+]
@@ -0,0 +1,232 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы корзин по умолчанию, секунды: от 100 мкс до 10 с
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Размеры пачек и кадров
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+class Metric:
+    """Базовая метрика с метками.
+
+    Значения хранятся по кортежу значений меток. Метрики обновляются из
+    потоков шардов и пула базы данных, поэтому изменения идут под
+    блокировкой.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in values
+        ]
+
+class Gauge(Metric):
+    """Мгновенное значение, читаемое функцией в момент выдачи метрик.
+
+    Функция возвращает число или, для метрики с метками, словарь
+    {кортеж значений меток: число}.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], object],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.read = read
+
+    def render(self) -> List[str]:
+        value = self.read()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in values
+        ]
+
+class HistogramChild:
+    """Корзины одной комбинации меток"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами (кумулятивные в выдаче)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], HistogramChild] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = HistogramChild(len(self.buckets) + 1)
+            child.counts[index] += 1
+            child.sum += value
+            child.count += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Замерить длительность блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            children = sorted(
+                (labels, list(child.counts), child.sum, child.count)
+                for labels, child in self._children.items()
+            )
+
+        lines = self.header()
+        for labels, counts, total, count in children:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(self.labelnames + ("le",), labels + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Набор метрик и их выдача в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика уже зарегистрирована: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], object],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, read, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # Сломанный источник gauge не должен ронять всю выдачу
+                print(f"⚠️ Ошибка чтения метрики {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+# Глобальный реестр метрик
+metrics_registry = MetricsRegistry()
+
+# Путь сообщения: прием из AMQP -> форматирование -> запись в базу -> рассылка
+MESSAGES_RECEIVED = metrics_registry.counter(
+    "board_messages_received_total", "Принятые сообщения по источнику", ("source",))
+AMQP_BATCH_SIZE = metrics_registry.histogram(
+    "board_amqp_batch_size", "Размер пачки, собранной из очереди RabbitMQ", buckets=SIZE_BUCKETS)
+MESSAGE_STAGE_SECONDS = metrics_registry.histogram(
+    "board_message_stage_seconds", "Длительность этапа обработки пачки сообщений", ("stage",))
+MESSAGE_PIPELINE_SECONDS = metrics_registry.histogram(
+    "board_message_pipeline_seconds", "От получения пачки из AMQP до рассылки и ack")
+MESSAGE_FAILURES = metrics_registry.counter(
+    "board_message_failures_total", "Пачки и сообщения, обработка которых не удалась", ("kind",))
+
+# Публикация во входящую очередь
+PUBLISHER_MESSAGES = metrics_registry.counter(
+    "board_publisher_messages_total", "Исходы публикации: подтверждено брокером, повтор, отказ буфера", ("result",))
+PUBLISHER_CONFIRM_SECONDS = metrics_registry.histogram(
+    "board_publisher_confirm_seconds", "От отправки окна сообщений до подтверждения всех")
+
+# База данных
+DB_CALL_SECONDS = metrics_registry.histogram(
+    "board_db_call_seconds", "Время выполнения вызова DatabaseManager", ("method",))
+DB_CALL_WAIT_SECONDS = metrics_registry.histogram(
+    "board_db_call_wait_seconds", "Ожидание свободного потока базы данных", ("pool",))
+
+# HTTP и long polling
+HTTP_REQUEST_SECONDS = metrics_registry.histogram(
+    "board_http_request_seconds", "Длительность HTTP запроса", ("method", "route", "status"))
+POLL_WAIT_SECONDS = metrics_registry.histogram(
+    "board_poll_wait_seconds", "Ожидание новых сообщений в long polling", ("result",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+# WebSocket
+WEBSOCKET_SEND_SECONDS = metrics_registry.histogram(
+    "board_websocket_send_seconds", "Отправка одного кадра в сокет")
+WEBSOCKET_EVENTS = metrics_registry.counter(
+    "board_websocket_events_total", "Подключения, отключения и вытеснения сокетов", ("event",))
+
+# Event loop
+EVENT_LOOP_LAG_SECONDS = metrics_registry.histogram(
+    "board_event_loop_lag_seconds", "Опоздание периодического таймера event loop",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
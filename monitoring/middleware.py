@@ -0,0 +1,37 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .metrics import HTTP_REQUEST_SECONDS
+
+class RequestMetricsMiddleware:
+    """Длительность HTTP запросов по шаблону маршрута и статусу.
+
+    Метка route - шаблон пути (/api/history, а не /api/history?...),
+    поэтому число рядов метрики не растет с числом разных URL.
+    WebSocket соединения не замеряются.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            )
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import List, Optional
+from config import config
+from .metrics import EVENT_LOOP_LAG_SECONDS
+
+def collapse_stack(frame: Optional[FrameType], max_depth: int = 64) -> str:
+    """Стек в свернутом формате flamegraph: внешний;...;внутренний"""
+    parts: List[str] = []
+    while frame is not None and len(parts) < max_depth:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+class LoopProfiler:
+    """Наблюдение за задержками event loop.
+
+    Задача-пульс на loop раз в LOOP_MONITOR_INTERVAL_MS отмечается и
+    пишет опоздание таймера в гистограмму board_event_loop_lag_seconds.
+
+    Если включен PROFILER_ENABLED, отдельный поток с интервалом
+    PROFILER_INTERVAL_MS снимает стек потока event loop. Пока пульс
+    опаздывает больше чем на PROFILER_STALL_MS, loop занят синхронным
+    кодом, и снятые стеки засчитываются как зависания: накопленные
+    счетчики показывают, в каком коде loop проводит это время.
+    """
+
+    def __init__(self):
+        self.stall_samples: Counter = Counter()
+        self.samples_total = 0
+        self.stalls_total = 0
+        # Когда пульс должен отметиться в следующий раз
+        self._deadline = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def sampling(self) -> bool:
+        return self._sampler is not None and self._sampler.is_alive()
+
+    def start(self):
+        """Запустить пульс на текущем loop и, если включен, поток выборки"""
+        self._loop_thread_id = threading.get_ident()
+        self._deadline = time.perf_counter() + config.LOOP_MONITOR_INTERVAL_MS / 1000
+        self._task = asyncio.create_task(self._heartbeat())
+        if config.PROFILER_ENABLED:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, name="loop-profiler", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._stop.set()
+
+    async def _heartbeat(self):
+        interval = config.LOOP_MONITOR_INTERVAL_MS / 1000
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            self._deadline = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
+
+    def _sample(self):
+        interval = config.PROFILER_INTERVAL_MS / 1000
+        threshold = config.PROFILER_STALL_MS / 1000
+        in_stall = False
+        while not self._stop.wait(interval):
+            stalled = time.perf_counter() - self._deadline > threshold
+            if not stalled:
+                in_stall = False
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = collapse_stack(frame)
+            with self._lock:
+                self.samples_total += 1
+                if not in_stall:
+                    self.stalls_total += 1
+                self.stall_samples[stack] += 1
+            in_stall = True
+
+    def reset(self):
+        with self._lock:
+            self.stall_samples.clear()
+            self.samples_total = 0
+            self.stalls_total = 0
+
+    def render_folded(self, limit: int = 200) -> str:
+        """Стеки зависаний в свернутом формате (stack count), пригодном
+        для flamegraph.pl и speedscope"""
+        with self._lock:
+            top = self.stall_samples.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in top)
+
+    def get_stats(self, limit: int = 10) -> dict:
+        """Сводка: сколько зависаний и где loop проводил в них время"""
+        interval_ms = config.PROFILER_INTERVAL_MS
+        with self._lock:
+            top = self.stall_samples.most_common(limit)
+            samples, stalls = self.samples_total, self.stalls_total
+        return {
+            "sampling": self.sampling,
+            "interval_ms": interval_ms,
+            "stall_threshold_ms": config.PROFILER_STALL_MS,
+            "stalls": stalls,
+            "stall_samples": samples,
+            "top": [
+                {"stack": stack.split(";")[-5:], "samples": count, "approx_ms": count * interval_ms}
+                for stack, count in top
+            ]
+        }
+
+# Глобальный профилировщик event loop
+loop_profiler = LoopProfiler()
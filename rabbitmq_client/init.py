@@ -1,3 +1,9 @@
+from .memory_broker import MemoryBroker, memory_broker
+from .publisher import MessagePublisher, message_publisher
 from .rabbitmq_handler import RabbitMQHandler, rabbitmq_handler
 
-__all__ = ["RabbitMQHandler", "rabbitmq_handler"]
\ No newline at end of file
+__all__ = [
+    "MemoryBroker", "memory_broker",
+    "MessagePublisher", "message_publisher",
+    "RabbitMQHandler", "rabbitmq_handler",
+]
@@ -0,0 +1,243 @@
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import aio_pika
+
+class MemoryIncomingMessage:
+    """Полученное сообщение с интерфейсом aio_pika.IncomingMessage"""
+
+    def __init__(self, channel: "MemoryChannel", queue: "MemoryQueue", body: bytes,
+                 headers: Optional[dict], routing_key: str, delivery_tag: int, redelivered: bool):
+        self.channel = channel
+        self.queue = queue
+        self.body = body
+        self.headers = headers or {}
+        self.routing_key = routing_key
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+        self.processed = False
+
+    async def ack(self, multiple: bool = False):
+        self.channel._settle(self, multiple, requeue=None)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.channel._settle(self, multiple, requeue=requeue)
+
+    async def reject(self, requeue: bool = False):
+        self.channel._settle(self, False, requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, **kwargs):
+        try:
+            yield self
+        except Exception:
+            if not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+        else:
+            if not self.processed:
+                await self.ack()
+
+class MemoryQueue:
+    """Очередь брокера в памяти"""
+
+    def __init__(self, broker: "MemoryBroker", name: str, arguments: Optional[dict],
+                 auto_delete: bool = False):
+        self.broker = broker
+        self.name = name
+        self.arguments = arguments or {}
+        self.auto_delete = auto_delete
+        self.single_active_consumer = bool(self.arguments.get("x-single-active-consumer"))
+        # (body, headers, routing_key, redelivered)
+        self._messages: Deque[tuple] = deque()
+        self._consumers: List[tuple] = []
+
+    async def consume(self, callback: Callable[[Any], Awaitable[Any]], channel: "MemoryChannel") -> str:
+        tag = f"ctag.{next(self.broker._counter)}"
+        self._consumers.append((tag, channel, callback))
+        self.broker._pump(self)
+        return tag
+
+    async def bind(self, exchange: Any, routing_key: str = ""):
+        name = exchange if isinstance(exchange, str) else exchange.name
+        self.broker.exchanges[name].bindings.append((self, routing_key))
+
+    async def delete(self, **kwargs):
+        self.broker.queues.pop(self.name, None)
+
+    def get_message_count(self) -> int:
+        return len(self._messages)
+
+class _BoundQueue:
+    """Очередь, объявленная через конкретный канал"""
+
+    def __init__(self, queue: MemoryQueue, channel: "MemoryChannel"):
+        self._queue = queue
+        self._channel = channel
+        self.name = queue.name
+
+    async def consume(self, callback: Callable[[Any], Awaitable[Any]], **kwargs) -> str:
+        return await self._queue.consume(callback, self._channel)
+
+    async def bind(self, exchange: Any, routing_key: str = "", **kwargs):
+        await self._queue.bind(exchange, routing_key)
+
+    async def delete(self, **kwargs):
+        await self._queue.delete()
+
+class MemoryExchange:
+    """Обменник: fanout рассылает во все очереди, direct - по ключу"""
+
+    def __init__(self, broker: "MemoryBroker", name: str, type: str):
+        self.broker = broker
+        self.name = name
+        self.type = type
+        self.bindings: List[tuple] = []
+
+    async def publish(self, message: aio_pika.Message, routing_key: str = "", **kwargs):
+        if self.name == "":
+            queue = self.broker.queues.get(routing_key)
+            targets = [queue] if queue else []
+        elif self.type == aio_pika.ExchangeType.FANOUT or self.type == "fanout":
+            targets = [queue for queue, _ in self.bindings]
+        else:
+            targets = [queue for queue, key in self.bindings if key == routing_key]
+
+        for queue in targets:
+            if queue.name in self.broker.queues:
+                queue._messages.append((message.body, dict(message.headers or {}), routing_key, False))
+                self.broker._pump(queue)
+
+class MemoryChannel:
+    """Канал с prefetch и подтверждениями, как в AMQP"""
+
+    def __init__(self, connection: "MemoryConnection"):
+        self.connection = connection
+        self.broker = connection.broker
+        self.default_exchange = self.broker.exchanges[""]
+        self.prefetch_count = 0
+        self.is_closed = False
+        self._delivery_tags = itertools.count(1)
+        self._unacked: Dict[int, MemoryIncomingMessage] = {}
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name: Optional[str] = None, *, durable: bool = False,
+                            exclusive: bool = False, auto_delete: bool = False,
+                            arguments: Optional[dict] = None, **kwargs) -> _BoundQueue:
+        if not name:
+            name = f"amq.gen-{next(self.broker._counter)}"
+        queue = self.broker.queues.get(name)
+        if queue is None:
+            queue = self.broker.queues[name] = MemoryQueue(self.broker, name, arguments, auto_delete)
+        elif arguments is not None and arguments != queue.arguments:
+            raise RuntimeError(f"PRECONDITION_FAILED - inequivalent arguments for queue '{name}'")
+        return _BoundQueue(queue, self)
+
+    async def declare_exchange(self, name: str, type: Any = "direct", **kwargs) -> MemoryExchange:
+        exchange = self.broker.exchanges.get(name)
+        if exchange is None:
+            exchange = self.broker.exchanges[name] = MemoryExchange(self.broker, name, type)
+        return exchange
+
+    def _has_capacity(self) -> bool:
+        return not self.prefetch_count or len(self._unacked) < self.prefetch_count
+
+    def _settle(self, message: MemoryIncomingMessage, multiple: bool, requeue: Optional[bool]):
+        tags = [tag for tag in self._unacked if tag <= message.delivery_tag] if multiple else [message.delivery_tag]
+        settled = [self._unacked.pop(tag) for tag in sorted(tags) if tag in self._unacked]
+        for item in settled:
+            item.processed = True
+
+        if requeue:
+            for item in reversed(settled):
+                item.queue._messages.appendleft((item.body, item.headers, item.routing_key, True))
+
+        for queue in {item.queue for item in settled}:
+            self.broker._pump(queue)
+
+    async def close(self):
+        self.is_closed = True
+        # Возвращаем в очередь с конца, чтобы сохранить порядок
+        for message in reversed(list(self._unacked.values())):
+            self._settle(message, False, requeue=True)
+        # Потребители канала отменяются, auto_delete очереди без них удаляются
+        for queue in list(self.broker.queues.values()):
+            consumers = [c for c in queue._consumers if c[1] is not self]
+            if len(consumers) != len(queue._consumers):
+                queue._consumers = consumers
+                if queue.auto_delete and not consumers:
+                    self.broker.queues.pop(queue.name, None)
+
+class MemoryConnection:
+    """Соединение с брокером в памяти"""
+
+    def __init__(self, broker: "MemoryBroker"):
+        self.broker = broker
+        self.is_closed = False
+        self._channels: List[MemoryChannel] = []
+
+    async def channel(self, **kwargs) -> MemoryChannel:
+        channel = MemoryChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    async def close(self):
+        self.is_closed = True
+        for channel in self._channels:
+            await channel.close()
+        for queue in list(self.broker.queues.values()):
+            queue._consumers = [c for c in queue._consumers if c[1] not in self._channels]
+
+class MemoryBroker:
+    """Брокер сообщений в памяти процесса.
+
+    Подмножество AMQP, которым пользуется RabbitMQHandler: очереди,
+    default/direct/fanout обменники, prefetch, ack/nack (в том числе
+    multiple), повторная доставка и single active consumer. Нужен для
+    локальной проверки и бенчмарков без RabbitMQ
+    (RABBITMQ_BROKER=memory).
+    """
+
+    def __init__(self):
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.exchanges: Dict[str, MemoryExchange] = {"": MemoryExchange(self, "", "direct")}
+        self._counter = itertools.count(1)
+
+    async def connect(self) -> MemoryConnection:
+        return MemoryConnection(self)
+
+    def _pump(self, queue: MemoryQueue):
+        """Раздать сообщения очереди потребителям с учетом prefetch"""
+        consumers = [c for c in queue._consumers if not c[1].is_closed]
+        if queue.single_active_consumer:
+            consumers = consumers[:1]
+        if not consumers:
+            return
+
+        # Раздаем по кругу, пока есть сообщения и свободный prefetch
+        for _, channel, callback in itertools.cycle(consumers):
+            if not queue._messages:
+                break
+            if not channel._has_capacity():
+                if not any(c[1]._has_capacity() for c in consumers):
+                    break
+                continue
+
+            body, headers, routing_key, redelivered = queue._messages.popleft()
+            delivery_tag = next(channel._delivery_tags)
+            message = MemoryIncomingMessage(channel, queue, body, headers, routing_key, delivery_tag, redelivered)
+            channel._unacked[delivery_tag] = message
+            asyncio.get_running_loop().call_soon(self._dispatch, callback, message)
+
+    @staticmethod
+    def _dispatch(callback: Callable[[Any], Awaitable[Any]], message: MemoryIncomingMessage):
+        result = callback(message)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+# Брокер в памяти, общий для процесса
+memory_broker = MemoryBroker()
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, List, NamedTuple, Optional
+import aio_pika
+from pamqp.commands import Basic
+from config import config
+from monitoring.metrics import PUBLISHER_CONFIRM_SECONDS, PUBLISHER_MESSAGES
+
+class PendingMessage(NamedTuple):
+    """Сообщение в локальном буфере публикации"""
+    body: bytes
+    headers: Optional[dict]
+
+class MessagePublisher:
+    """Публикация во входящую очередь через собственный пул каналов.
+
+    Вызывающий код только кладет сообщение в ограниченный локальный
+    буфер. Воркер каждого канала отправляет окно до PUBLISHER_WINDOW
+    сообщений подряд и ждет подтверждений брокера (publisher confirms)
+    для всего окна разом, а не для каждого сообщения по очереди.
+    Неподтвержденные сообщения возвращаются в начало буфера и
+    отправляются снова после паузы, поэтому на время недоступности
+    брокера они копятся в буфере, а доставка - "хотя бы один раз".
+
+    Канал пула выбирается по каналу доски, так что сообщения одного
+    канала доски уходят в брокер в порядке публикации (кроме повторов
+    после частичного отказа).
+
+    Буфер и воркеры запускаются при старте приложения (start) и не
+    зависят от соединения: пока брокер недоступен (в том числе при
+    запуске), сообщения копятся в буфере, а воркеры ждут соединения
+    (attach) и открывают каналы заново, если канал закрылся.
+    """
+
+    def __init__(self):
+        self._connection: Any = None
+        self._connected: Optional[asyncio.Event] = None
+        self._channels: List[Any] = []
+        self._pending: List[Deque[PendingMessage]] = []
+        self._ready: List[asyncio.Event] = []
+        self._tasks: List[asyncio.Task] = []
+        self.buffered = 0
+        self.confirmed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Создать буфер и запустить воркеры каналов пула"""
+        if self.running:
+            return
+        self._connected = asyncio.Event()
+        for index in range(max(1, config.PUBLISHER_CHANNELS)):
+            self._channels.append(None)
+            self._pending.append(deque())
+            self._ready.append(asyncio.Event())
+            self._tasks.append(asyncio.create_task(self._run(index)))
+        print(f"📮 Публикация: каналов {len(self._channels)}, окно {config.PUBLISHER_WINDOW}, "
+              f"буфер {config.PUBLISHER_BUFFER_SIZE}")
+
+    def attach(self, connection: Any):
+        """Передать воркерам соединение с брокером (после объявления очереди)"""
+        self._connection = connection
+        if self._connected is not None:
+            self._connected.set()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected is not None and self._connected.is_set()
+
+    async def _channel(self, index: int) -> Any:
+        """Канал пула; ждет соединения и открывает канал заново, если он закрыт"""
+        while True:
+            channel = self._channels[index]
+            if channel is not None and not channel.is_closed:
+                return channel
+            await self._connected.wait()
+            try:
+                channel = await self._connection.channel(publisher_confirms=True)
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                print(f"⚠️ Не удалось открыть канал публикации, повтор через "
+                      f"{config.PUBLISHER_RETRY_SECONDS} с: {self.last_error}")
+                await asyncio.sleep(config.PUBLISHER_RETRY_SECONDS)
+                continue
+            self._channels[index] = channel
+            return channel
+
+    def publish(self, message: str, channel: Optional[str] = None) -> bool:
+        """Поставить сообщение в буфер публикации.
+
+        False - публикация не запущена или буфер заполнен.
+        """
+        if not self.running or self.buffered >= config.PUBLISHER_BUFFER_SIZE:
+            self.rejected += 1
+            PUBLISHER_MESSAGES.inc(1, "rejected")
+            return False
+
+        headers = {config.RABBITMQ_CHANNEL_HEADER: channel} if channel else None
+        index = hash(channel or config.DEFAULT_CHANNEL) % len(self._pending)
+        self._pending[index].append(PendingMessage(message.encode(), headers))
+        self._ready[index].set()
+        self.buffered += 1
+        return True
+
+    @staticmethod
+    def _is_confirmed(result: Any) -> bool:
+        # Брокер в памяти подтверждений не возвращает
+        return result is None or isinstance(result, Basic.Ack)
+
+    async def _send(self, channel: Any, pending: PendingMessage) -> Any:
+        return await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=pending.body,
+                headers=pending.headers,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            ),
+            routing_key=config.RABBITMQ_QUEUE,
+            timeout=config.PUBLISHER_CONFIRM_TIMEOUT
+        )
+
+    async def _run(self, index: int):
+        """Воркер канала пула: окно публикаций, затем подтверждения всего окна"""
+        pending, ready = self._pending[index], self._ready[index]
+        while True:
+            if not pending:
+                ready.clear()
+                await ready.wait()
+                continue
+
+            channel = await self._channel(index)
+            window = [pending.popleft() for _ in range(min(len(pending), config.PUBLISHER_WINDOW))]
+            started = time.perf_counter()
+            results = await asyncio.gather(
+                *(self._send(channel, item) for item in window), return_exceptions=True
+            )
+            PUBLISHER_CONFIRM_SECONDS.observe(time.perf_counter() - started)
+
+            failed = [item for item, result in zip(window, results) if not self._is_confirmed(result)]
+            confirmed = len(window) - len(failed)
+            self.buffered -= confirmed
+            self.confirmed += confirmed
+            PUBLISHER_MESSAGES.inc(confirmed, "confirmed")
+            if not failed:
+                continue
+
+            # В начало буфера в исходном порядке и повтор после паузы
+            pending.extendleft(reversed(failed))
+            self.retried += len(failed)
+            PUBLISHER_MESSAGES.inc(len(failed), "retried")
+            error = next(result for result in results if not self._is_confirmed(result))
+            self.last_error = str(error) or type(error).__name__
+            print(f"⚠️ Брокер не подтвердил {len(failed)} сообщ., повтор через "
+                  f"{config.PUBLISHER_RETRY_SECONDS} с: {self.last_error}")
+            await asyncio.sleep(config.PUBLISHER_RETRY_SECONDS)
+
+    async def stop(self):
+        """Дождаться отправки буфера (не дольше PUBLISHER_FLUSH_SECONDS) и остановить воркеры"""
+        if not self.running:
+            return
+        deadline = time.monotonic() + config.PUBLISHER_FLUSH_SECONDS
+        while self.buffered and self.connected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.buffered:
+            print(f"⚠️ Не опубликовано при остановке: {self.buffered} сообщ.")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for channel in self._channels:
+            if channel is None:
+                continue
+            try:
+                await channel.close()
+            except Exception:
+                pass
+        self._tasks, self._channels, self._pending, self._ready = [], [], [], []
+        self._connection = self._connected = None
+        self.buffered = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "connected": self.connected,
+            "channels": sum(1 for channel in self._channels if channel is not None),
+            "buffered": self.buffered,
+            "buffer_limit": config.PUBLISHER_BUFFER_SIZE,
+            "confirmed": self.confirmed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "last_error": self.last_error
+        }
+
+# Глобальный публикатор входящей очереди
+message_publisher = MessagePublisher()
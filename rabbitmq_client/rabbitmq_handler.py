@@ -1,33 +1,81 @@
 import asyncio
 import json
+import time
 import aio_pika
-from typing import Optional
+from typing import List, Optional
 from config import config
-from database.crud import db_manager
-from database.models import MessageCreate
-from message_processing.formatter import message_formatter
-from websocket_manager.connection_manager import connection_manager
+from database.models import Message
+from message_processing.message_service import message_service
+from message_processing.pipeline import PipelineBatch, ingest_pipeline
+from message_processing.render_cache import render_cache
+from monitoring.metrics import (
+    AMQP_BATCH_SIZE, MESSAGE_FAILURES, MESSAGE_PIPELINE_SECONDS, MESSAGE_STAGE_SECONDS, MESSAGES_RECEIVED
+)
+from .memory_broker import memory_broker
+from .publisher import message_publisher
 
 class RabbitMQHandler:
-    """Обработчик RabbitMQ"""
+    """Обработчик RabbitMQ
+    
+    В режиме SCALE_OUT входящую очередь читает только один воркер
+    (single active consumer): он назначает ID и сохраняет сообщения, а
+    затем публикует их в fanout обменник. Каждый воркер получает копию
+    через свою эксклюзивную очередь и рассылает ее своим клиентам.
+    """
     
     def __init__(self):
         self.connection: Optional[aio_pika.RobustConnection] = None
         self.channel: Optional[aio_pika.Channel] = None
+        self.replica_channel: Optional[aio_pika.Channel] = None
+        self.fanout_exchange: Optional[aio_pika.Exchange] = None
         self.is_connected = False
         self.last_message_id = 0
+        # Полученные, но еще не взятые в пачку сообщения
+        self.incoming: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def _queue_arguments() -> Optional[dict]:
+        """Аргументы входящей очереди"""
+        if config.SCALE_OUT:
+            return {"x-single-active-consumer": True}
+        return None
+    
+    @staticmethod
+    def prefetch_count() -> int:
+        """prefetch входящей очереди: емкость конвейера, если он включен"""
+        if config.PIPELINE_ENABLED:
+            return ingest_pipeline.capacity
+        return config.RABBITMQ_PREFETCH_COUNT
     
     async def connect(self) -> bool:
         """Подключиться к RabbitMQ"""
         try:
-            self.connection = await aio_pika.connect_robust(
-                config.rabbitmq_connection_string
-            )
+            if config.RABBITMQ_BROKER == "memory":
+                self.connection = await memory_broker.connect()
+            else:
+                self.connection = await aio_pika.connect_robust(
+                    config.rabbitmq_connection_string
+                )
             self.channel = await self.connection.channel()
-            await self.channel.declare_queue(config.RABBITMQ_QUEUE, durable=True)
+            await self.channel.set_qos(prefetch_count=self.prefetch_count())
+            await self.channel.declare_queue(
+                config.RABBITMQ_QUEUE, durable=True, arguments=self._queue_arguments()
+            )
+            
+            if config.SCALE_OUT:
+                self.replica_channel = await self.connection.channel()
+                await self.replica_channel.set_qos(prefetch_count=config.RABBITMQ_PREFETCH_COUNT)
+                self.fanout_exchange = await self.channel.declare_exchange(
+                    config.RABBITMQ_FANOUT_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True
+                )
+                message_service.distributor = self.publish_replicas
+            
+            message_publisher.attach(self.connection)
             
             self.is_connected = True
-            print(f"✅ Подключен к RabbitMQ: {config.RABBITMQ_HOST}")
+            host = "брокер в памяти" if config.RABBITMQ_BROKER == "memory" else config.RABBITMQ_HOST
+            print(f"✅ Подключен к RabbitMQ: {host}")
             return True
             
         except Exception as e:
@@ -35,78 +83,249 @@ class RabbitMQHandler:
             self.is_connected = False
             return False
     
+    def start(self):
+        """Запустить подключение и потребление в фоне"""
+        self._task = asyncio.create_task(self.connect_and_consume())
+    
+    async def connect_and_consume(self):
+        """Подключиться к RabbitMQ (повторяя попытки через
+        RABBITMQ_RECONNECT_SECONDS) и потреблять входящую очередь.
+        
+        Публикатор запускается сразу: пока брокер недоступен, принятые
+        сообщения копятся в его буфере.
+        """
+        message_publisher.start()
+        while not await self.connect():
+            print(f"🔁 Повтор подключения к RabbitMQ через {config.RABBITMQ_RECONNECT_SECONDS} с")
+            await asyncio.sleep(config.RABBITMQ_RECONNECT_SECONDS)
+        await self.consume_messages()
+    
     async def consume_messages(self):
-        """Потреблять сообщения из RabbitMQ"""
+        """Потреблять сообщения из RabbitMQ пачками"""
         if not self.is_connected or not self.channel:
             print("⚠️ Не подключен к RabbitMQ")
             return
         
+        if config.SCALE_OUT:
+            asyncio.create_task(self.consume_replicas())
+        
         try:
-            queue = await self.channel.declare_queue(config.RABBITMQ_QUEUE, durable=True)
+            queue = await self.channel.declare_queue(
+                config.RABBITMQ_QUEUE, durable=True, arguments=self._queue_arguments()
+            )
             
-            async for message in queue:
-                async with message.process():
-                    message_text = message.body.decode()
-                    print(f"📥 Получено из RabbitMQ: {message_text[:100]}...")
-                    
-                    await self.process_message(message_text)
+            incoming: asyncio.Queue = asyncio.Queue()
+            self.incoming = incoming
+            await queue.consume(incoming.put)
+            
+            if config.PIPELINE_ENABLED:
+                ingest_pipeline.start()
+            
+            while True:
+                batch = await self._collect_batch(incoming)
+                print(f"📥 Получено из RabbitMQ: {len(batch)} сообщ.")
+                if config.PIPELINE_ENABLED:
+                    await self.submit_batch(batch)
+                else:
+                    await self.process_batch(batch)
                     
         except Exception as e:
             print(f"❌ Ошибка потребления сообщений: {e}")
             self.is_connected = False
     
-    async def process_message(self, message_text: str):
-        """Обработать сообщение из RabbitMQ"""
-        try:
-            # Получаем последний ID
-            self.last_message_id = db_manager.get_last_message_id()
-            new_message_id = self.last_message_id + 1
-            
-            # Форматируем сообщение
-            formatted_message = message_formatter.format_message(message_text)
-            
-            # Создаем объект сообщения
-            message_data = MessageCreate(
-                message=message_text,
-                formatted_message=formatted_message,
-                message_id=new_message_id
-            )
-            
-            # Сохраняем в базу данных
-            saved_message = db_manager.create_message(message_data)
-            
-            # Отправляем через WebSocket
-            await connection_manager.broadcast({
-                "id": saved_message.message_id,
-                "formatted": saved_message.formatted_message,
-                "raw": saved_message.message,
-                "timestamp": saved_message.timestamp.isoformat()
-            })
-            
-            print(f"✅ Сообщение #{new_message_id} обработано")
+    async def consume_replicas(self):
+        """Получать копии сохраненных сообщений через эксклюзивную очередь
+        воркера и рассылать их своим клиентам по порядку.
+        
+        При потере канала очередь копий объявляется и привязывается
+        заново через DELIVERY_RETRY_SECONDS, пока соединение не закрыто.
+        """
+        while self.connection is not None and not self.connection.is_closed:
+            try:
+                await self._consume_replicas()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка получения копий сообщений, повтор через "
+                      f"{config.DELIVERY_RETRY_SECONDS} с: {e}")
+                MESSAGE_FAILURES.inc(1, "replica")
+                await asyncio.sleep(config.DELIVERY_RETRY_SECONDS)
+    
+    async def _consume_replicas(self):
+        if self.replica_channel is None or self.replica_channel.is_closed:
+            self.replica_channel = await self.connection.channel()
+            await self.replica_channel.set_qos(prefetch_count=config.RABBITMQ_PREFETCH_COUNT)
+        queue = await self.replica_channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(self.fanout_exchange, routing_key="")
+        
+        incoming: asyncio.Queue = asyncio.Queue()
+        await queue.consume(incoming.put)
+        
+        channel = self.replica_channel
+        while True:
+            try:
+                message = await asyncio.wait_for(incoming.get(), config.DELIVERY_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                # Закрытый канал больше ничего не доставит
+                if channel.is_closed:
+                    raise ConnectionError("канал копий закрыт")
+                continue
+            try:
+                data = json.loads(message.body)
+                messages = [Message.model_validate(item) for item in data["messages"]]
+                if not messages:
+                    raise ValueError("пустая копия")
+            except Exception as e:
+                # Повтор не поможет: копия отбрасывается, следующие идут дальше
+                print(f"❌ Некорректная копия сообщений: {e}")
+                MESSAGE_FAILURES.inc(1, "replica")
+                await message.reject(requeue=False)
+                continue
             
-        except Exception as e:
-            print(f"❌ Ошибка обработки сообщения: {e}")
+            # Повтор на месте, а не возврат в очередь: копии идут по порядку ID
+            while True:
+                try:
+                    await message_service.deliver(messages, replica=True)
+                    break
+                except Exception as e:
+                    print(f"⚠️ Не удалось доставить копии #{messages[0].message_id}-"
+                          f"#{messages[-1].message_id}, повтор через "
+                          f"{config.DELIVERY_RETRY_SECONDS} с: {e}")
+                    MESSAGE_FAILURES.inc(1, "delivery")
+                    await asyncio.sleep(config.DELIVERY_RETRY_SECONDS)
+            await message.ack()
     
-    async def publish_message(self, message: str) -> bool:
-        """Опубликовать сообщение в RabbitMQ"""
-        if not self.is_connected or not self.channel:
-            return False
+    async def publish_replicas(self, messages: List[Message]):
+        """Разослать сохраненные сообщения всем воркерам"""
+        body = json.dumps({"messages": [msg.model_dump(mode="json") for msg in messages]})
+        await self.fanout_exchange.publish(
+            aio_pika.Message(
+                body=body.encode(),
+                content_type="application/json",
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            ),
+            routing_key=""
+        )
+    
+    async def _collect_batch(self, incoming: asyncio.Queue) -> List[aio_pika.IncomingMessage]:
+        """Собрать пачку: ждем первое сообщение, затем добираем до
+        RABBITMQ_BATCH_SIZE, но не дольше RABBITMQ_BATCH_LINGER_MS"""
+        batch = [await incoming.get()]
         
-        try:
-            await self.channel.default_exchange.publish(
-                aio_pika.Message(body=message.encode()),
-                routing_key=config.RABBITMQ_QUEUE
-            )
-            return True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.RABBITMQ_BATCH_LINGER_MS / 1000
+        
+        while len(batch) < config.RABBITMQ_BATCH_SIZE:
+            if not incoming.empty():
+                batch.append(incoming.get_nowait())
+                continue
             
-        except Exception as e:
-            print(f"❌ Ошибка публикации в RabbitMQ: {e}")
-            return False
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(incoming.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        return batch
+    
+    def _receive(self, batch: List[aio_pika.IncomingMessage]):
+        """Тексты и каналы сообщений пачки"""
+        MESSAGES_RECEIVED.inc(len(batch), "amqp")
+        AMQP_BATCH_SIZE.observe(len(batch))
+        
+        with MESSAGE_STAGE_SECONDS.time("receive"):
+            message_texts = [message.body.decode(errors="replace") for message in batch]
+            channels = [self.get_channel(message) for message in batch]
+        return message_texts, channels
+    
+    async def submit_batch(self, batch: List[aio_pika.IncomingMessage]):
+        """Передать пачку в конвейер приема; ждет места в его очереди"""
+        received = time.perf_counter()
+        message_texts, channels = self._receive(batch)
+        
+        async def settle(formatted_messages: List[Optional[str]]):
+            await self._settle_batch(batch, formatted_messages)
+        
+        await ingest_pipeline.submit(PipelineBatch(message_texts, channels, settle, received))
+    
+    async def process_batch(self, batch: List[aio_pika.IncomingMessage]):
+        """Сохранить пачку одной транзакцией и подтвердить одним ack
+        (без конвейера, PIPELINE_ENABLED=false)."""
+        started = time.perf_counter()
+        message_texts, channels = self._receive(batch)
+        
+        saved_messages = await self._save_in_place(batch, message_texts, channels)
+        MESSAGE_PIPELINE_SECONDS.observe(time.perf_counter() - started)
+        if saved_messages:
+            print(f"✅ Сообщения #{saved_messages[0].message_id}-#{saved_messages[-1].message_id} обработаны")
+    
+    async def _save_in_place(self, batch: List[aio_pika.IncomingMessage],
+                             message_texts: List[str], channels: List[str]) -> List[Message]:
+        """Отформатировать, сохранить, разослать и подтвердить пачку, не
+        возвращая ее в очередь.
+        
+        В очереди пачку обогнали бы сообщения, уже полученные из нее
+        (prefetch), поэтому запись повторяется на месте, пока не пройдет,
+        а следующая пачка в это время не берется. Отклоняются без
+        возврата только непригодные сообщения - те, что не удалось
+        отформатировать.
+        """
+        with MESSAGE_STAGE_SECONDS.time("format"):
+            formatted_messages = message_service.format_messages(message_texts)
+        saved_messages = await message_service.persist_with_retry(
+            message_texts, formatted_messages, channels, render_cache.version
+        )
+        if saved_messages:
+            await message_service.publish(saved_messages)
+            self.last_message_id = saved_messages[-1].message_id
+        await self._settle_batch(batch, formatted_messages)
+        return saved_messages
+    
+    @staticmethod
+    async def _settle_batch(batch: List[aio_pika.IncomingMessage], formatted_messages: List[Optional[str]]):
+        """Подтвердить сохраненную пачку; непригодные сообщения
+        (formatted None) отклоняются без возврата в очередь"""
+        accepted = None
+        for message, formatted in zip(batch, formatted_messages):
+            if formatted is None:
+                await message.reject(requeue=False)
+            else:
+                accepted = message
+        if accepted is not None:
+            await accepted.ack(multiple=True)
+    
+    @staticmethod
+    def get_channel(message: aio_pika.IncomingMessage) -> str:
+        """Канал сообщения: заголовок, иначе routing key, если сообщение
+        пришло не через default exchange напрямую в очередь"""
+        channel = (message.headers or {}).get(config.RABBITMQ_CHANNEL_HEADER)
+        if isinstance(channel, bytes):
+            channel = channel.decode(errors="replace")
+        if channel:
+            return str(channel)
+        
+        if message.routing_key and message.routing_key != config.RABBITMQ_QUEUE:
+            return message.routing_key
+        return config.DEFAULT_CHANNEL
+    
+    async def publish_message(self, message: str, channel: Optional[str] = None) -> bool:
+        """Опубликовать сообщение во входящую очередь через буфер публикатора.
+        
+        True - сообщение принято в буфер, подтверждение брокера
+        публикатор дождется сам.
+        """
+        return message_publisher.publish(message, channel)
     
     async def close(self):
         """Закрыть соединение"""
+        if self._task is not None and not self.is_connected:
+            # Подключение еще не удалось - повторы больше не нужны
+            self._task.cancel()
+        await message_publisher.stop()
         if self.connection:
+            await ingest_pipeline.stop()
             await self.connection.close()
             self.is_connected = False
             print("🔌 Соединение с RabbitMQ закрыто")
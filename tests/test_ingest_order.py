@@ -0,0 +1,171 @@
+"""Порядок ID и доставки при приеме через брокер в памяти.
+
+Окружение задается до импорта приложения: config читает его при импорте.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+_data_dir = tempfile.mkdtemp(prefix="board-test-")
+os.environ.update(
+    DATABASE_URL=os.path.join(_data_dir, "messages.db"),
+    ARCHIVE_DIR=os.path.join(_data_dir, "archive"),
+    RABBITMQ_BROKER="memory",
+    PIPELINE_ENABLED="true",
+    HTTP_INGEST_VIA_BROKER="true",
+    RABBITMQ_BATCH_SIZE="5",
+    INGEST_RETRY_SECONDS="0.01",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from config import config
+from database.async_crud import async_db_manager
+from message_processing.message_service import message_service
+from message_processing.pipeline import ingest_pipeline
+from message_processing.render_cache import render_cache
+from rabbitmq_client.memory_broker import memory_broker
+from rabbitmq_client.publisher import message_publisher
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+def ingest(client: TestClient, texts: list, expected: list) -> list:
+    """Отправить сообщения через брокер и собрать то, что получит WebSocket клиент"""
+    after_id = client.get("/api/history").json()["after_id"] or 0
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_text(f"resume:{after_id}")
+        received = []
+        assert client.post("/api/messages/batch", json=texts).status_code == 200
+        while len(received) < len(expected):
+            frame = websocket.receive_json()
+            if frame.get("type") in (None, "batch", "replay"):
+                received.extend(frame["messages"] if "messages" in frame else [frame])
+
+    ids = [payload["id"] for payload in received]
+    assert ids == sorted(ids)
+    assert [payload["raw"] for payload in received] == expected
+
+    history = client.get(f"/api/history?after_id={after_id}&limit=100").json()["messages"]
+    assert [payload["raw"] for payload in history] == expected
+    return received
+
+def assert_broker_settled():
+    queue = memory_broker.queues["websocket_messages"]
+    assert queue.get_message_count() == 0
+    assert all(not channel._unacked for _, channel, _ in queue._consumers)
+
+def test_transient_failure_keeps_every_message(client, monkeypatch):
+    """Пачка с временной ошибкой записи сохраняется на месте: ни одно
+    сообщение не теряется, следующие пачки не получают меньшие ID"""
+    create_messages = async_db_manager.create_messages
+    failures = []
+
+    async def failing_create_messages(messages_data):
+        if len(failures) < 2 and any(data.message == "flaky" for data in messages_data):
+            failures.append(len(messages_data))
+            raise RuntimeError("database is locked")
+        return await create_messages(messages_data)
+
+    monkeypatch.setattr(async_db_manager, "create_messages", failing_create_messages)
+
+    texts = [f"ordered {i}" for i in range(40)]
+    texts[7] = "flaky"
+    ingest(client, texts, texts)
+    assert len(failures) == 2
+    assert_broker_settled()
+
+def test_poison_message_is_rejected(client, monkeypatch):
+    """Сообщение, которое не удается отформатировать, отклоняется, остальные
+    сообщения его пачки сохраняются по порядку"""
+    render = render_cache.render
+
+    def failing_render(text):
+        if text == "poison":
+            raise ValueError("formatter failure")
+        return render(text)
+
+    monkeypatch.setattr(render_cache, "render", failing_render)
+
+    texts = [f"poisoned batch {i}" for i in range(12)]
+    texts[6] = "poison"
+    ingest(client, texts, [text for text in texts if text != "poison"])
+    assert_broker_settled()
+
+def test_delivery_follows_id_order(client, monkeypatch):
+    """Диапазон, записанный раньше предыдущего, доставляется после него"""
+    create_messages = async_db_manager.create_messages
+
+    async def slow_create_messages(messages_data):
+        if messages_data[0].message == "slow":
+            await asyncio.sleep(0.2)
+        return await create_messages(messages_data)
+
+    delivered = []
+    deliver = message_service.deliver
+
+    async def recording_deliver(messages, replica=False):
+        delivered.extend(message.message_id for message in messages)
+        await deliver(messages, replica)
+
+    monkeypatch.setattr(async_db_manager, "create_messages", slow_create_messages)
+    monkeypatch.setattr(message_service, "deliver", recording_deliver)
+
+    async def save_concurrently():
+        return await asyncio.gather(
+            message_service.save_messages(["slow"]),
+            message_service.save_messages(["fast", "fast"]),
+        )
+
+    slow, fast = client.portal.call(save_concurrently)
+    assert slow[0].message_id < fast[0].message_id
+    assert delivered == [slow[0].message_id] + [message.message_id for message in fast]
+
+def test_full_pipeline_leaves_messages_in_broker(client, monkeypatch):
+    """Когда этапы конвейера заполнены, неподтвержденных сообщений не
+    больше его емкости (prefetch), остальные ждут в очереди брокера"""
+    create_messages = async_db_manager.create_messages
+    released = threading.Event()
+
+    async def blocked_create_messages(messages_data):
+        while not released.is_set():
+            await asyncio.sleep(0.01)
+        return await create_messages(messages_data)
+
+    monkeypatch.setattr(async_db_manager, "create_messages", blocked_create_messages)
+    after_id = client.get("/api/history").json()["after_id"] or 0
+    queue = memory_broker.queues["websocket_messages"]
+    channel = queue._consumers[0][1]
+    capacity = ingest_pipeline.capacity
+    assert channel.prefetch_count == capacity
+
+    total = capacity * 2
+    texts = [f"pressure {i}" for i in range(total)]
+    assert client.post("/api/messages/batch", json=texts).status_code == 200
+
+    deadline = time.monotonic() + 10
+    while message_publisher.buffered or ingest_pipeline.depths()[("persist",)] < config.PIPELINE_QUEUE_SIZE:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+    assert len(channel._unacked) == capacity
+    assert queue.get_message_count() == total - capacity
+    depths = ingest_pipeline.depths()
+    assert depths[("format",)] == depths[("persist",)] == config.PIPELINE_QUEUE_SIZE
+
+    released.set()
+    deadline = time.monotonic() + 10
+    while True:
+        history = client.get(f"/api/history?after_id={after_id}&limit={total}").json()["messages"]
+        if len(history) == total or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert [payload["raw"] for payload in history] == texts
+    assert_broker_settled()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Set, Tuple, Union
+from fastapi import WebSocket
+from monitoring.metrics import WEBSOCKET_SEND_SECONDS
+from .latency import LatencyStats
+from .payload_profile import DEFAULT_PROFILE, PayloadProfile
+
+# Политики переполнения очереди клиента
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Кадр в очереди: текст (bytes для бинарных кадров) и диапазон ID
+# сообщений в нем (None для служебных)
+Frame = Tuple[Union[str, bytes], Optional[int], Optional[int]]
+
+class ClientConnection:
+    """WebSocket клиент с собственной ограниченной очередью отправки.
+
+    Производители только кладут готовый текст в очередь и никогда не
+    ждут сокет; очередь разбирает отдельная задача-писатель. При
+    переполнении действует политика:
+      drop_oldest - выбросить самый старый кадр;
+      coalesce    - выбросить все ожидающие кадры, оставить последний;
+      disconnect  - пометить клиента на отключение.
+
+    Для возобновления после переподключения писатель можно приостановить
+    (pause), а затем отправить пропущенные сообщения первым кадром
+    (resume). Кадры с сообщениями не новее floor больше не отправляются,
+    так что повторов после догоняющего кадра не бывает.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str,
+                 on_error: Callable[["ClientConnection"], None]):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        self.websocket = websocket
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.channels: Set[str] = set()
+        self.profile: PayloadProfile = DEFAULT_PROFILE
+        self.evicted = False
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.send_latency = LatencyStats()
+        # Наименьший ID, уже ушедший клиенту через живую рассылку
+        self.first_sent_id: Optional[int] = None
+        self.floor = 0
+        self.paused = False
+        self._queue: Deque[Frame] = deque()
+        self._on_error = on_error
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить задачу-писатель"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def stop(self):
+        """Остановить задачу-писатель"""
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._queue.clear()
+
+    @property
+    def depth(self) -> int:
+        """Количество кадров в очереди"""
+        return len(self._queue)
+
+    def enqueue(self, data: Union[str, bytes], first_id: Optional[int] = None, last_id: Optional[int] = None) -> int:
+        """Поставить кадр в очередь, вернуть число выброшенных кадров"""
+        if self.evicted:
+            return 0
+        if last_id is not None and last_id <= self.floor:
+            return 0
+
+        dropped = 0
+        if len(self._queue) >= self.max_queue:
+            if self.policy == DISCONNECT:
+                self.evicted = True
+                return 0
+            if self.policy == COALESCE:
+                dropped = len(self._queue)
+                self._queue.clear()
+            else:
+                self._queue.popleft()
+                dropped = 1
+            self.dropped += dropped
+
+        self._queue.append((data, first_id, last_id))
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return dropped
+
+    def pause(self):
+        """Приостановить отправку, кадры продолжают копиться в очереди"""
+        self.paused = True
+
+    def resume(self, data: Union[str, bytes], floor: int):
+        """Отправить data первым кадром и продолжить живую доставку,
+        выбросив из очереди кадры с сообщениями не новее floor"""
+        self.floor = max(self.floor, floor)
+        queue: Deque[Frame] = deque(
+            frame for frame in self._queue if frame[2] is None or frame[2] > self.floor
+        )
+        queue.appendleft((data, None, None))
+        self._queue = queue
+        self.paused = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _writer(self):
+        """Отправлять кадры из очереди по одному"""
+        try:
+            while True:
+                if not self._queue or self.paused:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                data, first_id, _ = self._queue.popleft()
+                if first_id is not None and self.first_sent_id is None:
+                    self.first_sent_id = first_id
+                started = time.perf_counter()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                elapsed = time.perf_counter() - started
+                self.send_latency.observe(elapsed)
+                WEBSOCKET_SEND_SECONDS.observe(elapsed)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._on_error(self)
+
+    def get_stats(self) -> dict:
+        """Статистика клиента"""
+        return {
+            "client": f"{self.websocket.client.host}:{self.websocket.client.port}" if self.websocket.client else None,
+            "channels": sorted(self.channels),
+            "profile": self.profile.describe(),
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "send_latency": self.send_latency.get_stats()
+        }
@@ -1,78 +1,266 @@
 import asyncio
 import json
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from fastapi import WebSocket
+from config import config
+from monitoring.metrics import WEBSOCKET_EVENTS
+from .client_connection import OVERFLOW_POLICIES, ClientConnection, Frame
+from .latency import LatencyStats
+from .payload_profile import DEFAULT_PROFILE, PayloadProfile, frame_id_range
+
+class Broadcast:
+    """Кадры одной рассылки, сериализуемые не более одного раза на профиль.
+
+    message - кадр для клиентов без подписок, channel_messages - кадры
+    для подписчиков каждого канала. Объект могут разделять шарды:
+    повторная сериализация при гонке потоков безвредна.
+    """
+
+    def __init__(self, message: dict, channel_messages: Optional[Dict[str, dict]] = None):
+        self.message = message
+        self.channel_messages = channel_messages or {}
+        self._frames: Dict[Tuple[Optional[str], PayloadProfile], Frame] = {}
+
+    def frame(self, profile: PayloadProfile, channel: Optional[str] = None) -> Frame:
+        """Кадр для профиля (и канала, если указан)"""
+        key = (channel, profile)
+        frame = self._frames.get(key)
+        if frame is None:
+            message = self.message if channel is None else self.channel_messages[channel]
+            if channel is not None and message is self.message:
+                frame = self.frame(profile)
+            else:
+                frame = (profile.encode_frame(message), *frame_id_range(message))
+            self._frames[key] = frame
+        return frame
 
 class ConnectionManager:
-    """Менеджер WebSocket соединений"""
-    
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscriptions: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket):
+    """Менеджер WebSocket соединений
+
+    Рассылка не ждет сокеты: кадр сериализуется один раз на профиль
+    выдачи и кладется в очереди клиентов, которые разбирают их собственные задачи-писатели.
+    Клиенты без подписок получают весь поток, подписанные - только
+    сообщения своих каналов.
+    """
+
+    def __init__(self, max_queue: int = config.WEBSOCKET_QUEUE_SIZE,
+                 overflow_policy: str = config.WEBSOCKET_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow_policy}")
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscriptions: Dict[str, Set[WebSocket]] = {}
+        # Клиенты без подписок
+        self.firehose: Set[WebSocket] = set()
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.dropped_total = 0
+        self.evicted_total = 0
+
+    async def connect(self, websocket: WebSocket, profile: PayloadProfile = DEFAULT_PROFILE):
         """Подключить нового клиента"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-    
+        client = ClientConnection(websocket, self.max_queue, self.overflow_policy, self._on_send_error)
+        client.profile = profile
+        self.active_connections[websocket] = client
+        self.firehose.add(websocket)
+        client.start()
+        WEBSOCKET_EVENTS.inc(1, "connected")
+
     def disconnect(self, websocket: WebSocket):
         """Отключить клиента"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        client.stop()
+        self.firehose.discard(websocket)
+        WEBSOCKET_EVENTS.inc(1, "disconnected")
+
         # Удаляем из подписок
-        for channel in list(self.subscriptions.keys()):
-            if websocket in self.subscriptions[channel]:
-                self.subscriptions[channel].remove(websocket)
-    
+        for channel in client.channels:
+            self._remove_subscriber(channel, websocket)
+
+    def _remove_subscriber(self, channel: str, websocket: WebSocket):
+        subscribers = self.subscriptions.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(websocket)
+        if not subscribers:
+            del self.subscriptions[channel]
+
+    def _on_send_error(self, client: ClientConnection):
+        """Сокет клиента сломан - отключаем"""
+        self.disconnect(client.websocket)
+
+    def _evict(self, client: ClientConnection):
+        """Отключить клиента, не успевающего читать"""
+        self.evicted_total += 1
+        WEBSOCKET_EVENTS.inc(1, "evicted")
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            # 1013: Try Again Later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _enqueue_frames(self, connections: Iterable[WebSocket],
+                        frame_for: Callable[[ClientConnection], Frame]):
+        """Поставить кадры в очереди клиентов"""
+        evicted: List[ClientConnection] = []
+
+        for websocket in connections:
+            client = self.active_connections.get(websocket)
+            if client is None:
+                continue
+            self.dropped_total += client.enqueue(*frame_for(client))
+            if client.evicted:
+                evicted.append(client)
+
+        for client in evicted:
+            self._evict(client)
+
+    def _enqueue(self, connections: Iterable[WebSocket], data: str,
+                 first_id: Optional[int] = None, last_id: Optional[int] = None):
+        """Поставить готовый текст в очереди клиентов"""
+        frame = (data, first_id, last_id)
+        self._enqueue_frames(connections, lambda client: frame)
+
+    def _enqueue_broadcast(self, connections: Iterable[WebSocket], broadcast: Broadcast,
+                           channel: Optional[str] = None):
+        """Поставить кадры рассылки в очереди клиентов по их профилям"""
+        self._enqueue_frames(connections, lambda client: broadcast.frame(client.profile, channel))
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Отправить личное сообщение клиенту"""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except:
-            self.disconnect(websocket)
-    
+        self._enqueue((websocket,), json.dumps(message))
+
     async def broadcast(self, message: dict):
         """Отправить сообщение всем подключенным клиентам"""
-        disconnected = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                disconnected.append(connection)
-        
-        # Удаляем отключенных клиентов
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+        if self.active_connections:
+            self._enqueue_broadcast(self.active_connections, Broadcast(message))
+
     async def subscribe_to_channel(self, channel: str, websocket: WebSocket):
         """Подписать клиента на канал"""
-        if channel not in self.subscriptions:
-            self.subscriptions[channel] = []
-        
-        if websocket not in self.subscriptions[channel]:
-            self.subscriptions[channel].append(websocket)
-    
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+
+        client.channels.add(channel)
+        self.subscriptions.setdefault(channel, set()).add(websocket)
+        self.firehose.discard(websocket)
+
+    async def unsubscribe_from_channel(self, channel: str, websocket: WebSocket):
+        """Отписать клиента от канала"""
+        client = self.active_connections.get(websocket)
+        if client is None or channel not in client.channels:
+            return
+
+        client.channels.discard(channel)
+        self._remove_subscriber(channel, websocket)
+        if not client.channels:
+            self.firehose.add(websocket)
+
     async def broadcast_to_channel(self, channel: str, message: dict):
         """Отправить сообщение в канал"""
-        if channel in self.subscriptions:
-            disconnected = []
-            
-            for connection in self.subscriptions[channel]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    disconnected.append(connection)
-            
-            # Удаляем отключенных клиентов
-            for connection in disconnected:
-                if connection in self.subscriptions[channel]:
-                    self.subscriptions[channel].remove(connection)
-    
+        subscribers = self.subscriptions.get(channel)
+        if subscribers:
+            self._enqueue_broadcast(subscribers, Broadcast(message))
+
+    async def publish(self, message: dict, channel_messages: Dict[str, dict]):
+        """Разослать сообщения с маршрутизацией по каналам.
+
+        message - кадр со всеми сообщениями для клиентов без подписок,
+        channel_messages - кадры для подписчиков каждого канала.
+        """
+        if self.active_connections:
+            self.publish_broadcast(Broadcast(message, channel_messages))
+
+    def publish_broadcast(self, broadcast: Broadcast):
+        """Разослать подготовленную рассылку"""
+        if self.firehose:
+            self._enqueue_broadcast(self.firehose, broadcast)
+
+        for channel in broadcast.channel_messages:
+            subscribers = self.subscriptions.get(channel)
+            if subscribers:
+                self._enqueue_broadcast(subscribers, broadcast, channel)
+
+    def set_profile(self, websocket: WebSocket, profile: PayloadProfile):
+        """Сменить профиль выдачи клиента для следующих кадров"""
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            client.profile = profile
+
+    def pause(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        """Приостановить живую доставку клиенту на время догоняющего запроса"""
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            client.pause()
+        return client
+
+    def resume(self, websocket: WebSocket, last_id: int, payloads: List[dict],
+               truncated_at: Optional[int] = None):
+        """Отправить пропущенные сообщения одним кадром replay и
+        вернуть клиента к живой доставке без пропусков и повторов.
+
+        payloads - сообщения с ID больше last_id по возрастанию; те,
+        что уже ушли клиенту живой рассылкой, отбрасываются. truncated_at -
+        выборка обрезана на этом ID: кадр получает has_more и last_id =
+        truncated_at, остаток клиент дочитывает через /api/history.
+        """
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+
+        if client.first_sent_id is not None:
+            if truncated_at is not None and truncated_at >= client.first_sent_id - 1:
+                # Выборка дошла до живой рассылки - пропусков нет
+                truncated_at = None
+            payloads = [p for p in payloads if p["id"] < client.first_sent_id]
+        floor = max(last_id, payloads[-1]["id"]) if payloads else last_id
+        if truncated_at is not None:
+            floor = max(floor, truncated_at)
+
+        client.resume(client.profile.encode_frame({
+            "type": "replay",
+            "messages": payloads,
+            "last_id": floor,
+            "has_more": truncated_at is not None
+        }), floor)
+
+    def abort_resume(self, websocket: WebSocket, detail: str):
+        """Вернуть клиента к живой доставке, сообщив об ошибке догоняющей выборки"""
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            client.resume(json.dumps({"type": "error", "detail": detail}), 0)
+
     def get_active_count(self) -> int:
         """Получить количество активных соединений"""
         return len(self.active_connections)
 
+    def get_stats(self) -> dict:
+        """Сводная статистика очередей отправки"""
+        depths = [client.depth for client in self.active_connections.values()]
+        send_latency = LatencyStats()
+        for client in self.active_connections.values():
+            send_latency.merge(client.send_latency)
+        return {
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_limit": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "dropped": self.dropped_total,
+            "evicted": self.evicted_total,
+            "send_latency": send_latency.get_stats()
+        }
+
+    def get_client_stats(self) -> List[dict]:
+        """Статистика по каждому клиенту"""
+        return [client.get_stats() for client in self.active_connections.values()]
+
 # Глобальный менеджер соединений
-connection_manager = ConnectionManager()
\ No newline at end of file
+connection_manager = ConnectionManager()
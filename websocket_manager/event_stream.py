@@ -0,0 +1,56 @@
+import asyncio
+from typing import AsyncIterator, Optional, Union
+from starlette.requests import Request
+from .payload_profile import sse_event
+
+class EventStream:
+    """Транспорт Server-Sent Events с интерфейсом WebSocket для ConnectionManager.
+
+    Менеджер соединений и очередь клиента работают с ним как с сокетом:
+    кадры рассылки, уже закодированные профилем SSE, передаются как есть,
+    служебные JSON кадры оборачиваются в событие без id. events() отдает
+    их в тело StreamingResponse; очередь на один кадр передает
+    медленное чтение клиента в его очередь отправки, где действует
+    обычная политика переполнения.
+    """
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.client = request.client
+        self.headers = request.headers
+        self.query_params = request.query_params
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        if not data.endswith("\n\n"):
+            data = sse_event(data)
+        await self._queue.put(data)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data.decode())
+
+    async def close(self, code: int = 1000):
+        # Пустой кадр завершает поток; недоставленный кадр уже не нужен
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def events(self, retry_ms: int, keepalive: float) -> AsyncIterator[Union[str, bytes]]:
+        """Тело ответа text/event-stream.
+
+        retry - задержка переподключения EventSource, комментарии
+        keepalive не дают прокси закрыть простаивающее соединение.
+        """
+        yield f"retry: {retry_ms}\n\n"
+        while True:
+            try:
+                data: Optional[str] = await asyncio.wait_for(self._queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if data is None:
+                return
+            yield data
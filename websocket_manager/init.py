@@ -1,3 +1,17 @@
-from .connection_manager import ConnectionManager, connection_manager
+from .client_connection import ClientConnection
+from .connection_manager import Broadcast, ConnectionManager, connection_manager
+from .event_stream import EventStream
+from .latency import LatencyStats
+from .message_notifier import MessageNotifier, message_notifier
+from .payload_profile import DEFAULT_PROFILE, PayloadProfile
+from .shards import WebSocketShard, WebSocketShards, websocket_shards
 
-__all__ = ["ConnectionManager", "connection_manager"]
\ No newline at end of file
+__all__ = [
+    "ClientConnection",
+    "Broadcast", "ConnectionManager", "connection_manager",
+    "EventStream",
+    "LatencyStats",
+    "MessageNotifier", "message_notifier",
+    "PayloadProfile", "DEFAULT_PROFILE",
+    "WebSocketShard", "WebSocketShards", "websocket_shards",
+]
\ No newline at end of file
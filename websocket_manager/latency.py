@@ -0,0 +1,29 @@
+class LatencyStats:
+    """Счетчик задержек: количество, среднее и максимум"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """Учесть одну задержку в секундах"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "LatencyStats"):
+        """Добавить счетчики другого экземпляра"""
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def get_stats(self) -> dict:
+        """Статистика в миллисекундах"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3)
+        }
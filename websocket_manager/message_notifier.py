@@ -0,0 +1,66 @@
+import asyncio
+from typing import Dict, Optional, Set
+
+class MessageNotifier:
+    """Уведомление ожидающих long polling клиентов о новых сообщениях"""
+
+    def __init__(self):
+        self.last_id = 0
+        # Последние ID по каналам, известные с момента запуска
+        self.channel_last_ids: Dict[str, int] = {}
+        self._waiters: Set[asyncio.Future] = set()
+
+    def get_last_id(self, channel: Optional[str] = None) -> int:
+        """Последний ID всего потока или канала"""
+        if channel is None:
+            return self.last_id
+        return self.channel_last_ids.get(channel, 0)
+
+    def notify(self, message_id: int, channel_ids: Optional[Dict[str, int]] = None):
+        """Сообщить о сохранении новых сообщений.
+
+        message_id - последний ID всего потока, channel_ids - последний
+        ID каждого канала, в который пришли сообщения.
+        """
+        if message_id > self.last_id:
+            self.last_id = message_id
+        for channel, channel_id in (channel_ids or {}).items():
+            if channel_id > self.channel_last_ids.get(channel, 0):
+                self.channel_last_ids[channel] = channel_id
+
+        # Будим всех ожидающих, каждый сам проверит свой last_id
+        waiters, self._waiters = self._waiters, set()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_messages(self, last_id: int, timeout: float, channel: Optional[str] = None) -> bool:
+        """Ждать появления сообщения с ID больше last_id (в канале, если указан).
+
+        Возвращает False, если за timeout секунд ничего не появилось.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while self.get_last_id(channel) <= last_id:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+
+            waiter = loop.create_future()
+            self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self._waiters.discard(waiter)
+
+        return True
+
+    def get_waiting_count(self) -> int:
+        """Получить количество ожидающих клиентов"""
+        return len(self._waiters)
+
+# Глобальный нотификатор сообщений
+message_notifier = MessageNotifier()
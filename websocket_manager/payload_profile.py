@@ -0,0 +1,117 @@
+import json
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack не установлен - доступен только JSON
+    msgpack = None
+
+# Поля сообщения в порядке выдачи
+PAYLOAD_FIELDS = ("id", "formatted", "raw", "channel", "timestamp")
+
+JSON = "json"
+MSGPACK = "msgpack"
+FORMATS = (JSON, MSGPACK)
+# Кадры Server-Sent Events: JSON в поле data, ID последнего сообщения в
+# поле id. Профиль создает только /api/stream, клиенты его не выбирают.
+SSE = "sse"
+
+def frame_id_range(message: dict) -> Tuple[Optional[int], Optional[int]]:
+    """Диапазон ID сообщений в кадре (одиночном или batch)"""
+    if "id" in message:
+        return message["id"], message["id"]
+    messages = message.get("messages")
+    if messages:
+        return messages[0]["id"], messages[-1]["id"]
+    return None, None
+
+def sse_event(data: str, event_id: Optional[int] = None) -> str:
+    """Событие text/event-stream; data - одна строка JSON"""
+    if event_id is None:
+        return f"data: {data}\n\n"
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+class PayloadProfile(NamedTuple):
+    """Профиль выдачи сообщений клиенту: набор полей и кодировка.
+
+    Кадры с сообщениями кодируются по профилю (msgpack - бинарными
+    кадрами), служебные кадры (pong, subscribed, error) всегда JSON.
+    """
+
+    fields: Tuple[str, ...] = PAYLOAD_FIELDS
+    format: str = JSON
+
+    @classmethod
+    def parse(cls, fields: Optional[Union[str, Sequence[str]]] = None,
+              format: Optional[str] = None) -> "PayloadProfile":
+        """Профиль из параметров клиента; ValueError при неверных значениях"""
+        if fields is None or fields == "":
+            selected = PAYLOAD_FIELDS
+        else:
+            if isinstance(fields, str):
+                requested = fields.split(",")
+            elif isinstance(fields, (list, tuple)) and all(isinstance(field, str) for field in fields):
+                requested = fields
+            else:
+                raise ValueError("fields must be a string or a list of strings")
+            requested = {field.strip() for field in requested if field.strip()}
+            unknown = requested - set(PAYLOAD_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            # id нужен для порядка и возобновления
+            requested.add("id")
+            selected = tuple(field for field in PAYLOAD_FIELDS if field in requested)
+
+        if format is not None and not isinstance(format, str):
+            raise ValueError("format must be a string")
+        format = (format or JSON).lower()
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        if format == MSGPACK and msgpack is None:
+            raise ValueError("msgpack is not available on this server")
+
+        return cls(selected, format)
+
+    @property
+    def is_binary(self) -> bool:
+        return self.format == MSGPACK
+
+    @property
+    def media_type(self) -> str:
+        return "application/x-msgpack" if self.is_binary else "application/json"
+
+    def project(self, payload: dict) -> dict:
+        """Оставить в сообщении только поля профиля"""
+        if self.fields == PAYLOAD_FIELDS:
+            return payload
+        return {field: payload[field] for field in self.fields if field in payload}
+
+    def project_frame(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Применить профиль к кадру: одиночному сообщению или кадру со списком messages"""
+        if self.fields == PAYLOAD_FIELDS:
+            return frame
+        if "id" in frame:
+            return self.project(frame)
+        if "messages" in frame:
+            return {**frame, "messages": [self.project(payload) for payload in frame["messages"]]}
+        return frame
+
+    def dumps(self, data: Any) -> Union[str, bytes]:
+        """Сериализовать данные в кодировке профиля"""
+        if self.is_binary:
+            return msgpack.packb(data, use_bin_type=True)
+        return json.dumps(data)
+
+    def encode_frame(self, frame: Dict[str, Any]) -> Union[str, bytes]:
+        """Применить профиль к кадру и сериализовать его"""
+        if self.format == SSE:
+            # id события - последний ID в кадре, по нему клиент возобновит поток
+            event_id = frame.get("last_id", frame_id_range(frame)[1])
+            return sse_event(json.dumps(self.project_frame(frame)), event_id)
+        return self.dumps(self.project_frame(frame))
+
+    def describe(self) -> dict:
+        return {"fields": list(self.fields), "format": self.format}
+
+# Профиль по умолчанию: все поля, JSON
+DEFAULT_PROFILE = PayloadProfile()
@@ -0,0 +1,156 @@
+import asyncio
+import socket
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+import uvicorn
+from config import config
+from .connection_manager import Broadcast, ConnectionManager
+from .latency import LatencyStats
+
+T = TypeVar("T")
+
+class WebSocketShard:
+    """Поток со своим event loop, uvicorn сервером и ConnectionManager"""
+
+    def __init__(self, index: int, app: Any, sock: socket.socket, local: threading.local):
+        self.index = index
+        self.manager = ConnectionManager()
+        self.handoff_latency = LatencyStats()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, lifespan="off", log_level="warning",
+            ws_per_message_deflate=config.WEBSOCKET_PER_MESSAGE_DEFLATE
+        ))
+        self._socket = sock
+        self._local = local
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ws-shard-{index}", daemon=True)
+
+    def start(self):
+        """Запустить поток шарда и дождаться его event loop"""
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._local.shard = self
+        self._started.set()
+        try:
+            self.loop.run_until_complete(self._server.serve(sockets=[self._socket]))
+        finally:
+            self.loop.close()
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить сервер шарда"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(setattr, self._server, "should_exit", True)
+        self._thread.join(timeout)
+
+    def deliver(self, broadcast: Broadcast, handed_at: float):
+        """Принять рассылку в потоке шарда"""
+        self.handoff_latency.observe(time.perf_counter() - handed_at)
+        self.manager.publish_broadcast(broadcast)
+
+    async def _collect_stats(self) -> dict:
+        stats = self.manager.get_stats()
+        return {
+            "shard": self.index,
+            "connections": stats["connections"],
+            "queued": stats["queued"],
+            "dropped": stats["dropped"],
+            "evicted": stats["evicted"],
+            "handoff_latency": self.handoff_latency.get_stats(),
+            "send_latency": stats["send_latency"]
+        }
+
+class WebSocketShards:
+    """Распределение WebSocket соединений по нескольким event loop.
+
+    Каждый шард слушает WEBSOCKET_SHARD_PORT (через SO_REUSEPORT ядро
+    раздает новые соединения между шардами) и держит своих клиентов в
+    своем ConnectionManager. Рассылка передается каждому шарду через
+    call_soon_threadsafe, без общих блокировок; кадры сериализуются
+    один раз на профиль и общие для всех шардов. Кэш и база остаются в основном loop: запросы шардов
+    выполняются там через run_in_main.
+    """
+
+    def __init__(self):
+        self.shards: List[WebSocketShard] = []
+        self.main_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shards)
+
+    @staticmethod
+    def _listen(host: str, port: int, reuse_port: bool) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(2048)
+        sock.setblocking(False)
+        return sock
+
+    def start(self, app: Any, count: int = config.WEBSOCKET_SHARDS,
+              host: str = config.WEBSOCKET_HOST, port: int = config.WEBSOCKET_SHARD_PORT):
+        """Запустить count шардов, обслуживающих app"""
+        self.main_loop = asyncio.get_running_loop()
+
+        # Без SO_REUSEPORT шарды принимают соединения с общего сокета
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+        shared = None if reuse_port else self._listen(host, port, False)
+
+        for index in range(count):
+            sock = self._listen(host, port, True) if reuse_port else shared
+            shard = WebSocketShard(index, app, sock, self._local)
+            shard.start()
+            self.shards.append(shard)
+
+        print(f"🧩 WebSocket шардов: {count}, порт {port}")
+
+    def stop(self):
+        """Остановить все шарды"""
+        for shard in self.shards:
+            shard.stop()
+        self.shards = []
+
+    def current(self) -> Optional[WebSocketShard]:
+        """Шард текущего потока"""
+        return getattr(self._local, "shard", None)
+
+    def publish(self, message: dict, channel_messages: Dict[str, dict]):
+        """Передать рассылку всем шардам; кадры сериализуются один раз
+        на профиль и общие для всех шардов"""
+        if not self.shards:
+            return
+
+        broadcast = Broadcast(message, channel_messages)
+        handed_at = time.perf_counter()
+        for shard in self.shards:
+            shard.loop.call_soon_threadsafe(shard.deliver, broadcast, handed_at)
+
+    async def run_in_main(self, coro: Awaitable[T]) -> T:
+        """Выполнить корутину в основном loop и дождаться результата"""
+        if self.main_loop is None or self.current() is None:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.main_loop))
+
+    def get_active_count(self) -> int:
+        """Количество соединений во всех шардах"""
+        return sum(len(shard.manager.active_connections) for shard in self.shards)
+
+    async def get_stats(self) -> List[dict]:
+        """Статистика по каждому шарду"""
+        futures = [
+            asyncio.wrap_future(asyncio.run_coroutine_threadsafe(shard._collect_stats(), shard.loop))
+            for shard in self.shards
+        ]
+        return list(await asyncio.gather(*futures))
+
+# Глобальный набор WebSocket шардов
+websocket_shards = WebSocketShards()